@@ -9,6 +9,7 @@
 from src.factors.factor import Factor
 import src.factors.cons as factor_ct
 from src.util.utils import Utils, SecuTradingStatus
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import CDataHandler
 # from src.factors.Scale import Scale
 # from src.factors.Value import Value
@@ -20,10 +21,7 @@ import numpy as np
 from pandas import DataFrame
 from pandas import Series
 import statsmodels.api as sm
-import datetime
 import logging
-from multiprocessing import Pool, Manager
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -105,20 +103,20 @@ class APM(Factor):
         R_am_array = np.zeros((cls.__days, 1))
         R_pm_array = np.zeros((cls.__days, 1))
         k = 0
+        # 开盘价为09:31分钟线的开盘价，中午收盘价为11:30分钟线的收盘价，当天收盘价为15:00分钟线的收盘价
+        checkpoints = ['p0930', 'p1130', 'p1500']
         for trading_day in trading_days:
-            df_1min_data = Utils.get_min_mkt(Utils.code_to_symbol(code), trading_day, fq=True)
-            if df_1min_data is not None:
-                str_date = Utils.datetimelike_to_str(trading_day)
-                fopen = df_1min_data[df_1min_data.datetime == '%s 09:31:00' % str_date].iloc[0].open
-                fmid_close = df_1min_data[df_1min_data.datetime == '%s 11:30:00' % str_date].iloc[0].close
-                fclose = df_1min_data[df_1min_data.datetime == '%s 15:00:00' % str_date].iloc[0].close
+            secu_prices = Utils.get_checkpoint_prices(code, trading_day, checkpoints)
+            if secu_prices is not None:
+                index_prices = Utils.get_checkpoint_prices(factor_ct.APM_CT.index_code, trading_day, checkpoints, index=True)
+                # 缺少时点分钟线数据，返回None
+                if index_prices is None or np.isnan(secu_prices).any() or np.isnan(index_prices).any():
+                    return None
+                fopen, fmid_close, fclose = secu_prices
                 r_am_array[k, 0] = fmid_close / fopen - 1.0
                 r_pm_array[k, 0] = fclose / fmid_close - 1.0
 
-                df_1min_data = Utils.get_min_mkt(factor_ct.APM_CT.index_code, trading_day, index=True, fq=True)
-                fopen = df_1min_data[df_1min_data.datetime == '%s 09:31:00' % str_date].iloc[0].open
-                fmid_close = df_1min_data[df_1min_data.datetime == '%s 11:30:00' % str_date].iloc[0].close
-                fclose = df_1min_data[df_1min_data.datetime == '%s 15:00:00' % str_date].iloc[0].close
+                fopen, fmid_close, fclose = index_prices
                 R_am_array[k, 0] = fmid_close / fopen - 1.0
                 R_pm_array[k, 0] = fclose / fmid_close - 1.0
 
@@ -153,12 +151,97 @@ class APM(Factor):
         return stat
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_batch(cls, codes, calc_date):
+        """
+        批量计算指定日期、一组个股APM因子的stat统计量
+        计算方法与_calc_factor_loading一致: 每个个股取过去40个交易日中最近__days个有分钟行情的交易日,
+        交易日相同的个股的指数收益率回归自变量相同, 共用同一投影矩阵一次计算全部个股的残差和stat统计量
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表，如600000或SH600000
+        :param calc_date: datetime-like, str
+            因子载荷计算日期，格式YYYY-MM-DD
+        :return: pd.Series
+        --------
+            stat统计量，index为个股代码(如SH600000)，不包含计算失败的个股
+        """
+        # 1.取得过去40个交易日序列，交易日按降序排列
+        calc_date = Utils.to_date(calc_date)
+        trading_days = Utils.get_trading_days(end=calc_date, ndays=40, ascending=False)
+        # 2.取得个股及指数每个交易日的开盘价、中午收盘价和当天收盘价，计算上午收益率和下午收益率(交易日 × 个股)
+        checkpoints = ['p0930', 'p1130', 'p1500']
+        secu_prices, secu_has_data = Utils.get_checkpoint_price_panel(codes, trading_days, checkpoints)
+        index_prices, index_has_data = Utils.get_checkpoint_price_panel([factor_ct.APM_CT.index_code], trading_days,
+                                                                        checkpoints, index=True)
+        r_am_array = secu_prices[:, :, 1] / secu_prices[:, :, 0] - 1.0
+        r_pm_array = secu_prices[:, :, 2] / secu_prices[:, :, 1] - 1.0
+        R_am_array = index_prices[:, 0, 1] / index_prices[:, 0, 0] - 1.0
+        R_pm_array = index_prices[:, 0, 2] / index_prices[:, 0, 1] - 1.0
+        # 3.每个个股选取最近__days个有分钟行情的交易日，选中的交易日缺少时点分钟线数据的个股计算失败
+        selected = secu_has_data & (np.cumsum(secu_has_data, axis=0) <= cls.__days)
+        index_missing = ~index_has_data[:, 0] | np.isnan(index_prices[:, 0]).any(axis=1)
+        missing = np.isnan(secu_prices).any(axis=2) | index_missing[:, np.newaxis]
+        ok = (selected.sum(axis=0) == cls.__days) & ~(selected & missing).any(axis=0)
+        ok_cols = np.nonzero(ok)[0]
+        symbols = [Utils.code_to_symbol(code) for code in codes]
+        stats = Series(dtype=np.float64)
+        if len(ok_cols) == 0:
+            return stats
+        # 4.按选取的交易日对个股分组，每组个股对指数收益率进行线性回归：r_i = \alpha + \beta * R_i + \epsilon_i
+        _, group_ids = np.unique(np.packbits(selected[:, ok_cols].T, axis=1), axis=0, return_inverse=True)
+        group_ids = group_ids.reshape(-1)
+        stat_lst = []
+        for group_id in np.unique(group_ids):
+            cols = ok_cols[group_ids == group_id]
+            days = np.nonzero(selected[:, cols[0]])[0]
+            r_apm_array = np.concatenate((r_am_array[days][:, cols], r_pm_array[days][:, cols]), axis=0)
+            R_apm_array = sm.add_constant(np.concatenate((R_am_array[days], R_pm_array[days])))
+            resid_array = r_apm_array - R_apm_array.dot(np.linalg.pinv(R_apm_array).dot(r_apm_array))
+            # 5.计算stat统计量
+            delta_array = resid_array[:cls.__days] - resid_array[cls.__days:]   # 上午与下午的残差差值
+            delta_avg = np.mean(delta_array, axis=0)
+            delta_std = np.std(delta_array, axis=0)
+            # 残差差值的标准差接近于0的个股计算失败
+            valid = np.fabs(delta_std) >= 0.0001
+            stat_lst.append(Series(delta_avg[valid] / delta_std[valid] / np.sqrt(cls.__days),
+                                   index=[symbols[col] for col in cols[valid]]))
+        stats = pd.concat(stat_lst)
+        return stats[[symbol for symbol in symbols if symbol in stats.index]]
+
+    @classmethod
+    def _result_cache_params(cls):
+        return factor_ct.APM_CT
+
+    @classmethod
+    def _result_cache_inputs(cls, code, calc_date):
+        trading_days = Utils.get_trading_days(end=calc_date, ndays=40, ascending=False)
+        return (Utils.get_min_mkt_files(code, trading_days, fq=True, checkpoint=True) +
+                Utils.get_min_mkt_files(factor_ct.APM_CT.index_code, trading_days, index=True, fq=True) +
+                Utils.get_daily_mkt_files(code, fq=False) + Utils.get_daily_mkt_files(code, fq=True))
+
+    @classmethod
+    def _calc_factor_loading_proc(cls, code, calc_date):
+        """
+        用于并行计算因子载荷
+        Parameters
+        --------
+        :param code: str
+            个股代码，如600000或SH600000
+        :param calc_date: datetime-like
+            计算日期
+        :return: tuple(symbol, stat, ret20), 无法计算时返回None
+        """
         logging.info('[%s] Calc APM of %s.' % (calc_date.strftime('%Y-%m-%d'), code))
-        stat = cls._calc_factor_loading(code, calc_date)
-        ret20 = Utils.calc_interval_ret(code, end=calc_date, ndays=20)
+        stat = None
+        ret20 = None
+        try:
+            stat = cls._calc_factor_loading(code, calc_date)
+            ret20 = Utils.calc_interval_ret(code, end=calc_date, ndays=20)
+        except Exception as e:
+            print(e)
         if stat is not None and ret20 is not None:
-            q.put((Utils.code_to_symbol(code), stat, ret20))
+            return (Utils.code_to_symbol(code), stat, ret20)
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -173,6 +256,9 @@ class APM(Factor):
         :param month_end: bool，默认True
             只计算月末时点的因子载荷，该参数只在end_date不为None时有效，并且不论end_date是否为None，都会计算第一天的因子载荷
         :param save: 是否保存至因子数据库，默认为False
+        :param kwargs:
+            'batch': bool, 默认False
+                是否批量计算全部个股的stat统计量
         :return: 因子载荷，DataFrame
         --------
             因子载荷,DataFrame
@@ -189,7 +275,6 @@ class APM(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 2.遍历交易日序列，计算APM因子载荷
         dict_apm = None
         for calc_date in trading_days_series:
@@ -197,8 +282,7 @@ class APM(Factor):
             if month_end and (not Utils.is_month_end(calc_date)):
                 continue
             # 2.1.遍历个股，计算个股APM.stat统计量，过去20日收益率，分别放进stat_lst,ret20_lst列表中
-            s = (calc_date - datetime.timedelta(days=90)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 90)
             stat_lst = []
             ret20_lst = []
             symbol_lst = []
@@ -213,18 +297,23 @@ class APM(Factor):
             #         symbol_lst.append(Utils.code_to_symbol(stock_info.symbol))
             #         logging.info('APM of %s = %f' % (stock_info.symbol, stat_i))
 
-            # 采用多进程并行计算
-            q = Manager().Queue()
-            p = Pool(4)     # 最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-            p.close()
-            p.join()
-            while not q.empty():
-                apm_value = q.get(True)
-                symbol_lst.append(apm_value[0])
-                stat_lst.append(apm_value[1])
-                ret20_lst.append(apm_value[2])
+            if kwargs.get('batch', False):
+                # 批量计算stat统计量
+                stats = cls._calc_factor_loading_batch(list(stock_codes), calc_date)
+                # 批量计算过去20日收益率
+                ret20s = Utils.trailing_returns(list(stats.keys()), calc_date, 20)
+                for symbol, stat_i in stats.items():
+                    ret20_i = ret20s[symbol]
+                    if not np.isnan(ret20_i):
+                        symbol_lst.append(symbol)
+                        stat_lst.append(stat_i)
+                        ret20_lst.append(ret20_i)
+            else:
+                # 采用多进程并行计算
+                for apm_value in cls._parallel_calc(list(stock_codes), calc_date):
+                    symbol_lst.append(apm_value[0])
+                    stat_lst.append(apm_value[1])
+                    ret20_lst.append(apm_value[2])
 
             assert len(stat_lst) == len(ret20_lst)
             assert len(stat_lst) == len(symbol_lst)
@@ -270,9 +359,10 @@ class APM(Factor):
             pure_apm_db_file = os.path.join(factor_ct.FACTOR_DB.db_path, factor_ct.APM_CT.pure_apm_db_file)
             if save:
                 Utils.factor_loading_persistent(pure_apm_db_file, calc_date.strftime('%Y%m%d'), dict_pure_apm)
-            # 休息360秒
-            logging.info('Suspended for 360s.')
-            time.sleep(360)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
+        # 计算结果磁盘缓存超过大小上限时淘汰最久未使用的结果
+        cls._evict_result_cache()
         return dict_apm
 
     # @classmethod
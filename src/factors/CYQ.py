@@ -10,6 +10,10 @@
 from src.factors.factor import Factor
 import src.factors.cons as factor_ct
 from src.util.utils import Utils, SecuTradingStatus
+import src.util.cons as util_ct
+from src.util.packfile import PackFile
+from src.util.Cache import Cache
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import CDataHandler
 import pandas as pd
 from pandas import DataFrame, Series
@@ -19,10 +23,7 @@ from pathlib import Path
 import logging
 import datetime
 import calendar
-from multiprocessing import Pool, Manager
 import csv
-import statsmodels.api as sm
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -30,9 +31,9 @@ logging.basicConfig(level=logging.INFO,
 
 class CYQ(Factor):
     """筹码分布因子类"""
-    # __days = factor_ct.CYQ_CT.days_num      # 读取过去多少天的日K线行情数据进行因子载荷计算
+    __days = factor_ct.CYQ_CT.days_num      # 读取过去多少天的日K线行情数据进行因子载荷计算
     _db_file = os.path.join(factor_ct.FACTOR_DB.db_path, factor_ct.CYQ_CT.db_file)      # 因子对应的数据库文件名
-    # _db_proxies_path = os.path.join(factor_ct.FACTOR_DB.db_path, factor_ct.CYQ_CT.proxies_db_file)  # 筹码分布代理变量保存文件的路径
+    _db_proxies_path = os.path.join(factor_ct.FACTOR_DB.db_path, factor_ct.CYQ_CT.proxies_db_file)  # 筹码分布代理变量保存文件的路径
 
     @classmethod
     def _calc_factor_loading1(cls, code, calc_date):
@@ -60,46 +61,90 @@ class CYQ(Factor):
             return None
         if len(df_mkt) < 20:
             return None
-        # 按日期降序排列行情数据
-        df_mkt.sort_values(by='date', ascending=False, inplace=True)
-        # 遍历行情数据, 计算RC(相对资本收益)向量和ATR(调整换手率)向量
-        arr_rc = np.zeros(len(df_mkt))
-        arr_atr = np.zeros(len(df_mkt))
-        p_c = df_mkt.iloc[0]['close']   # 截止日期的收盘价
-        for j in range(len(df_mkt)):
-            p_avg = df_mkt.iloc[j]['amount'] / df_mkt.iloc[j]['vol'] * df_mkt.iloc[j]['factor']
-            arr_rc[j] = (p_c - p_avg) / p_c
-            tr_j = df_mkt.iloc[j]['turnover1']
-            if j == 0:
-                arr_atr[j] = tr_j
-            else:
-                arr_atr[j] = arr_atr[j-1] / pre_tr * tr_j * ( 1. - pre_tr)
-            pre_tr = tr_j
-        arc = np.average(arr_rc, weights=arr_atr)
-        if np.isnan(arc):
-            return None
-        rc_dev = arr_rc - arc
-        n = len(df_mkt)
-        vrc = n / (n-1.) * np.sum(arr_atr * rc_dev * rc_dev) / np.sum(arr_atr)
-        if np.isnan(vrc):
-            return None
-        src = n / (n-1.) * np.sum(arr_atr * np.float_power(rc_dev, 3)) / np.sum(arr_atr) / np.float_power(vrc, 1.5)
-        if np.isnan(src):
-            return None
-        krc = n / (n-1.) * np.sum(arr_atr * np.float_power(rc_dev, 4)) / np.sum(arr_atr) / np.float_power(vrc, 2)
-        if np.isnan(krc):
+        # 按日期降序排列行情数据, 计算RC(相对资本收益)向量和ATR(调整换手率)向量及四个代理变量
+        df_mkt = df_mkt.sort_values(by='date', ascending=False)
+        proxies = _cyq_proxies(*[np.array(df_mkt[field], dtype=np.float64).reshape((len(df_mkt), 1))
+                                 for field in ['close', 'amount', 'vol', 'factor', 'turnover1']])
+        arc, vrc, src, krc = [proxy[0] for proxy in proxies]
+        if np.isnan(arc) or np.isnan(vrc) or np.isnan(src) or np.isnan(krc):
             return None
         # 计算个股下一期的收益率
-        # next_date = calc_date + datetime.timedelta(days=1)
-        next_date = Utils.get_trading_days(start=calc_date, ndays=2)[1]
-        wday, month_range = calendar.monthrange(next_date.year, next_date.month)
-        date_end = datetime.datetime(next_date.year, next_date.month, month_range)
+        next_date, date_end = cls._next_period(calc_date)
         next_ret = Utils.calc_interval_ret(code, start=next_date, end=date_end)
         if next_ret is None:
             return None
         else:
             return pd.Series([arc, vrc, src, krc, next_ret], index=['arc', 'vrc', 'src', 'krc', 'next_ret'])
 
+    @classmethod
+    def _next_period(cls, calc_date):
+        """下一期(下个月)的开始日期(calc_date的下一个交易日)和结束日期(该交易日所在月份的最后一天)"""
+        # next_date = calc_date + datetime.timedelta(days=1)
+        next_date = Utils.get_trading_days(start=calc_date, ndays=2)[1]
+        wday, month_range = calendar.monthrange(next_date.year, next_date.month)
+        date_end = datetime.datetime(next_date.year, next_date.month, month_range)
+        return next_date, date_end
+
+    @classmethod
+    def _calc_factor_loading1_batch(cls, codes, calc_date, panel=None):
+        """
+        批量计算指定日期、一组个股筹码分布的四个代理变量以及下一期(下个月)的收益率
+        计算方法与_calc_factor_loading1一致, 各个股最近__days天的行情数据取自日行情面板数据, 一次计算全部个股的代理变量,
+        下一期的收益率通过Utils.interval_returns一次计算
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表, 如600000或SH600000
+        :param calc_date: datetime-like, str
+            计算日期, 格式YYYY-MM-DD
+        :param panel: DailyPanel, 默认None
+            个股的复权日行情面板数据(包含close, amount, vol, factor, turnover1), 须覆盖计算日期, 为None时读取
+        :return: tuple(pd.DataFrame, list)
+        --------
+            0. 个股筹码分布的代理变量, columns=['id', 'arc', 'vrc', 'src', 'krc', 'next_ret']
+            1. 面板数据内行情数据不足__days天的个股代码列表, 这些个股需逐个计算
+        """
+        calc_date = Utils.to_date(calc_date)
+        if panel is None:
+            panel = cls._load_panel(calc_date, calc_date)
+        symbols = np.array([Utils.code_to_symbol(code) for code in codes])
+        cols = panel.symbol_index(symbols)
+        in_panel = cols >= 0
+        # 取得个股最近__days个交易日的行情数据, 按日期降序排列
+        _, arr_rows, ok = panel.tail('close', panel.date_index(calc_date), cls.__days, cols[in_panel])
+        arr_rows = arr_rows[::-1, ok]
+        arr_cols = cols[in_panel][ok]
+        arrays = [panel[field][arr_rows, arr_cols] for field in ['close', 'amount', 'vol', 'factor', 'turnover1']]
+        arc, vrc, src, krc = _cyq_proxies(*arrays)
+        calculated = ~(np.isnan(arc) | np.isnan(vrc) | np.isnan(src) | np.isnan(krc))
+        # 计算个股下一期的收益率
+        next_date, date_end = cls._next_period(calc_date)
+        calculated_symbols = symbols[in_panel][ok][calculated]
+        next_rets = Utils.interval_returns(calculated_symbols, next_date, date_end).values
+        has_ret = ~np.isnan(next_rets)
+        df_proxies = DataFrame({'id': calculated_symbols[has_ret], 'arc': arc[calculated][has_ret],
+                                'vrc': vrc[calculated][has_ret], 'src': src[calculated][has_ret],
+                                'krc': krc[calculated][has_ret], 'next_ret': next_rets[has_ret]},
+                               columns=['id', 'arc', 'vrc', 'src', 'krc', 'next_ret'])
+        fallback_codes = np.array(codes)[~in_panel].tolist() + np.array(codes)[in_panel][~ok].tolist()
+        return df_proxies, fallback_codes
+
+    @classmethod
+    def _read_proxies(cls, calc_date):
+        """读取指定计算日期保存的筹码分布代理变量数据"""
+        proxies_file_path = cls._db_proxies_path + '_%s.csv' % Utils.datetimelike_to_str(calc_date, dash=False)
+        return pd.read_csv(proxies_file_path, header=0)
+
+    @classmethod
+    def _load_panel(cls, start_date, end_date):
+        """
+        读取批量计算代理变量所需的复权日行情面板数据
+        面板数据自start_date向前多取一倍的回溯交易日, 以覆盖停牌较多的个股
+        :return: DailyPanel
+        """
+        panel_start = Utils.get_trading_days(end=start_date, ndays=2*cls.__days).iloc[0]
+        return Utils.get_daily_panel(['close', 'amount', 'vol', 'factor', 'turnover1'], panel_start, end_date, fq=True)
+
     @classmethod
     def _calc_factor_loading(cls, code, calc_date):
         """
@@ -127,31 +172,53 @@ class CYQ(Factor):
         if ipo_data['发行价格'][:-1] == '--':
             return None
         ipo_price = float(ipo_data['发行价格'][:-1])
-        # 读取个股上市以来的日复权行情数据
-        mkt_data = Utils.get_secu_daily_mkt(code, end=calc_date, fq=True)
-        secu_close = mkt_data.iloc[-1]['close']
-        # 计算每天的均价
-        mkt_data['vwap'] = np.around(mkt_data['amount'] / mkt_data['vol'] * mkt_data['factor'], 2)
-        mkt_data.dropna(axis=0, how='any', inplace=True)
-        # 行情数据按日期降序排列
-        mkt_data.sort_values(by='date', ascending=False, inplace=True)
-        mkt_data.reset_index(drop=True, inplace=True)
-        # 计算筹码分布
-        cyq_data = mkt_data[['vwap', 'turnover1']]
-        cyq_data = cyq_data.append(Series([ipo_price, 0], index=['vwap', 'turnover1']), ignore_index=True)
-        cyq_data['minusTR'] = 1 - cyq_data['turnover1']
-        cyq_data['cumprod_TR'] = cyq_data['minusTR'].cumprod().shift(1)
-        cyq_data.loc[0, 'cumprod_TR'] = 1.
-        cyq_data['cyq'] = cyq_data['turnover1'] * cyq_data['cumprod_TR']
-        secu_cyq = cyq_data['cyq'].groupby(cyq_data['vwap']).sum()
+        symbol = Utils.code_to_symbol(code)
+        calc_date = Utils.to_date(calc_date)
+        # 读取个股的筹码分布状态, 状态截止日期不晚于计算日期时, 只读取状态截止日期之后的日复权行情数据增量更新
+        state = _load_cyq_state(symbol)
+        if state is not None and state['last_date'] <= calc_date.strftime('%Y-%m-%d'):
+            prices, masses = state['prices'], state['masses']
+            last_date, secu_close = state['last_date'], state['last_close']
+            start = (Utils.to_date(last_date) + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+            mkt_data = Utils.get_secu_daily_mkt(code, start=start, end=calc_date, fq=True)
+            save_state = True
+        else:
+            # 没有状态或状态截止日期晚于计算日期, 从IPO开始计算, 后一种情况不覆盖已保存的状态
+            prices, masses = np.array([int(round(ipo_price * 100))], dtype=np.int64), np.zeros(1)
+            last_date, secu_close = None, None
+            mkt_data = Utils.get_secu_daily_mkt(code, end=calc_date, fq=True)
+            save_state = state is None
+        if mkt_data is not None and len(mkt_data) > 0:
+            last_date = mkt_data.iloc[-1]['date']
+            secu_close = mkt_data.iloc[-1]['close']
+            # 计算每天的均价, 并累加至筹码分布
+            mkt_data = mkt_data.copy()
+            mkt_data['vwap'] = np.around(mkt_data['amount'] / mkt_data['vol'] * mkt_data['factor'], 2)
+            mkt_data.dropna(axis=0, how='any', inplace=True)
+            prices, masses = _cyq_accumulate(prices, masses, np.around(np.array(mkt_data['vwap']) * 100).astype(np.int64),
+                                             np.array(mkt_data['turnover1'], dtype=np.float64))
+        if last_date is None:
+            return None
+        if save_state:
+            _save_cyq_state(symbol, prices, masses, last_date, secu_close)
         # 如果筹码价格数量小于30个, 返回None
-        if len(secu_cyq) < 30:
+        if len(prices) < 30:
             return None
+        secu_cyq = Series(masses, index=prices / 100.)
         secu_cyq = secu_cyq[secu_cyq.values > 0.00001]
-        return (Utils.code_to_symbol(code), secu_close, secu_cyq)
+        return (symbol, secu_close, secu_cyq)
+
+    @classmethod
+    def _result_cache_params(cls):
+        return factor_ct.CYQ_CT
 
     @classmethod
-    def _calc_factor_loading_proc1(cls, code, calc_date, q):
+    def _result_cache_inputs(cls, code, calc_date):
+        return (Utils.get_daily_mkt_files(code, fq=True) + Utils.get_daily_mkt_files(code, fq=False) +
+                [os.path.join(util_ct.DB_PATH, util_ct.IPO_INFO_PATH, 'ipo_info.csv')])
+
+    @classmethod
+    def _calc_factor_loading_proc1(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -160,21 +227,20 @@ class CYQ(Factor):
             个股代码, 如600000 or SH600000
         :param calc_date: datetime-like or str
             计算日期, 格式: YYYY-MM-DD
-        :param q: 队列, 用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
-        logging.info('[%s] Calc CYQ factor of %s.' % (Utils.datetimelike_to_str(calc_date), code))
-        cyq_data = None
+        logging.info('[%s] Calc CYQ proxies of %s.' % (Utils.datetimelike_to_str(calc_date), code))
+        cyq_proxies = None
         try:
-            cyq_data = cls._calc_factor_loading(code, calc_date)
+            cyq_proxies = cls._calc_factor_loading1(code, calc_date)
         except Exception as e:
             print(e)
-        if cyq_data is not None:
-            cyq_data['id'] = Utils.code_to_symbol(code)
-            q.put(cyq_data)
+        if cyq_proxies is not None:
+            cyq_proxies['id'] = Utils.code_to_symbol(code)
+            return cyq_proxies
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -183,8 +249,7 @@ class CYQ(Factor):
             个股代码, 如600000 or SH600000
         :param calc_date: datetime-like or str
             计算日期, 格式: YYYY-MM-DD
-        :param q: 队列, 用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc CYQ factor of %s.' % (Utils.datetimelike_to_str(calc_date), code))
         cyq_data = None
@@ -193,7 +258,7 @@ class CYQ(Factor):
         except Exception as e:
             print(e)
         if cyq_data is not None:
-            q.put(cyq_data)
+            return cyq_data
 
     @classmethod
     def calc_factor_loading1(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -210,6 +275,8 @@ class CYQ(Factor):
         :param save: bool, 默认True
             是否保存至因子数据库
         :param kwargs:
+            'batch': bool, 默认False
+                是否采用日行情面板数据批量计算筹码分布的代理变量
         :return: dict
             因子载荷
         --------
@@ -221,7 +288,9 @@ class CYQ(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
+        panel = None
+        if kwargs.get('batch', False):
+            panel = cls._load_panel(trading_days_series.iloc[0], trading_days_series.iloc[-1])
         # 遍历交易日序列, 计算筹码分布因子载荷
         dict_cyq = None
         for calc_date in trading_days_series:
@@ -230,8 +299,7 @@ class CYQ(Factor):
             logging.info('[%s] Calc CYQ factor loading.' % Utils.datetimelike_to_str(calc_date))
             # 遍历个股, 计算个股筹码分布因子值
             df_proxies = DataFrame()
-            s = (calc_date - datetime.timedelta(days=365)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 365)
 
             trading_day = Utils.get_trading_days(calc_date, ndays=2)[1]
             # 采用单进程计算筹码因子分布的代理变量
@@ -243,22 +311,24 @@ class CYQ(Factor):
             #         cyq_proxies['id'] = Utils.code_to_symbol(stock_info.symbol)
             #         df_proxies = df_proxies.append(cyq_proxies, ignore_index=True)
 
-            # 采用多进程进行并行计算筹码分布因子的代理变量
-            q = Manager().Queue()   # 队列, 用于进程间通信, 存储每个进程计算的因子载荷
-            p = Pool(4)             # 进程池, 最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-            p.close()
-            p.join()
-            while not q.empty():
-                cyq_proxies = q.get(True)
-                # cyq_proxies['date'] = trading_day
-                df_proxies = df_proxies.append(cyq_proxies, ignore_index=True)
+            if kwargs.get('batch', False):
+                # 采用面板数据批量计算筹码分布因子的代理变量, 面板数据内行情不足的个股逐个计算
+                df_proxies, fallback_codes = cls._calc_factor_loading1_batch(list(stock_codes), calc_date, panel)
+                proxies_lst = [cls._calc_factor_loading_proc1(code, calc_date) for code in fallback_codes]
+                proxies_lst = [cyq_proxies for cyq_proxies in proxies_lst if cyq_proxies is not None]
+                if len(proxies_lst) > 0:
+                    df_proxies = pd.concat([df_proxies, DataFrame(proxies_lst)], ignore_index=True)
+            else:
+                # 采用多进程进行并行计算筹码分布因子的代理变量
+                proxies_lst = cls._parallel_calc(list(stock_codes), calc_date, proc='_calc_factor_loading_proc1')
+                df_proxies = DataFrame(proxies_lst, columns=['id', 'arc', 'vrc', 'src', 'krc', 'next_ret'])
 
             # 保存筹码分布代理变量数据
             df_proxies['date'] = trading_day
             proxies_file_path = cls._db_proxies_path + '_%s.csv' % Utils.datetimelike_to_str(calc_date, dash=False)
             df_proxies.to_csv(proxies_file_path, index=False, columns=['date', 'id', 'arc', 'vrc', 'src', 'krc', 'next_ret'])
+            # 保存本期代理变量回归的充分统计量
+            CYQProxyStats.update([(calc_date, df_proxies)])
 
             # 导入筹码分布因子的代理变量数据
             # cyq_proxies_path = cls._db_proxies_path + '_%s.csv' % Utils.datetimelike_to_str(calc_date, dash=False)
@@ -275,20 +345,13 @@ class CYQ(Factor):
                         csv_writer = csv.writer(f)
                         csv_writer.writerow([calc_date.strftime('%Y-%m-%d'), marc, 0, 0, 0, 0, 0])
                 else:
-                    df_proxies_data = DataFrame()
                     if marc > 0:
                         df_proxies_weight = df_proxies_weight[df_proxies_weight.marc > 0]
                     elif marc < 0:
                         df_proxies_weight = df_proxies_weight[df_proxies_weight.marc < 0]
-                    for _, weight_info in df_proxies_weight.iterrows():
-                        proxies_file_path = cls._db_proxies_path + '_%s.csv' % Utils.datetimelike_to_str(weight_info['date'], False)
-                        df_proxies_data = df_proxies_data.append(pd.read_csv(proxies_file_path, header=0), ignore_index=True)
-                    next_ret = np.array(df_proxies_data['next_ret'])
-                    cyq_data = np.array(df_proxies_data[['arc', 'vrc', 'src', 'krc']])
-                    cyq_data = sm.add_constant(cyq_data)
-                    cyq_model = sm.OLS(next_ret, cyq_data)
-                    cyq_result = cyq_model.fit()
-                    cyq_weights = np.around(cyq_result.params, 6)
+                    # 由各期保存的X'X, X'y之和求解混合回归的代理变量权重
+                    cyq_weights = CYQProxyStats.solve(list(df_proxies_weight['date']), loader=cls._read_proxies)
+                    cyq_weights = np.around(cyq_weights, 6)
                     with open(proxies_weight_file, 'a', newline='') as f:
                         csv_writer = csv.writer(f)
                         csv_writer.writerow([calc_date.strftime('%Y-%m-%d'), marc, cyq_weights[0], cyq_weights[1], cyq_weights[2], cyq_weights[3], cyq_weights[4]])
@@ -306,9 +369,10 @@ class CYQ(Factor):
                     csv_writer = csv.writer(f)
                     csv_writer.writerow(['date', 'marc', 'intcpt', 'arc_w', 'vrc_w', 'src_w', 'krc_w'])
                     csv_writer.writerow([calc_date.strftime('%Y-%m-%d'), marc, 0, 0, 0, 0, 0])
-            # 休息300秒
-            logging.info('Suspending for 200s.')
-            time.sleep(200)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
+        # 计算结果磁盘缓存超过大小上限时淘汰最久未使用的结果
+        cls._evict_result_cache()
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -336,7 +400,6 @@ class CYQ(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列, 计算筹码分布因子载荷
         dict_cyq = {}
         for calc_date in trading_days_series:
@@ -344,15 +407,12 @@ class CYQ(Factor):
                 continue
             logging.info('[%s] Calc CYQ factor loading.' % Utils.datetimelike_to_str(calc_date))
             # 遍历个股, 计算个股筹码分布因子值
-            s= (calc_date - datetime.timedelta(days=180)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 180)
 
-            secu_cyq_path = Path(factor_ct.FACTOR_DB.db_path, factor_ct.CYQ_CT.db_file,
-                                 'secu_cyq/%s' % calc_date.strftime('%Y-%m-%d'))
-            if not secu_cyq_path.exists():
-                secu_cyq_path.mkdir()
             ids = []
             rps = []
+            closes = []     # 个股的收盘价
+            dists = []      # 个股的筹码分布数据
 
             # 采用单进程计算筹码分布数据, 及当前价格的相对位置(=当前价格-平均成本)/平均成本
             # for _, stock_info in stock_basics.iterrows():
@@ -369,34 +429,350 @@ class CYQ(Factor):
             #         rps.append(relative_position)
 
             # 采用多进程进行并行计算筹码分布数据, 及当前价格的相对位置(=当前价格-平均成本)/平均成本
-            q = Manager().Queue()   # 队列, 用于进程间通信, 存储每个进程计算的因子载荷
-            p = Pool(4)             # 进程池, 最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q, ))
-            p.close()
-            p.join()
-            while not q.empty():
-                secu_cyq = q.get(True)
+            for secu_cyq in cls._parallel_calc(list(stock_codes), calc_date):
                 secu_code, secu_close, cyq_data = secu_cyq
-                # 保存个股的筹码分布数据
-                cyq_data.to_csv(Path(secu_cyq_path, '%s.csv' % secu_code), header=True)
                 # 计算当前价格的相对位置
                 avg_cyq = np.sum(np.array(cyq_data.index) * np.array(cyq_data.values))
                 relative_position = round((secu_close - avg_cyq) / avg_cyq, 4)
                 ids.append(secu_code)
                 rps.append(relative_position)
+                closes.append(secu_close)
+                dists.append(cyq_data)
+            # 保存个股的筹码分布数据
+            CYQDistStore.write(calc_date, ids, closes, dists)
 
             date_label = Utils.get_trading_days(calc_date, ndays=2)[1]
             dict_cyq = {'date': [date_label]*len(ids), 'id': ids, 'factorvalue': rps}
             if save:
                 cyq_data_path = os.path.join(factor_ct.FACTOR_DB.db_path, factor_ct.CYQ_CT.db_file, factor_ct.CYQ_CT.CYQ_rp_file)
                 Utils.factor_loading_persistent(cyq_data_path, Utils.datetimelike_to_str(calc_date, dash=False), dict_cyq, ['date', 'id', 'factorvalue'])
-            # 休息90秒
-            logging.info('Suspending for 100s.')
-            time.sleep(100)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
+        # 计算结果磁盘缓存超过大小上限时淘汰最久未使用的结果
+        cls._evict_result_cache()
         return dict_cyq
 
 
+class CYQDistStore(object):
+    """
+    个股筹码分布数据的按日存储
+    --------
+    每个计算日期的全部个股筹码分布数据保存为一个打包文件secu_cyq/<YYYY-MM-DD>.pack(相对于CYQ_CT.db_file), 读取时采用内存映射方式
+    打包文件包含的数组(CSR格式):
+        symbols: 个股代码
+        closes: 个股在计算日期的收盘价, float64
+        offsets: 每个个股的筹码分布在prices, masses数组中的起止位置, 长度=个股数量+1
+        prices: 筹码价格, float32
+        masses: 筹码价格对应的持仓比例, float32
+    """
+    _days = Cache(12)   # 已打开的按日存储, key为文件路径
+
+    def __init__(self, arrays):
+        self._arrays = arrays
+        self._offsets = arrays['offsets']
+        self._symbol_idx = {symbol: k for k, symbol in enumerate(arrays['symbols'].tolist())}
+
+    @classmethod
+    def _dist_path(cls):
+        return os.path.join(factor_ct.FACTOR_DB.db_path, factor_ct.CYQ_CT.db_file, 'secu_cyq')
+
+    @classmethod
+    def get_day(cls, calc_date):
+        """
+        取得指定计算日期的筹码分布存储
+        :param calc_date: datetime-like, str
+            计算日期
+        :return: CYQDistStore, 存储文件不存在时返回None
+        """
+        file_path = os.path.join(cls._dist_path(), '%s.pack' % Utils.datetimelike_to_str(Utils.to_date(calc_date)))
+        day = cls._days.get(file_path)
+        if day is None:
+            if not os.path.isfile(file_path):
+                return None
+            day = cls(PackFile.read(file_path)[0])
+            cls._days.set(file_path, day)
+        return day
+
+    @property
+    def symbols(self):
+        return self._arrays['symbols']
+
+    def has_symbol(self, symbol):
+        return symbol in self._symbol_idx
+
+    def get_close(self, symbol):
+        """个股在计算日期的收盘价"""
+        return float(self._arrays['closes'][self._symbol_idx[symbol]])
+
+    def get_dist(self, symbol):
+        """
+        取得个股的筹码分布数据
+        :param symbol: str
+            个股代码, 如SH600000
+        :return: tuple(np.array, np.array)
+            筹码价格及对应的持仓比例, 为内存映射数组的视图(只读, 不复制数据); 个股不在存储中时返回None
+        """
+        k = self._symbol_idx.get(symbol)
+        if k is None:
+            return None
+        lo, hi = self._offsets[k], self._offsets[k+1]
+        return self._arrays['prices'][lo:hi], self._arrays['masses'][lo:hi]
+
+    def get_series(self, symbol):
+        """取得个股的筹码分布数据, 格式同CYQ._calc_factor_loading返回的cyq_data, 个股不在存储中时返回None"""
+        dist = self.get_dist(symbol)
+        if dist is None:
+            return None
+        return Series(dist[1].astype(np.float64), index=dist[0].astype(np.float64))
+
+    @classmethod
+    def write(cls, calc_date, symbols, closes, dists):
+        """
+        保存计算日期全部个股的筹码分布数据
+        Parameters:
+        --------
+        :param calc_date: datetime-like, str
+            计算日期
+        :param symbols: list of str
+            个股代码列表, 如SH600000
+        :param closes: list of float
+            个股在计算日期的收盘价
+        :param dists: list of pd.Series
+            个股的筹码分布数据, index为筹码价格, values为持仓比例
+        """
+        offsets = np.zeros(len(symbols) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(dist) for dist in dists])
+        if len(dists) > 0:
+            prices = np.concatenate([np.asarray(dist.index, dtype=np.float32) for dist in dists])
+            masses = np.concatenate([np.asarray(dist.values, dtype=np.float32) for dist in dists])
+        else:
+            prices, masses = np.array([], dtype=np.float32), np.array([], dtype=np.float32)
+        dist_path = cls._dist_path()
+        if not os.path.exists(dist_path):
+            os.makedirs(dist_path)
+        file_path = os.path.join(dist_path, '%s.pack' % Utils.datetimelike_to_str(Utils.to_date(calc_date)))
+        PackFile.write(file_path, [('symbols', np.array(symbols, dtype=str)), ('closes', np.array(closes, dtype=np.float64)),
+                                   ('offsets', offsets), ('prices', prices), ('masses', masses)])
+        cls._days = Cache(12)
+
+    @classmethod
+    def convert_from_csv(cls):
+        """
+        把secu_cyq/<YYYY-MM-DD>/<symbol>.csv格式的筹码分布数据转换为按日存储, 已存在的存储文件不重复转换
+        转换后的存储中收盘价为NaN
+        :return: int, 转换的计算日期数量
+        """
+        dist_path = cls._dist_path()
+        if not os.path.isdir(dist_path):
+            return 0
+        converted = 0
+        for str_date in sorted(os.listdir(dist_path)):
+            date_path = os.path.join(dist_path, str_date)
+            if not os.path.isdir(date_path) or os.path.isfile(date_path + '.pack'):
+                continue
+            symbols = []
+            dists = []
+            for file_name in sorted(os.listdir(date_path)):
+                if not file_name.endswith('.csv'):
+                    continue
+                df_dist = pd.read_csv(os.path.join(date_path, file_name), header=0, index_col=0)
+                symbols.append(os.path.splitext(file_name)[0])
+                dists.append(df_dist.iloc[:, 0])
+            cls.write(str_date, symbols, [np.nan] * len(symbols), dists)
+            logging.info('CYQ distributions of %s converted, %d securities.' % (str_date, len(symbols)))
+            converted += 1
+        return converted
+
+
+class CYQProxyStats(object):
+    """
+    筹码分布代理变量回归的充分统计量
+    --------
+    代理变量权重由过去24期(月)的代理变量对下一期收益率做混合回归得到: next_ret = X * w, X = [1, arc, vrc, src, krc]
+    混合回归的正规方程只依赖各期的X'X, X'y之和, 因此每期只需保存该期的X'X, X'y及样本数量,
+    滚动回归时按marc的正负选取各期统计量求和后求解5 × 5的正规方程, 不再读取各期的代理变量文件
+    全部期数的统计量保存为单个打包文件(CYQ_CT.proxies_stats_file), 包含:
+        dates: 计算日期, datetime64[D], 升序排列
+        n: 样本数量
+        xtx: k × 5 × 5数组, 各期的X'X
+        xty: k × 5数组, 各期的X'y
+    """
+    _fields = ['arc', 'vrc', 'src', 'krc']
+
+    @classmethod
+    def _stats_path(cls):
+        return os.path.join(factor_ct.FACTOR_DB.db_path, factor_ct.CYQ_CT.proxies_stats_file)
+
+    @classmethod
+    def read(cls):
+        """
+        读取全部期数的统计量
+        :return: dict, 包含dates, n, xtx, xty, 文件不存在时各数组为空
+        """
+        file_path = cls._stats_path()
+        if not os.path.isfile(file_path):
+            return {'dates': np.array([], dtype='datetime64[D]'), 'n': np.array([], dtype=np.int64),
+                    'xtx': np.zeros((0, 5, 5)), 'xty': np.zeros((0, 5))}
+        arrays = PackFile.read(file_path)[0]
+        return {name: np.array(arrays[name]) for name in ['dates', 'n', 'xtx', 'xty']}
+
+    @classmethod
+    def calc_stats(cls, df_proxies):
+        """
+        计算一期代理变量数据的统计量
+        :param df_proxies: pd.DataFrame
+            代理变量数据, 包含arc, vrc, src, krc, next_ret列
+        :return: tuple(int, np.array, np.array)
+            样本数量, X'X(5 × 5), X'y(5)
+        """
+        arr_x = np.ones((len(df_proxies), 5))
+        arr_x[:, 1:] = np.array(df_proxies[cls._fields], dtype=np.float64)
+        arr_y = np.array(df_proxies['next_ret'], dtype=np.float64)
+        return len(df_proxies), np.dot(arr_x.T, arr_x), np.dot(arr_x.T, arr_y)
+
+    @classmethod
+    def update(cls, proxies):
+        """
+        保存若干期代理变量数据的统计量, 已存在的同一计算日期的统计量将被替换
+        :param proxies: list of tuple(datetime-like, pd.DataFrame)
+            计算日期及该期的代理变量数据
+        """
+        if len(proxies) == 0:
+            return
+        stats = cls.read()
+        entries = {date: (n, xtx, xty) for date, n, xtx, xty in zip(stats['dates'], stats['n'], stats['xtx'], stats['xty'])}
+        for calc_date, df_proxies in proxies:
+            entries[np.datetime64(Utils.to_date(calc_date), 'D')] = cls.calc_stats(df_proxies)
+        dates = np.array(sorted(entries.keys()), dtype='datetime64[D]')
+        file_path = cls._stats_path()
+        if not os.path.exists(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        PackFile.write(file_path, [('dates', dates),
+                                   ('n', np.array([entries[date][0] for date in dates], dtype=np.int64)),
+                                   ('xtx', np.array([entries[date][1] for date in dates], dtype=np.float64).reshape((len(dates), 5, 5))),
+                                   ('xty', np.array([entries[date][2] for date in dates], dtype=np.float64).reshape((len(dates), 5)))])
+
+    @classmethod
+    def solve(cls, calc_dates, loader=None):
+        """
+        对若干期的代理变量做混合回归, 求解代理变量权重
+        Parameters:
+        --------
+        :param calc_dates: list of datetime-like
+            参与回归的各期计算日期
+        :param loader: callable, 默认None
+            loader(calc_date)返回该期的代理变量数据, 用于补充计算尚未保存统计量的期数(如旧版本计算的代理变量文件)
+        :return: np.array
+            代理变量权重[intcpt, arc_w, vrc_w, src_w, krc_w]
+        """
+        calc_dates = np.array([np.datetime64(Utils.to_date(calc_date), 'D') for calc_date in calc_dates], dtype='datetime64[D]')
+        stats = cls.read()
+        missing = calc_dates[~np.isin(calc_dates, stats['dates'])]
+        if len(missing) > 0 and loader is not None:
+            cls.update([(pd.Timestamp(calc_date), loader(pd.Timestamp(calc_date))) for calc_date in missing])
+            stats = cls.read()
+        found = np.isin(stats['dates'], calc_dates)
+        if found.sum() < len(calc_dates):
+            logging.warning('CYQ proxy stats of %d periods not found.' % (len(calc_dates) - found.sum()))
+        xtx = stats['xtx'][found].sum(axis=0)
+        xty = stats['xty'][found].sum(axis=0)
+        return np.dot(np.linalg.pinv(xtx), xty)
+
+
+def _cyq_proxies(close, amount, vol, factor, turnover):
+    """
+    计算筹码分布的四个代理变量
+    Parameters:
+    --------
+    :param close, amount, vol, factor, turnover: np.array
+        n × M数组, 各列为一只个股最近n个交易日的复权收盘价、成交金额、成交量、复权系数及换手率, 按日期降序排列
+    :return: tuple(np.array, np.array, np.array, np.array)
+        各个股的arc(均值), vrc(方差), src(偏度), krc(峰度), 无法计算时为NaN
+    --------
+    RC_j = (P_c - P_avg_j) / P_c, P_c为最近一个交易日的收盘价, P_avg_j为第j天的复权均价
+    ATR_j = TR_j * (1-TR_0) * ... * (1-TR_{j-1}), 即换手率乘以之前各天(1-换手率)的累积乘积
+    各代理变量为RC以ATR为权重的加权矩
+    """
+    n = close.shape[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_c = close[0]
+        p_avg = amount / vol * factor
+        rc = (p_c - p_avg) / p_c
+        remain = np.cumprod(1. - turnover, axis=0)
+        atr = turnover * np.vstack((np.ones((1, close.shape[1])), remain[:-1]))
+        sum_atr = np.sum(atr, axis=0)
+        arc = np.sum(rc * atr, axis=0) / sum_atr
+        rc_dev = rc - arc
+        vrc = n / (n-1.) * np.sum(atr * rc_dev * rc_dev, axis=0) / sum_atr
+        src = n / (n-1.) * np.sum(atr * np.float_power(rc_dev, 3), axis=0) / sum_atr / np.float_power(vrc, 1.5)
+        krc = n / (n-1.) * np.sum(atr * np.float_power(rc_dev, 4), axis=0) / sum_atr / np.float_power(vrc, 2)
+    return arc, vrc, src, krc
+
+
+def _cyq_accumulate(prices, masses, new_prices, new_turnovers):
+    """
+    把新交易日的成交累加至筹码分布
+    筹码分布中每个交易日的持仓比例 = 当天换手率 × 之后各交易日(1-换手率)的乘积, 因此新增m个交易日后,
+    原有筹码的持仓比例乘以这m天(1-换手率)的乘积, 新交易日的持仓比例按同样的方法计算
+    Parameters:
+    --------
+    :param prices: np.array of int64
+        原筹码分布的价格(分), 升序排列
+    :param masses: np.array of float64
+        原筹码分布各价格的持仓比例
+    :param new_prices: np.array of int64
+        新交易日的均价(分), 按日期升序排列
+    :param new_turnovers: np.array of float64
+        新交易日的换手率, 按日期升序排列
+    :return: tuple(np.array, np.array)
+        更新后筹码分布的价格(升序排列)及持仓比例
+    """
+    if len(new_prices) == 0:
+        return prices, masses
+    # remains[k]: 第k天及之后各交易日(1-换手率)的乘积
+    remains = np.cumprod((1. - new_turnovers)[::-1])[::-1]
+    new_masses = new_turnovers * np.append(remains[1:], 1.)
+    all_prices = np.concatenate((prices, new_prices))
+    all_masses = np.concatenate((masses * remains[0], new_masses))
+    prices, inverse = np.unique(all_prices, return_inverse=True)
+    return prices, np.bincount(inverse.ravel(), weights=all_masses, minlength=len(prices))
+
+
+def _cyq_state_file(symbol):
+    return os.path.join(factor_ct.FACTOR_DB.db_path, factor_ct.CYQ_CT.db_file, factor_ct.CYQ_CT.state_path,
+                        '%s.npz' % symbol)
+
+
+def _load_cyq_state(symbol):
+    """
+    读取个股的筹码分布状态
+    :return: dict, 包含prices(价格, 分), masses(持仓比例), last_date(状态截止日期, YYYY-MM-DD), last_close(截止日期的收盘价)
+        状态文件不存在或读取失败时返回None
+    """
+    state_file = _cyq_state_file(symbol)
+    if not os.path.isfile(state_file):
+        return None
+    try:
+        with np.load(state_file) as state:
+            return {'prices': state['prices'], 'masses': state['masses'], 'last_date': str(state['last_date']),
+                    'last_close': float(state['last_close'])}
+    except Exception as e:
+        logging.warning('Failed to load cyq state of %s: %s' % (symbol, e))
+        return None
+
+
+def _save_cyq_state(symbol, prices, masses, last_date, last_close):
+    """保存个股的筹码分布状态, 先写入临时文件再替换"""
+    state_file = _cyq_state_file(symbol)
+    if not os.path.exists(os.path.dirname(state_file)):
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    tmp_file = '%s.%d.tmp' % (state_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, prices=prices, masses=masses, last_date=np.array(Utils.datetimelike_to_str(last_date)),
+                 last_close=np.array(last_close, dtype=np.float64))
+    os.replace(tmp_file, state_file)
+
+
 if __name__ == '__main__':
     # pass
     CYQ.calc_factor_loading(start_date='2017-5-1', end_date='2017-12-31', month_end=True, save=True)
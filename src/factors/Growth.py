@@ -10,13 +10,12 @@
 from src.factors.factor import Factor
 import src.factors.cons as factor_ct
 from src.util.utils import Utils
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import CDataHandler
-from pandas import Series
+from pandas import Series, DataFrame
 import os
 import datetime
 import logging
-from multiprocessing import Pool, Manager
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -73,7 +72,47 @@ class Growth(Factor):
         return Series([code, round(npg_ttm, 4), round(opg_ttm, 4)], index=['id', 'npg_ttm', 'opg_ttm'])
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_batch(cls, codes, calc_date):
+        """
+        批量计算指定日期、一组个股的成长因子，计算规则与_calc_factor_loading一致
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表，如600000或SH600000
+        :param calc_date: datetime-like or str
+            计算日期，格式YYYY-MM-DD, YYYYMMDD
+        :return: pd.DataFrame
+        --------
+            成长类因子值
+            0. id: 证券代码
+            1. npg_ttm: 净利润增长率_TTM
+            2. opg_ttm: 营业收入增长率_TTM
+            不包含计算失败的个股
+        """
+        calc_date = Utils.to_date(calc_date)
+        # 读取最新的TTM财务数据
+        ttm_fin_data_latest = Utils.get_ttm_fin_basic_data_panel(codes, calc_date)
+        # 读取去年同期TTM财务数据
+        try:
+            pre_date = datetime.datetime(calc_date.year-1, calc_date.month, calc_date.day)
+        except ValueError:
+            pre_date = calc_date - datetime.timedelta(days=366)
+        ttm_fin_data_pre = Utils.get_ttm_fin_basic_data_panel(codes, pre_date)
+        symbols = [symbol for symbol in ttm_fin_data_latest.index if symbol in ttm_fin_data_pre.index]
+        ttm_fin_data_latest = ttm_fin_data_latest.loc[symbols]
+        ttm_fin_data_pre = ttm_fin_data_pre.loc[symbols]
+        # 计算成长类因子值
+        pre_net_profit = ttm_fin_data_pre['NetProfit'].abs()
+        pre_revenue = ttm_fin_data_pre['MainOperateRevenue'].abs()
+        npg_ttm = (ttm_fin_data_latest['NetProfit'] - ttm_fin_data_pre['NetProfit']) / pre_net_profit
+        opg_ttm = (ttm_fin_data_latest['MainOperateRevenue'] - ttm_fin_data_pre['MainOperateRevenue']) / pre_revenue
+        valid = ~(pre_net_profit < 0.1) & ~(pre_revenue < 0.1)
+        df_growth = DataFrame({'id': symbols, 'npg_ttm': npg_ttm.round(4).values, 'opg_ttm': opg_ttm.round(4).values},
+                              columns=['id', 'npg_ttm', 'opg_ttm'])
+        return df_growth[valid.values].reset_index(drop=True)
+
+    @classmethod
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -82,8 +121,7 @@ class Growth(Factor):
             个股代码，如600000或SH600000
         :param calc_date: datetime-like, str
             计算日期，格式：YYYY-MM-DD or YYYYMMDD
-        :param q: 队列，用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc Growth factor of %s.' % (Utils.datetimelike_to_str(calc_date), code))
         growth = None
@@ -92,7 +130,7 @@ class Growth(Factor):
         except Exception as e:
             print(e)
         if growth is not None:
-            q.put(growth)
+            return growth
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -109,6 +147,9 @@ class Growth(Factor):
             如果为True，则只计算月末时点的因子载荷
         :param save: bool, 默认False
             是否保存至因子数据库
+        :param kwargs:
+            'batch': bool, 默认False
+                是否从财务数据合并存储批量计算全部个股的因子载荷
         :return: 因子载荷，pd.DataFrame
         --------
             因子载荷，pd.DataFrame
@@ -119,7 +160,6 @@ class Growth(Factor):
         """
         # 取得交易日序列及股票基本信息表
         trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列，计算价值因子载荷
         dict_growth = None
         for calc_date in trading_days_series:
@@ -127,8 +167,7 @@ class Growth(Factor):
                 continue
             dict_growth = {'date': [], 'id': [], 'npg_ttm': [], 'opg_ttm': []}
             # 遍历个股，计算个股成长因子载荷
-            s = (calc_date - datetime.timedelta(days=90)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 90)
 
             # 采用单进程进行计算成长因子
             # for _, stock_info in stock_basics.iterrows():
@@ -139,18 +178,18 @@ class Growth(Factor):
             #         dict_growth['npg_ttm'].append(growth_data['npg_ttm'])
             #         dict_growth['opg_ttm'].append(growth_data['opg_ttm'])
 
-            # 采用多进程并行计算成长因子
-            q = Manager().Queue()   # 队列，用于进程间通信，存储每个进程计算的因子载荷
-            p = Pool(4)             # 进程池，最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-            p.close()
-            p.join()
-            while not q.empty():
-                growth_data = q.get(True)
-                dict_growth['id'].append(growth_data['id'])
-                dict_growth['npg_ttm'].append(growth_data['npg_ttm'])
-                dict_growth['opg_ttm'].append(growth_data['opg_ttm'])
+            if kwargs.get('batch', False):
+                # 批量计算成长因子
+                df_growth = cls._calc_factor_loading_batch(list(stock_codes), calc_date)
+                dict_growth['id'] = list(df_growth['id'])
+                dict_growth['npg_ttm'] = list(df_growth['npg_ttm'])
+                dict_growth['opg_ttm'] = list(df_growth['opg_ttm'])
+            else:
+                # 采用多进程并行计算成长因子
+                for growth_data in cls._parallel_calc(list(stock_codes), calc_date):
+                    dict_growth['id'].append(growth_data['id'])
+                    dict_growth['npg_ttm'].append(growth_data['npg_ttm'])
+                    dict_growth['opg_ttm'].append(growth_data['opg_ttm'])
 
             date_label = Utils.get_trading_days(start=calc_date, ndays=2)[1]
             dict_growth['date'] = [date_label] * len(dict_growth['id'])
@@ -158,9 +197,8 @@ class Growth(Factor):
             if save:
                 columns = ['date', 'id', 'npg_ttm', 'opg_ttm']
                 Utils.factor_loading_persistent(cls._db_file, calc_date.strftime('%Y%m%d'), dict_growth, columns)
-            # 休息120秒
-            logging.info('Suspending for 120s.')
-            time.sleep(120)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         return dict_growth
 
 
@@ -10,16 +10,14 @@
 from src.factors.factor import Factor
 import src.factors.cons as factor_ct
 from src.util.utils import Utils, SecuTradingStatus
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import CDataHandler
 import pandas as pd
 from pandas import DataFrame, Series
 import numpy as np
 import os
 import math
-import datetime
 import logging
-from multiprocessing import Pool, Manager
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -60,20 +58,13 @@ class IntradayMomentum(Factor):
         ret_header = ['date', 'r0', 'r1', 'r2', 'r3', 'r4']
         k = 0
         for trading_day in trading_days:
-            df_1m_mkt = Utils.get_min_mkt(code, trading_day, fq=True)
-            if df_1m_mkt is None:
+            # 读取日内5个时点的价格
+            prices = Utils.get_checkpoint_prices(code, trading_day, mkt_data_header[1:])
+            if prices is None:
                 continue
-            # 计算日内5个时点的价格
-            time_label = '%s 09:31:00' % trading_day.strftime('%Y-%m-%d')
-            p0930 = df_1m_mkt[df_1m_mkt.datetime == time_label].iloc[0].open
-            time_label = '%s 10:30:00' % trading_day.strftime('%Y-%m-%d')
-            p1030 = df_1m_mkt[df_1m_mkt.datetime == time_label].iloc[0].close
-            time_label = '%s 11:30:00' % trading_day.strftime('%Y-%m-%d')
-            p1130 = df_1m_mkt[df_1m_mkt.datetime == time_label].iloc[0].close
-            time_label = '%s 14:00:00' % trading_day.strftime('%Y-%m-%d')
-            p1400 = df_1m_mkt[df_1m_mkt.datetime == time_label].iloc[0].close
-            time_label = '%s 15:00:00' % trading_day.strftime('%Y-%m-%d')
-            p1500 = df_1m_mkt[df_1m_mkt.datetime == time_label].iloc[0].close
+            if np.isnan(prices).any():
+                return None
+            p0930, p1030, p1130, p1400, p1500 = prices
             s = Series([trading_day, p0930, p1030, p1130, p1400, p1500], index=mkt_data_header)
             mkt_data = mkt_data.append(s, ignore_index=True)
             # 计算日内收益
@@ -124,7 +115,7 @@ class IntradayMomentum(Factor):
         return intra_day_momentum
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters
@@ -133,8 +124,7 @@ class IntradayMomentum(Factor):
             个股代码，如600000或SH600000
         :param calc_date: datetime-like or str
             计算日期，格式：YYYY-MM-DD
-        :param q: 队列，用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc Intaday Momentum of %s.' % (Utils.datetimelike_to_str(calc_date), code))
         momentum_data = None
@@ -143,8 +133,8 @@ class IntradayMomentum(Factor):
         except Exception as e:
             print(e)
         if momentum_data is not None:
-            q.put((Utils.code_to_symbol(code), momentum_data.m0, momentum_data.m1, momentum_data.m2,
-                   momentum_data.m3, momentum_data.m4, momentum_data.m_normal))
+            return (Utils.code_to_symbol(code), momentum_data.m0, momentum_data.m1, momentum_data.m2,
+                    momentum_data.m3, momentum_data.m4, momentum_data.m_normal)
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -181,7 +171,6 @@ class IntradayMomentum(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列，计算日内动量因子值
         dict_intraday_momentum = None
         for calc_date in trading_days_series:
@@ -217,8 +206,7 @@ class IntradayMomentum(Factor):
                 dict_intraday_momentum = {'date': [], 'id': [], 'm0': [], 'm1': [],
                                           'm2': [], 'm3': [], 'm4': [], 'm_normal': []}
                 # 遍历个股，计算个股日内动量值
-                s = (calc_date - datetime.timedelta(days=90)).strftime('%Y%m%d')
-                stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+                stock_codes = CDataHandler.get_universe(calc_date, 90)
 
                 # 采用单进程进行计算
                 # for _, stock_info in stock_basics.iterrows():
@@ -234,14 +222,7 @@ class IntradayMomentum(Factor):
                 #         dict_intraday_momentum['m_normal'].append(round(momentum_data.m_normal, 6))
 
                 # 采用多进程并行计算日内动量因子载荷
-                q = Manager().Queue()   # 队列，用于进程间通信，存储每个进程计算的因子载荷
-                p = Pool(4)             # 进程池，最多同时开启4个进程
-                for _, stock_info in stock_basics.iterrows():
-                    p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-                p.close()
-                p.join()
-                while not q.empty():
-                    momentum_data = q.get(True)
+                for momentum_data in cls._parallel_calc(list(stock_codes), calc_date):
                     dict_intraday_momentum['id'].append(momentum_data[0])
                     dict_intraday_momentum['m0'].append(round(momentum_data[1], 6))
                     dict_intraday_momentum['m1'].append(round(momentum_data[2], 6))
@@ -255,9 +236,8 @@ class IntradayMomentum(Factor):
                 # 保存因子载荷至因子数据库
                 if save:
                     Utils.factor_loading_persistent(cls._db_file, calc_date.strftime('%Y%m%d'), dict_intraday_momentum)
-                # 休息360秒
-                logging.info('Suspending for 360s.')
-                time.sleep(360)
+                # 系统资源紧张时暂停
+                ResourceThrottle.wait()
         return dict_intraday_momentum
 
     @classmethod
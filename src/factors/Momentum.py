@@ -10,14 +10,12 @@
 from src.factors.factor import Factor
 import src.factors.cons as factor_ct
 from src.util.utils import Utils
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import CDataHandler
 # import pandas as pd
 from pandas import Series
 import os
-import datetime
 import logging
-from multiprocessing import Pool, Manager
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -69,7 +67,7 @@ class Momentum(Factor):
         return momentum
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -78,8 +76,7 @@ class Momentum(Factor):
             个股代码，如600000或SH600000
         :param calc_date: datetime-like or str
             计算日期，格式YYYY-MM-DD or YYYYMMDD
-        :param q: 队列，用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc Momentum factor of %s.' % (Utils.datetimelike_to_str(calc_date), code))
         momentum = None
@@ -89,7 +86,7 @@ class Momentum(Factor):
             print(e)
         if momentum is not None:
             momentum['id'] = Utils.code_to_symbol(code)
-            q.put(momentum)
+            return momentum
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -119,7 +116,6 @@ class Momentum(Factor):
         # 取得交易日序列及股票基本信息表
         # start_date = Utils.to_date(start_date)
         trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列，计算动量因子
         dict_momentum = None
         momentum_label = cls.momentum_label()
@@ -130,8 +126,7 @@ class Momentum(Factor):
             for label in momentum_label:
                 dict_momentum[label] = []
             # 遍历个股，计算个股动量因子
-            s = (calc_date - datetime.timedelta(days=90)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 90)
 
             # 采用单进程进行计算
             # for _, stock_info in stock_basics.iterrows():
@@ -143,14 +138,7 @@ class Momentum(Factor):
             #             dict_momentum[label].append(momentum_data[label])
 
             # 采用多进程并行计算动量因子载荷
-            q = Manager().Queue()   # 队列，用于进程间通信，存储每个进程计算的因子载荷
-            p = Pool(4)             # 进程池，最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-            p.close()
-            p.join()
-            while not q.empty():
-                momentum_data = q.get(True)
+            for momentum_data in cls._parallel_calc(list(stock_codes), calc_date):
                 dict_momentum['id'].append(momentum_data['id'])
                 for label in momentum_label:
                     dict_momentum[label].append(momentum_data[label])
@@ -160,9 +148,8 @@ class Momentum(Factor):
             # 保存因子载荷至因子数据库
             if save:
                 Utils.factor_loading_persistent(cls._db_file, calc_date.strftime('%Y%m%d'), dict_momentum)
-            # 休息60秒
-            logging.info('Suspending for 60s.')
-            time.sleep(60)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         return dict_momentum
 
 
@@ -10,14 +10,12 @@
 from src.factors.factor import Factor
 import src.factors.cons as factor_ct
 from src.util.utils import Utils
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import CDataHandler
 from pandas import Series
 import math
 import os
-from multiprocessing import Pool, Manager
-import datetime
 import logging
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -62,7 +60,7 @@ class Scale(Factor):
         return scale_factor
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -71,8 +69,7 @@ class Scale(Factor):
             个股代码，如600000或SH600000
         :param calc_date: datetime-like or str
             计算日期，格式YYYY-MM-DD 或YYYYMMDD
-        :param q: 队列，用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc market capitalization of %s' %(Utils.datetimelike_to_str(calc_date), code))
         mkt_cap = None
@@ -82,7 +79,7 @@ class Scale(Factor):
             print(e)
         if mkt_cap is not None:
             # logging.info("[%s'] %s's total mkt cap = %.0f, liquid mkt cap = %.0f" % (Utils.datetimelike_to_str(calc_date), code, mkt_cap.LnTotalMktCap, mkt_cap.LnLiquidMktCap))
-            q.put((Utils.code_to_symbol(code), mkt_cap.LnTotalMktCap, mkt_cap.LnLiquidMktCap))
+            return (Utils.code_to_symbol(code), mkt_cap.LnTotalMktCap, mkt_cap.LnLiquidMktCap)
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -113,7 +110,6 @@ class Scale(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列，计算规模因子值
         dict_scale = None
         for calc_date in trading_days_series:
@@ -121,8 +117,7 @@ class Scale(Factor):
                 continue
             dict_scale = {'date': [], 'id': [], 'LnTotalMktCap':[], 'LnLiquidMktCap': []}
             # 遍历个股，计算个股规模因子值
-            s = (calc_date - datetime.timedelta(days=90)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 90)
 
             # 采用单进程进行计算规模因子
             # for _, stock_info in stock_basics.iterrows():
@@ -134,14 +129,7 @@ class Scale(Factor):
             #         dict_scale['LnLiquidMktCap'].append(round(scale_data.LnLiquidMktCap, 4))
 
             # 采用多进程并行计算规模因子
-            q = Manager().Queue()   # 队列，用于进程间通信，存储每个进程计算的规模因子值
-            p = Pool(4)             # 进程池，最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-            p.close()
-            p.join()
-            while not q.empty():
-                scale_data = q.get(True)
+            for scale_data in cls._parallel_calc(list(stock_codes), calc_date):
                 dict_scale['id'].append(scale_data[0])
                 dict_scale['LnTotalMktCap'].append(round(scale_data[1], 4))
                 dict_scale['LnLiquidMktCap'].append(round(scale_data[2], 4))
@@ -151,9 +139,8 @@ class Scale(Factor):
             # 保存规模因子载荷至因子数据库
             if save:
                 Utils.factor_loading_persistent(cls._db_file, calc_date.strftime('%Y%m%d'), dict_scale)
-            # 休息60秒
-            logging.info('Suspending for 60s.')
-            time.sleep(60)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         return dict_scale
 
 
@@ -8,7 +8,6 @@
 
 from src.factors.factor import Factor
 import tushare as ts
-import datetime
 import numpy as np
 import os
 import pandas as pd
@@ -16,9 +15,9 @@ from pandas import DataFrame
 from pandas import Series
 import math
 from src.util.utils import Utils, SecuTradingStatus
+from src.util.throttle import ResourceThrottle
 import src.factors.cons as factor_ct
 from src.util.dataapi.CDataHandler import CDataHandler
-from multiprocessing import Pool, Manager
 import logging
 import time
 
@@ -147,39 +146,61 @@ class SmartMoney(Factor):
         #  取得过去30天的交易日期
         trading_days = Utils.get_trading_days(end=calc_date, ndays=30, ascending=False)
         # 取得过去self.__days天交易日的分钟行情数据
-        be_enough, df_min_mkt = Utils.get_min_mkts_fq(code, trading_days, cls.__days)
+        be_enough, min_mkts = Utils.get_min_mkts_fq_arrays(code, trading_days, cls.__days)
         # 计算SmartMoney因子载荷值
         if be_enough:
-            # 1.计算指标S_t = abs(R_t)/sqrt(V_t), R_t=第t分钟涨跌幅, V_t=第t分钟成交量
-            df_min_mkt['ind_s'] = df_min_mkt.apply(lambda x: abs(x.ret)*10000/math.sqrt(x.volume*100.0) if x.volume > 0 else 0, axis=1)
-            # 2.降序排列指标S
-            df_min_mkt = df_min_mkt.sort_values(by='ind_s', ascending=False)
-            # 3.计算累积成交量、累积成交金额
-            df_min_mkt['accum_volume'] = df_min_mkt['volume'].cumsum()
-            df_min_mkt['accum_amount'] = df_min_mkt['amount'].cumsum()
-            # 4.找到累积成交量占比前20%找到累积成交量占比前20%的交易，视为聪明钱（smart）交易, 那么聪明钱的情绪因子Q=VWAP_{smart}/VWAP_{all}
-            # total_volume = df_min_mkt.iloc[df_min_mkt.shape[0]-1]['accum_volume'] * 100
-            # total_amount = df_min_mkt.iloc[df_min_mkt.shape[0]-1]['accum_amount']
-            # smart_volume = int(df_min_mkt.iloc[df_min_mkt.shape[0]-1]['accum_volume'] * 0.2)
-            total_volume = df_min_mkt.iloc[-1].accum_volume * 100
-            total_amount = df_min_mkt.iloc[-1].accum_amount
-            smart_volume = int(df_min_mkt.iloc[-1].accum_volume * 0.2)
-            vwap_all = total_amount / total_volume
-            # vwap_smart = 0.0
-            smart_mkt = df_min_mkt[df_min_mkt.accum_volume > smart_volume].iloc[0]
-            vwap_smart = smart_mkt.accum_amount / (smart_mkt.accum_volume*100.0)
-            # for row in df_min_mkt.itertuples():
-            #     if row.accum_volume > smart_volume:
-            #         vwap_smart = row.accum_amount / (row.accum_volume*100.0)
-            #         break
-            smart_q = round(vwap_smart / vwap_all, 6)
+            smart_q = _smartq_kernel(min_mkts['ret'], min_mkts['volume'], min_mkts['amount'])
         else:
             smart_q = None
         # 返回个股的SmartMoney因子载荷值
         return smart_q
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_batch(cls, codes, calc_date):
+        """
+        批量计算指定日期、一组个股的聪明钱因子载荷
+        Parameters
+        --------
+        :param codes: list of str
+            个股代码列表，如SH600000或600000
+        :param calc_date: datetime-like, str
+            计算日期
+        :return: pd.Series
+            个股的SmartQ因子载荷值，index为个股代码(如SH600000)，不包含无法计算的个股
+        """
+        #  取得过去30天的交易日期
+        trading_days = Utils.get_trading_days(end=calc_date, ndays=30, ascending=False)
+        # 取得每个个股过去self.__days天交易日的分钟行情数据，首尾相接
+        symbols = []
+        rets = []
+        volumes = []
+        amounts = []
+        for code in codes:
+            be_enough, min_mkts = Utils.get_min_mkts_fq_arrays(code, trading_days, cls.__days)
+            if be_enough:
+                symbols.append(Utils.code_to_symbol(code))
+                rets.append(min_mkts['ret'])
+                volumes.append(min_mkts['volume'])
+                amounts.append(min_mkts['amount'])
+        if len(symbols) == 0:
+            return Series(dtype=np.float64)
+        offsets = np.zeros(len(symbols)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(arr_ret) for arr_ret in rets])
+        smart_qs = _smartq_kernel_batch(np.concatenate(rets), np.concatenate(volumes), np.concatenate(amounts), offsets)
+        smart_qs = Series(smart_qs, index=symbols)
+        return smart_qs[smart_qs.notnull()]
+
+    @classmethod
+    def _result_cache_params(cls):
+        return factor_ct.SMARTMONEY_CT
+
+    @classmethod
+    def _result_cache_inputs(cls, code, calc_date):
+        trading_days = Utils.get_trading_days(end=calc_date, ndays=30, ascending=False)
+        return Utils.get_min_mkt_files(code, trading_days, fq=True)
+
+    @classmethod
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters
@@ -188,8 +209,7 @@ class SmartMoney(Factor):
             个股代码，如600000或SH600000
         :param trading_days: datetime-like or str
             计算日期
-        :param q: 队列，用于进程间通信
-        :return: 添加因子载荷至队列q中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc SmartQ of %s.' % (calc_date.strftime('%Y-%m-%d'), code))
         smart_q = None
@@ -198,7 +218,7 @@ class SmartMoney(Factor):
         except Exception as e:
             print(e)
         if smart_q is not None:
-            q.put((Utils.code_to_symbol(code), smart_q))
+            return (Utils.code_to_symbol(code), smart_q)
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -213,6 +233,9 @@ class SmartMoney(Factor):
         :param month_end: bool，默认True
             只计算月末时点的因子载荷
         :param save: 是否保存至因子数据库，默认为False
+        :param kwargs:
+            'batch': bool, 默认False
+                是否批量计算全部个股的因子载荷
         :return: 因子载荷，DataFrame
         --------
             因子载荷,DataFrame
@@ -230,7 +253,6 @@ class SmartMoney(Factor):
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
         # 取得样本个股信息
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列，计算SMartQ因子载荷
         dict_factor = None
         for calc_date in trading_days_series:
@@ -242,8 +264,7 @@ class SmartMoney(Factor):
             # trading_days = Utils.get_trading_days(end=calc_date, ndays=30, ascending=False)
             # 2.取得样本个股信息
             # stock_basics = ts.get_stock_basics()
-            s = (calc_date - datetime.timedelta(days=90)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 90)
             # 3.遍历样本个股代码，计算Smart_Q因子载荷值
             dict_factor = {'id': [], 'factorvalue': []}
 
@@ -257,17 +278,16 @@ class SmartMoney(Factor):
             #         dict_factor['id'].append(Utils.code_to_symbol(stock_info.symbol))
             #         dict_factor['factorvalue'].append(factor_loading)
 
-            # 采用多进程并行计算SmartQ因子载荷
-            q = Manager().Queue()   # 队列，用于进程间通信，存储每个进程计算的因子载荷值
-            p = Pool(4)             # 进程池，最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-            p.close()
-            p.join()
-            while not q.empty():
-                smart_q = q.get(True)
-                dict_factor['id'].append(smart_q[0])
-                dict_factor['factorvalue'].append(smart_q[1])
+            if kwargs.get('batch', False):
+                # 批量计算SmartQ因子载荷
+                smart_qs = cls._calc_factor_loading_batch(list(stock_codes), calc_date)
+                dict_factor['id'] = list(smart_qs.index)
+                dict_factor['factorvalue'] = list(smart_qs)
+            else:
+                # 采用多进程并行计算SmartQ因子载荷
+                for smart_q in cls._parallel_calc(list(stock_codes), calc_date):
+                    dict_factor['id'].append(smart_q[0])
+                    dict_factor['factorvalue'].append(smart_q[1])
 
             date_label = Utils.get_trading_days(calc_date, ndays=2)[1]
             dict_factor['date'] = [date_label] * len(dict_factor['id'])
@@ -279,12 +299,162 @@ class SmartMoney(Factor):
                 # finally:
                 #     db.close()
                 Utils.factor_loading_persistent(cls._db_file, calc_date.strftime('%Y%m%d'), dict_factor)
-            # 休息300秒
-            logging.info('Suspending for 360s.')
-            time.sleep(360)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
+        # 计算结果磁盘缓存超过大小上限时淘汰最久未使用的结果
+        cls._evict_result_cache()
         return dict_factor
 
 
+def _smartq_dataframe(df_min_mkt):
+    """
+    按DataFrame逐行计算SmartQ因子载荷值(原实现), 用于与_smartq_kernel对比
+    :param df_min_mkt: pd.DataFrame
+        Utils.get_min_mkts_fq返回的分钟行情数据
+    :return: float
+    """
+    # 1.计算指标S_t = abs(R_t)/sqrt(V_t), R_t=第t分钟涨跌幅, V_t=第t分钟成交量
+    df_min_mkt['ind_s'] = df_min_mkt.apply(lambda x: abs(x.ret)*10000/math.sqrt(x.volume*100.0) if x.volume > 0 else 0, axis=1)
+    # 2.降序排列指标S
+    df_min_mkt = df_min_mkt.sort_values(by='ind_s', ascending=False)
+    # 3.计算累积成交量、累积成交金额
+    df_min_mkt['accum_volume'] = df_min_mkt['volume'].cumsum()
+    df_min_mkt['accum_amount'] = df_min_mkt['amount'].cumsum()
+    # 4.找到累积成交量占比前20%的交易，视为聪明钱（smart）交易, 那么聪明钱的情绪因子Q=VWAP_{smart}/VWAP_{all}
+    total_volume = df_min_mkt.iloc[-1].accum_volume * 100
+    total_amount = df_min_mkt.iloc[-1].accum_amount
+    smart_volume = int(df_min_mkt.iloc[-1].accum_volume * 0.2)
+    vwap_all = total_amount / total_volume
+    smart_mkt = df_min_mkt[df_min_mkt.accum_volume > smart_volume].iloc[0]
+    vwap_smart = smart_mkt.accum_amount / (smart_mkt.accum_volume*100.0)
+    return round(vwap_smart / vwap_all, 6)
+
+
+def _smartq_ind_s(ret, volume):
+    """计算指标S_t = abs(R_t)/sqrt(V_t), 成交量为0的分钟S_t=0"""
+    positive = volume > 0
+    return np.where(positive, np.abs(ret)*10000/np.sqrt(np.where(positive, volume, 1.)*100.0), 0.)
+
+
+def _desc_order(values):
+    """
+    降序排列的索引, 取值相同元素的先后顺序及NaN(排在最后)的处理与pd.DataFrame.sort_values(ascending=False)一致
+    """
+    idx = np.arange(len(values))
+    mask = np.isnan(values)
+    non_nan_idx = idx[~mask][::-1]
+    order = non_nan_idx[values[~mask][::-1].argsort(kind='quicksort')][::-1]
+    return np.concatenate((order, idx[mask]))
+
+
+def _nan_cumsum(arr):
+    """累积求和, 与pd.Series.cumsum一致: 跳过NaN, NaN位置的结果为NaN"""
+    result = np.nancumsum(arr)
+    result[np.isnan(arr)] = np.nan
+    return result
+
+
+def _smartq_kernel(ret, volume, amount):
+    """
+    计算SmartQ因子载荷值, 与按DataFrame逐行计算(_smartq_dataframe)的结果一致
+    Parameters
+    --------
+    :param ret: np.array
+        N个交易日首尾相接的每分钟涨跌幅
+    :param volume: np.array
+        对应的每分钟成交量(手)
+    :param amount: np.array
+        对应的每分钟成交金额(元)
+    :return: float
+        SmartQ因子载荷值，无法计算返回None
+    """
+    if len(ret) == 0:
+        return None
+    # 1.计算指标S_t = abs(R_t)/sqrt(V_t), R_t=第t分钟涨跌幅, V_t=第t分钟成交量
+    ind_s = _smartq_ind_s(ret, volume)
+    # 2.降序排列指标S
+    order = _desc_order(ind_s)
+    # 3.计算累积成交量、累积成交金额
+    accum_volume = _nan_cumsum(volume[order])
+    accum_amount = _nan_cumsum(amount[order])
+    # 4.找到累积成交量占比前20%的交易，视为聪明钱（smart）交易, 那么聪明钱的情绪因子Q=VWAP_{smart}/VWAP_{all}
+    if np.isnan(accum_volume[-1]):
+        return None
+    total_volume = accum_volume[-1] * 100
+    total_amount = accum_amount[-1]
+    smart_volume = int(accum_volume[-1] * 0.2)
+    vwap_all = total_amount / total_volume
+    smart_idx = np.nonzero(accum_volume > smart_volume)[0]
+    if len(smart_idx) == 0:
+        return None
+    k = smart_idx[0]
+    vwap_smart = accum_amount[k] / (accum_volume[k]*100.0)
+    return round(vwap_smart / vwap_all, 6)
+
+
+def _smartq_kernel_batch(ret, volume, amount, offsets):
+    """
+    批量计算一组个股的SmartQ因子载荷值, 结果与_smartq_kernel一致
+    Parameters
+    --------
+    :param ret: np.array
+        全部个股首尾相接的每分钟涨跌幅
+    :param volume: np.array
+        对应的每分钟成交量(手)
+    :param amount: np.array
+        对应的每分钟成交金额(元)
+    :param offsets: np.array of int
+        每个个股的数据在数组中的起止位置, 长度=个股数量+1
+    :return: np.array
+        各个股的SmartQ因子载荷值，无法计算的为NaN
+    """
+    smart_qs = np.full(len(offsets)-1, np.nan)
+    for k in range(len(offsets)-1):
+        start, end = offsets[k], offsets[k+1]
+        smart_q = _smartq_kernel(ret[start:end], volume[start:end], amount[start:end])
+        if smart_q is not None:
+            smart_qs[k] = smart_q
+    return smart_qs
+
+
+def smartq_kernel_benchmark(num_stocks=50, seed=0):
+    """
+    对比按DataFrame逐行计算与_smartq_kernel、_smartq_kernel_batch计算SmartQ因子载荷的耗时, 并校验计算结果一致
+    采用随机生成的SmartMoney.__days个交易日、每日240分钟的分钟行情数据
+    Parameters
+    --------
+    :param num_stocks: int, 默认50
+        个股数量
+    :param seed: int, 默认0
+        随机数种子
+    :return: dict
+        每个个股的平均耗时(秒), key为'dataframe', 'kernel', 'batch'
+    """
+    rng = np.random.RandomState(seed)
+    length = factor_ct.SMARTMONEY_CT.days_num * 240
+    rets = [rng.normal(0., 0.001, length).round(4) for _ in range(num_stocks)]
+    volumes = [rng.poisson(50, length).astype(np.float64) for _ in range(num_stocks)]
+    amounts = [volume * 100 * rng.uniform(9.9, 10.1, length) for volume in volumes]
+    cost = {}
+    start = time.time()
+    df_smart_qs = [_smartq_dataframe(DataFrame({'ret': ret, 'volume': volume, 'amount': amount}))
+                   for ret, volume, amount in zip(rets, volumes, amounts)]
+    cost['dataframe'] = (time.time() - start) / num_stocks
+    start = time.time()
+    kernel_smart_qs = [_smartq_kernel(ret, volume, amount) for ret, volume, amount in zip(rets, volumes, amounts)]
+    cost['kernel'] = (time.time() - start) / num_stocks
+    start = time.time()
+    offsets = np.arange(num_stocks+1) * length
+    batch_smart_qs = _smartq_kernel_batch(np.concatenate(rets), np.concatenate(volumes), np.concatenate(amounts), offsets)
+    cost['batch'] = (time.time() - start) / num_stocks
+    assert df_smart_qs == kernel_smart_qs
+    assert df_smart_qs == list(batch_smart_qs)
+    logging.info('SmartQ per-stock cost: dataframe=%.6fs, kernel=%.6fs(x%.1f), batch=%.6fs(x%.1f)' %
+                 (cost['dataframe'], cost['kernel'], cost['dataframe']/cost['kernel'],
+                  cost['batch'], cost['dataframe']/cost['batch']))
+    return cost
+
+
 def smartq_backtest(start, end):
     """
     SmartQ因子的历史回测
@@ -331,17 +501,13 @@ def smartq_backtest(start, end):
             factor_data = Utils.read_factor_loading(SmartMoney.get_db_file(), Utils.datetimelike_to_str(prev_trading_day, False))
             # 遍历factor_data, 计算每个个股过去20天的涨跌幅，并剔除在调仓日没有正常交易（如停牌）及涨停的个股
             ind_to_be_deleted = []
-            factor_data['ret20'] = np.zeros(len(factor_data))
+            factor_data['ret20'] = Utils.trailing_returns(factor_data['id'], prev_trading_day, 20).values
             for ind, factor_info in factor_data.iterrows():
                 trading_status = Utils.trading_status(factor_info.id, trading_day)
                 if trading_status == SecuTradingStatus.Suspend or trading_status == SecuTradingStatus.LimitUp:
                     ind_to_be_deleted.append(ind)
-                fret20 = Utils.calc_interval_ret(factor_info.id, end=prev_trading_day, ndays=20)
-                if fret20 is None:
-                    if ind not in ind_to_be_deleted:
-                        ind_to_be_deleted.append(ind)
-                else:
-                    factor_data.loc[ind, 'ret20'] = fret20
+                elif np.isnan(factor_info.ret20):
+                    ind_to_be_deleted.append(ind)
             factor_data = factor_data.drop(ind_to_be_deleted, axis=0)
             # 对factor_data过去20天涨跌幅降序排列，剔除涨幅最大的20%个股
             k = int(factor_data.shape[0]*0.2)
@@ -366,9 +532,8 @@ def smartq_backtest(start, end):
                                           'port_data_%s.csv' % Utils.datetimelike_to_str(trading_day, False))
             factor_data.to_csv(port_data_path, index=False)
             t += 1
-            if t % 6 == 0:
-                logging.info('Suspended for 300s.')
-                time.sleep(300)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         else:
             # 非调仓日，对组合进行估值
             logging.info('[%s] 月中估值.' % Utils.datetimelike_to_str(trading_day, True))
@@ -11,13 +11,12 @@ from src.factors.factor import Factor
 import src.factors.cons as factor_ct
 import src.util.cons as util_ct
 from src.util.utils import Utils
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import CDataHandler
-from pandas import Series
+from pandas import Series, DataFrame
+import numpy as np
 import os
-import datetime
 import logging
-from multiprocessing import Pool, Manager
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -77,7 +76,57 @@ class Value(Factor):
         return Series([round(ep_ttm, 6), round(bp_lr, 6), round(ocf_ttm, 6)], index=['ep_ttm', 'bp_lr', 'ocf_ttm'])
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_batch(cls, codes, calc_date):
+        """
+        批量计算指定日期、一组个股的价值因子，计算规则与_calc_factor_loading一致
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表，如600000或SH600000
+        :param calc_date: datetime-like or str
+            计算日期，格式YYYY-MM-DD, YYYYMMDD
+        :return: pd.DataFrame
+        --------
+            价值类因子值
+            0. id: 证券代码
+            1. ep_ttm: TTM净利润/总市值
+            2. bp_lr: 净资产（最新财报）/总市值
+            3. ocf_ttm: TTM经营性现金流/总市值
+            不包含计算失败的个股
+        """
+        calc_date = Utils.to_date(calc_date)
+        # 读取TTM财务数据
+        ttm_fin_data = Utils.get_ttm_fin_basic_data_panel(codes, calc_date)
+        # 读取最新财报数据
+        report_date = Utils.get_fin_report_date(calc_date)
+        fin_basic_data = Utils.get_fin_basic_data_panel(ttm_fin_data.index, report_date, ['ShareHolderEquity'])
+        # 读取股本结构数据
+        cap_struct = Utils.get_cap_struct_panel(fin_basic_data.index, calc_date)
+        # 读取收盘价
+        symbols = []
+        closes = []
+        for symbol in cap_struct.index:
+            try:
+                mkt_daily = Utils.get_secu_daily_mkt(symbol, calc_date, fq=False, range_lookup=True)
+            except IndexError:
+                continue
+            if mkt_daily is None or mkt_daily.shape[0] == 0:
+                continue
+            symbols.append(symbol)
+            closes.append(mkt_daily.close)
+        # 计算总市值
+        cap_struct = cap_struct.loc[symbols]
+        total_cap = cap_struct['total'] - cap_struct['liquid_b'] - cap_struct['liquid_h']
+        total_mkt_cap = total_cap.values * np.array(closes, dtype=np.float64)
+        # 计算价值类因子
+        ep_ttm = ttm_fin_data.loc[symbols, 'NetProfit'].values * util_ct.FIN_DATA_AMOUNT_UNIT / total_mkt_cap
+        ocf_ttm = ttm_fin_data.loc[symbols, 'NetOperateCashFlow'].values * util_ct.FIN_DATA_AMOUNT_UNIT / total_mkt_cap
+        bp_lr = fin_basic_data.loc[symbols, 'ShareHolderEquity'].values * util_ct.FIN_DATA_AMOUNT_UNIT / total_mkt_cap
+        return DataFrame({'id': symbols, 'ep_ttm': np.round(ep_ttm, 6), 'bp_lr': np.round(bp_lr, 6), 'ocf_ttm': np.round(ocf_ttm, 6)},
+                         columns=['id', 'ep_ttm', 'bp_lr', 'ocf_ttm'])
+
+    @classmethod
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -86,8 +135,7 @@ class Value(Factor):
             个股代码，如600000或SH600000
         :param calc_date: datetime-like or str
             计算日期，格式：YYYY-MM-DD or YYYYMMMDD
-        :param q: 队列，用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc Value factor of %s.' % (Utils.datetimelike_to_str(calc_date), code))
         value = None
@@ -97,7 +145,7 @@ class Value(Factor):
             print(e)
         if value is not None:
             value['id'] = Utils.code_to_symbol(code)
-            q.put(value)
+            return value
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -114,6 +162,9 @@ class Value(Factor):
             如果为True，则只计算月末时点的因子载荷
         :param save: bool, 默认False
             是否保存至因子数据库
+        :param kwargs:
+            'batch': bool, 默认False
+                是否从财务数据合并存储批量计算全部个股的因子载荷
         :return: 因子载荷，pd.DataFrame
         --------
             因子载荷，pd.DataFrame
@@ -125,7 +176,6 @@ class Value(Factor):
         """
         # 取得交易日序列及股票基本信息表
         trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列，计算价值因子载荷
         dict_value = None
         for calc_date in trading_days_series:
@@ -133,8 +183,7 @@ class Value(Factor):
                 continue
             dict_value = {'date': [], 'id': [], 'ep_ttm': [], 'bp_lr': [], 'ocf_ttm': []}
             # 遍历个股，计算个股价值因子载荷
-            s = (calc_date - datetime.timedelta(days=90)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 90)
 
             # 采用单进程进行计算价值因子
             # for _, stock_info in stock_basics.iterrows():
@@ -146,19 +195,18 @@ class Value(Factor):
             #         dict_value['bp_lr'].append(value_data['bp_lr'])
             #         dict_value['ocf_ttm'].append(value_data['ocf_ttm'])
 
-            # 采用多进程并行计算价值因子
-            q = Manager().Queue()   # 队列，用于进程间通信，存储每个进程计算的因子载荷
-            p = Pool(4)             # 进程池，最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-            p.close()
-            p.join()
-            while not q.empty():
-                value_data = q.get(True)
-                dict_value['id'].append(value_data['id'])
-                dict_value['ep_ttm'].append(value_data['ep_ttm'])
-                dict_value['bp_lr'].append(value_data['bp_lr'])
-                dict_value['ocf_ttm'].append(value_data['ocf_ttm'])
+            if kwargs.get('batch', False):
+                # 批量计算价值因子
+                df_value = cls._calc_factor_loading_batch(list(stock_codes), calc_date)
+                for col in ['id', 'ep_ttm', 'bp_lr', 'ocf_ttm']:
+                    dict_value[col] = list(df_value[col])
+            else:
+                # 采用多进程并行计算价值因子
+                for value_data in cls._parallel_calc(list(stock_codes), calc_date):
+                    dict_value['id'].append(value_data['id'])
+                    dict_value['ep_ttm'].append(value_data['ep_ttm'])
+                    dict_value['bp_lr'].append(value_data['bp_lr'])
+                    dict_value['ocf_ttm'].append(value_data['ocf_ttm'])
 
             date_label = Utils.get_trading_days(start=calc_date, ndays=2)[1]
             dict_value['date'] = [date_label] * len(dict_value['id'])
@@ -166,9 +214,8 @@ class Value(Factor):
             if save:
                 columns=['date', 'id', 'ep_ttm', 'bp_lr', 'ocf_ttm']
                 Utils.factor_loading_persistent(cls._db_file, calc_date.strftime('%Y%m%d'), dict_value, columns)
-            # 休息120秒
-            logging.info('Suspending for 120s.')
-            time.sleep(120)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         return dict_value
 
 
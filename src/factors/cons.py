@@ -41,8 +41,13 @@ INTRADAYMOMENTUM_CT = DottableDict({'days_num': 20,
 #                        })
 
 # CYQ筹码分布因子的配置参数
-CYQ_CT = DottableDict({'db_file': 'Sentiment/CYQ/',                     # 筹码分布因子载荷的保存文件相对路径
+CYQ_CT = DottableDict({'days_num': 60,                                  # 计算筹码分布代理变量所需日K线行情的天数
+                       'db_file': 'Sentiment/CYQ/',                     # 筹码分布因子载荷的保存文件相对路径
+                       'proxies_db_file': 'Sentiment/CYQ/CYQ_proxies',  # 筹码分布代理变量的保存文件相对路径名
+                       'proxies_weight_file': 'Sentiment/CYQ/CYQ_weight.csv',   # 筹码分布代理变量权重文件相对路径名
+                       'proxies_stats_file': 'Sentiment/CYQ/CYQ_proxies_stats.pack',  # 代理变量回归充分统计量文件相对路径名
                        'CYQ_rp_file': 'cyq_rp/CYQ_rp',                  # 筹码分布相对价格因子保存文件的相对路径
+                       'state_path': 'cyq_state',                       # 个股筹码分布状态文件的保存目录(相对于db_file)
                        'backtext_path': 'FactorBackTest/CYQ'            # 历史回测结果文件的相对路径
                        })
 # 规模因子的配置参数
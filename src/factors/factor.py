@@ -7,11 +7,15 @@
 
 
 from src.util.utils import Utils
+from src.util.executor import ComputeExecutor
+from src.util.resultcache import ResultCache
+from src.util import cons as util_ct
 import src.factors.cons as factor_ct
 import pandas as pd
 from pandas import Series
 import numpy as np
 import os
+from functools import partial
 
 class Factor(object):
     """因子基类"""
@@ -65,7 +69,7 @@ class Factor(object):
         pass
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters
@@ -74,11 +78,79 @@ class Factor(object):
             个股代码，如果600000
         :param calc_date: datetime like or str
             计算日期，格式YYYY-MM-DD
-        :param q: 队列，用于进程间通信
-        :return: 添加因子载荷至队列q中
+        :return: 因子载荷，无法计算时返回None
         """
         pass
 
+    @classmethod
+    def _result_cache_params(cls):
+        """
+        计算结果磁盘缓存key包含的因子配置参数, 返回None时不缓存计算结果
+        子类启用缓存时返回其配置参数(如factor_ct.SMARTMONEY_CT), 并实现_result_cache_inputs
+        :return: dict
+        """
+        return None
+
+    @classmethod
+    def _result_cache_inputs(cls, code, calc_date):
+        """
+        计算个股因子载荷所读取的输入文件, 其修改时间包含在计算结果磁盘缓存的key中
+        :param code: str
+            个股代码
+        :param calc_date: datetime like
+            计算日期
+        :return: list of str
+        """
+        return []
+
+    @classmethod
+    def _calc_factor_loading_proc_cached(cls, code, calc_date, proc='_calc_factor_loading_proc'):
+        """
+        用于并行计算因子载荷, 优先读取计算结果磁盘缓存, 缓存中没有时计算并保存至缓存
+        参数及返回值同_calc_factor_loading_proc, proc为实际计算所用的类方法名称
+        只缓存计算成功的结果, 返回None的个股每次都重新计算
+        """
+        key = ResultCache.make_key('%s.%s.%s' % (cls.__module__, cls.__name__, proc), code, calc_date,
+                                   cls._result_cache_params(), cls._result_cache_inputs(code, calc_date))
+        found, result = ResultCache.get(key)
+        if not found or result is None:
+            result = getattr(cls, proc)(code, calc_date)
+            # 计算失败(返回None)时不缓存, 可能是读取数据时的临时错误, 重新计算时再次尝试
+            if result is not None:
+                ResultCache.put(key, result)
+        return result
+
+    @classmethod
+    def _parallel_calc(cls, codes, calc_date, proc='_calc_factor_loading_proc'):
+        """
+        在共享进程池中并行计算一组个股的因子载荷
+        Parameters
+        --------
+        :param codes: list of str
+            个股代码列表
+        :param calc_date: datetime like or str
+            计算日期，格式YYYY-MM-DD
+        :param proc: str, 默认'_calc_factor_loading_proc'
+            计算单个个股所用的类方法名称
+        :return: list
+            各个股_calc_factor_loading_proc的返回值(不包含None)，顺序与codes不一定一致
+            因子启用计算结果磁盘缓存时(见_result_cache_params), 已计算过且输入未变化的个股直接读取缓存
+        """
+        if util_ct.USING_RESULT_CACHE and cls._result_cache_params() is not None:
+            func = partial(cls._calc_factor_loading_proc_cached, calc_date=calc_date, proc=proc)
+        else:
+            func = partial(getattr(cls, proc), calc_date=calc_date)
+        return [result for result in ComputeExecutor.imap_unordered(func, codes) if result is not None]
+
+    @classmethod
+    def _evict_result_cache(cls):
+        """
+        因子启用计算结果磁盘缓存时, 缓存总大小超过上限则淘汰最久未使用的结果
+        淘汰需遍历全部缓存文件, 因此在calc_factor_loading计算完全部日期后调用一次, 不在每个计算日期调用
+        """
+        if util_ct.USING_RESULT_CACHE and cls._result_cache_params() is not None:
+            ResultCache.evict()
+
     @classmethod
     def get_dependent_factors(cls, date):
         """
@@ -11,6 +11,8 @@ from src.factors.factor import Factor
 import src.riskmodel.riskfactors.cons as risk_ct
 import src.factors.cons as factor_ct
 from src.util.utils import Utils
+from src.util.throttle import ResourceThrottle
+from src.util.ewma import EWMA
 # import src.util.cons as util_ct
 from src.util.dataapi.CDataHandler import CDataHandler
 import pandas as pd
@@ -18,9 +20,6 @@ import numpy as np
 import logging
 import os
 import statsmodels.api as sm
-import datetime
-from multiprocessing import Pool, Manager
-import time
 
 
 logging.basicConfig(level=logging.INFO,
@@ -69,13 +68,7 @@ class BETA(Factor):
         arr_benchmark_preclose = np.array(df_benchmark_quote.shift(1).iloc[1:]['close'])
         arr_benchmark_daily_ret = arr_benchmark_close / arr_benchmark_preclose - 1.
         # 计算权重(指数移动加权平均)
-        T = len(arr_benchmark_daily_ret)
-        time_spans = sorted(range(T), reverse=True)
-        alpha = 1 - np.exp(np.log(0.5)/risk_ct.BETA_CT.half_life)
-        x = [1-alpha] * T
-        y = [alpha] * (T-1)
-        y.insert(0, 1)
-        weights = np.float_power(x, time_spans) * y
+        weights = EWMA.get_weights(len(arr_benchmark_daily_ret), risk_ct.BETA_CT.half_life)
         # 采用加权最小二乘法计算Beta因子载荷及hsigma
         arr_benchmark_daily_ret = sm.add_constant(arr_benchmark_daily_ret)
         cap_model = sm.WLS(arr_secu_daily_ret, arr_benchmark_daily_ret, weights=weights)
@@ -85,7 +78,63 @@ class BETA(Factor):
         return pd.Series([Utils.code_to_symbol(code), beta, hsigma], index=['code', 'beta', 'hsigma'])
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_batch(cls, codes, calc_date, panels=None):
+        """
+        批量计算指定日期、一组个股的BETA因子载荷
+        计算方法与_calc_factor_loading一致, 所有个股共用半衰期权重和基准日收益率, 采用加权最小二乘的解析解一次计算
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表, 如600000或SH600000
+        :param calc_date: datetime-like, str
+            计算日期, 格式YYYY-MM-DD
+        :param panels: tuple(DailyPanel, DailyPanel), 默认None
+            个股和基准的复权收盘价面板数据, 须覆盖计算日期, 为None时读取
+        :return: tuple(pd.DataFrame, list)
+        --------
+            0. 个股的BETA因子和HSIGMA因子载荷, columns=['code', 'beta', 'hsigma']
+            1. 面板数据内行情数据不足的个股代码列表, 这些个股需逐个计算
+        """
+        calc_date = Utils.to_date(calc_date)
+        if panels is None:
+            panels = cls._load_panels(calc_date, calc_date)
+        secu_panel, benchmark_panel = panels
+        trailing = risk_ct.BETA_CT.trailing
+        symbols = np.array([Utils.code_to_symbol(code) for code in codes])
+        cols = secu_panel.symbol_index(symbols)
+        in_panel = cols >= 0
+        # 取得个股及基准在个股最近trailing+1个交易日的复权收盘价
+        arr_secu_close, arr_rows, ok = secu_panel.tail('close', secu_panel.date_index(calc_date), trailing+1, cols[in_panel])
+        arr_benchmark_close = benchmark_panel['close'][:, 0][arr_rows]
+        ok &= ~np.isnan(arr_benchmark_close).any(axis=0)
+        arr_secu_close = arr_secu_close[:, ok]
+        arr_benchmark_close = arr_benchmark_close[:, ok]
+        # 计算个股和基准的日收益率序列
+        arr_secu_daily_ret = arr_secu_close[1:] / arr_secu_close[:-1] - 1.
+        arr_benchmark_daily_ret = arr_benchmark_close[1:] / arr_benchmark_close[:-1] - 1.
+        # 采用加权最小二乘法计算Beta因子载荷及hsigma
+        weights = EWMA.get_weights(trailing, risk_ct.BETA_CT.half_life)
+        betas, hsigmas = _wls_beta(arr_secu_daily_ret, arr_benchmark_daily_ret, weights)
+        df_beta = pd.DataFrame({'code': symbols[in_panel][ok].tolist(), 'beta': betas, 'hsigma': hsigmas},
+                               columns=['code', 'beta', 'hsigma'])
+        fallback_codes = np.array(codes)[~in_panel].tolist() + np.array(codes)[in_panel][~ok].tolist()
+        return df_beta, fallback_codes
+
+    @classmethod
+    def _load_panels(cls, start_date, end_date):
+        """
+        读取批量计算所需的个股和基准复权收盘价面板数据
+        面板数据自start_date向前多取一倍的回溯交易日, 以覆盖停牌较多的个股
+        :return: tuple(DailyPanel, DailyPanel)
+        """
+        panel_start = Utils.get_trading_days(end=start_date, ndays=2*(risk_ct.BETA_CT.trailing+1)).iloc[0]
+        secu_panel = Utils.get_daily_panel(['close'], panel_start, end_date, fq=True)
+        benchmark_panel = Utils.get_daily_panel(['close'], panel_start, end_date, fq=True,
+                                                symbols=[risk_ct.BETA_CT.benchmark])
+        return secu_panel, benchmark_panel
+
+    @classmethod
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -94,8 +143,7 @@ class BETA(Factor):
             个股代码, 如600000, SH600000
         :param calc_date: datetime-like or str
             计算日期, 格式: YYYY-MM-DD
-        :param q: 队列, 用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc BETA factor of %s.' % (Utils.datetimelike_to_str(calc_date), code))
         beta_data = None
@@ -104,7 +152,7 @@ class BETA(Factor):
         except Exception as e:
             print(e)
         if beta_data is not None:
-            q.put(beta_data)
+            return beta_data
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -121,6 +169,8 @@ class BETA(Factor):
         :param save: bool, 默认True
             是否保存至因子数据库
         :param kwargs:
+            'batch': bool, 默认False
+                是否采用面板数据批量计算全部个股的因子载荷
         :return: dict
             因子载荷
         """
@@ -131,7 +181,9 @@ class BETA(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
+        batch = kwargs.get('batch', False)
+        if batch:
+            panels = cls._load_panels(trading_days_series.iloc[0], trading_days_series.iloc[-1])
         # 遍历交易日序列, 计算筹码分布因子载荷
         dict_beta = {}
         dict_hsigma = {}
@@ -140,8 +192,7 @@ class BETA(Factor):
                 continue
             logging.info('[%s] Calc BETA factor loading.' % Utils.datetimelike_to_str(calc_date))
             # 遍历个股, 计算个股BETA因子值
-            s = (calc_date - datetime.timedelta(days=180)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, 180)
             ids = []        # 个股代码list
             betas = []      # BETA因子值
             hsigmas = []    # HSIGMA因子值
@@ -155,18 +206,28 @@ class BETA(Factor):
             #         betas.append(beta_data['beta'])
             #         hsigmas.append(beta_data['hsigma'])
 
-            # 采用多进程并行计算BETA因子和HSIGMA因子值
-            q = Manager().Queue()   # 队列, 用于进程间通信, 存储每个进程计算的因子载荷
-            p = Pool(4)             # 进程池, 最多同时开启4个进程
-            for _, stock_info in stock_basics.iterrows():
-                p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-            p.close()
-            p.join()
-            while not q.empty():
-                beta_data = q.get(True)
-                ids.append(beta_data['code'])
-                betas.append(beta_data['beta'])
-                hsigmas.append(beta_data['hsigma'])
+            if batch:
+                # 采用面板数据批量计算BETA因子和HSIGMA因子值, 面板数据内行情不足的个股逐个计算
+                df_beta, fallback_codes = cls._calc_factor_loading_batch(list(stock_codes), calc_date, panels)
+                ids += list(df_beta['code'])
+                betas += list(df_beta['beta'])
+                hsigmas += list(df_beta['hsigma'])
+                for code in fallback_codes:
+                    beta_data = None
+                    try:
+                        beta_data = cls._calc_factor_loading(code, calc_date)
+                    except Exception as e:
+                        print(e)
+                    if beta_data is not None:
+                        ids.append(beta_data['code'])
+                        betas.append(beta_data['beta'])
+                        hsigmas.append(beta_data['hsigma'])
+            else:
+                # 采用多进程并行计算BETA因子和HSIGMA因子值
+                for beta_data in cls._parallel_calc(list(stock_codes), calc_date):
+                    ids.append(beta_data['code'])
+                    betas.append(beta_data['beta'])
+                    hsigmas.append(beta_data['hsigma'])
 
             date_label = Utils.get_trading_days(calc_date, ndays=2)[1]
             dict_beta = {'date': [date_label]*len(ids), 'id': ids, 'factorvalue': betas}
@@ -175,12 +236,34 @@ class BETA(Factor):
                 Utils.factor_loading_persistent(cls._db_file, Utils.datetimelike_to_str(calc_date, dash=False), dict_beta, ['date', 'id', 'factorvalue'])
                 hsigma_path = os.path.join(factor_ct.FACTOR_DB.db_path, risk_ct.HSIGMA_CT.db_file)
                 Utils.factor_loading_persistent(hsigma_path, Utils.datetimelike_to_str(calc_date, dash=False), dict_hsigma, ['date', 'id', 'factorvalue'])
-            # 休息180秒
-            logging.info('Suspending for 180s.')
-            time.sleep(180)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         return dict_beta
 
 
+def _wls_beta(arr_secu_ret, arr_benchmark_ret, weights):
+    """
+    对每个个股的收益率序列, 以基准收益率为自变量(带截距项)做加权最小二乘回归
+    Parameters:
+    --------
+    :param arr_secu_ret: np.array, T × M
+        个股日收益率, 每列为一个个股
+    :param arr_benchmark_ret: np.array, T × M
+        与个股日期对应的基准日收益率
+    :param weights: np.array, T
+        权重
+    :return: tuple(np.array, np.array)
+        各个股的回归系数(beta)及残差标准差(hsigma, 自由度为T-2)
+    """
+    sum_weights = weights.sum()
+    arr_x = arr_benchmark_ret - weights.dot(arr_benchmark_ret) / sum_weights
+    arr_y = arr_secu_ret - weights.dot(arr_secu_ret) / sum_weights
+    betas = weights.dot(arr_x * arr_y) / weights.dot(arr_x * arr_x)
+    arr_resid = arr_y - betas * arr_x
+    hsigmas = np.sqrt(weights.dot(arr_resid * arr_resid) / (len(weights) - 2))
+    return betas, hsigmas
+
+
 if __name__ == '__main__':
     # pass
     BETA.calc_factor_loading(start_date='2017-12-29', end_date=None, month_end=False, save=True)
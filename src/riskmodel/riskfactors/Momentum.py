@@ -11,14 +11,13 @@ from src.factors.factor import Factor
 import src.riskmodel.riskfactors.cons as risk_ct
 import src.factors.cons as factor_ct
 from src.util.utils import Utils
+from src.util.throttle import ResourceThrottle
+from src.util.ewma import EWMA, RollingEWMA
 from src.util.dataapi.CDataHandler import CDataHandler
 import pandas as pd
 import numpy as np
 import logging
 import os
-import datetime
-from multiprocessing import Pool, Manager
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -58,19 +57,86 @@ class RSTR(Factor):
         arr_secu_preclose = np.array(df_secu_quote.shift(1).iloc[1:]['close'])
         arr_secu_daily_ret = np.log(arr_secu_close / arr_secu_preclose)
         # 计算权重(指数移动加权平均)
-        T = len(arr_secu_daily_ret)
-        time_spans = sorted(range(T), reverse=True)
-        alpha = 1 - np.exp(np.log(0.5)/risk_ct.RSTR_CT.half_life)
-        x = [1-alpha] * T
-        y = [alpha] * (T-1)
-        y.insert(0, 1)
-        weights = np.float_power(x, time_spans) * y
+        weights = EWMA.get_weights(len(arr_secu_daily_ret), risk_ct.RSTR_CT.half_life)
         # 计算RSTR
         rstr = np.sum(arr_secu_daily_ret * weights)
         return pd.Series([Utils.code_to_symbol(code), rstr], index=['code', 'rstr'])
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_batch(cls, codes, calc_date, panel=None, rolling_loading=None):
+        """
+        批量计算指定日期、一组个股的RSTR因子载荷
+        计算方法与_calc_factor_loading一致, 所有个股共用同一权重序列, 每个计算日期只需一次矩阵-向量乘法
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表, 如SH600000, 600000
+        :param calc_date: datetime-like, str
+            计算日期, 格式: YYYY-MM-DD
+        :param panel: DailyPanel, 默认None
+            个股复权收盘价面板数据, 须覆盖计算日期, 为None时读取
+        :param rolling_loading: tuple(np.array, np.array), 默认None
+            _calc_factor_loading_rolling滚动计算的面板中全部证券的因子载荷及其是否有效, 不为None时直接取用
+        :return: tuple(pd.DataFrame, list)
+        --------
+            0. 个股的RSTR因子载荷, columns=['code', 'rstr']
+            1. 面板数据内行情数据不足的个股代码列表, 这些个股需逐个计算
+        """
+        calc_date = Utils.to_date(calc_date)
+        if panel is None:
+            panel = cls._load_panel(calc_date, calc_date)
+        symbols = np.array([Utils.code_to_symbol(code) for code in codes])
+        cols = panel.symbol_index(symbols)
+        in_panel = cols >= 0
+        if rolling_loading is not None:
+            ok = rolling_loading[1][cols[in_panel]]
+            rstrs = rolling_loading[0][cols[in_panel]][ok]
+        else:
+            # 取得个股最近的复权收盘价
+            arr_secu_close, _, ok = panel.tail('close', panel.date_index(calc_date), risk_ct.RSTR_CT.trailing_start+1, cols[in_panel])
+            arr_secu_close = arr_secu_close[:, ok]
+            # 剔除最近trailing_end个交易日, 计算个股的日对数收益率
+            arr_secu_close = arr_secu_close[:-risk_ct.RSTR_CT.trailing_end]
+            arr_secu_daily_ret = np.log(arr_secu_close[1:] / arr_secu_close[:-1])
+            # 计算RSTR
+            weights = EWMA.get_weights(len(arr_secu_daily_ret), risk_ct.RSTR_CT.half_life)
+            rstrs = weights.dot(arr_secu_daily_ret)
+        df_rstr = pd.DataFrame({'code': symbols[in_panel][ok].tolist(), 'rstr': rstrs}, columns=['code', 'rstr'])
+        fallback_codes = np.array(codes)[~in_panel].tolist() + np.array(codes)[in_panel][~ok].tolist()
+        return df_rstr, fallback_codes
+
+    @classmethod
+    def _calc_factor_loading_rolling(cls, panel, calc_dates):
+        """
+        沿面板数据的交易日滚动计算全部证券的RSTR因子载荷, 窗口每向前移动一个交易日只需O(1)的更新
+        Parameters:
+        --------
+        :param panel: DailyPanel
+            个股复权收盘价面板数据, 须覆盖全部计算日期
+        :param calc_dates: list of datetime-like
+            升序排列的计算日期
+        :return: generator
+            依次返回每个计算日期的(np.array, np.array), 即面板中全部证券的RSTR因子载荷及其是否有效,
+            窗口内行情数据不足的证券无效
+        """
+        rolling_ewma = RollingEWMA(risk_ct.RSTR_CT.trailing_start - risk_ct.RSTR_CT.trailing_end, risk_ct.RSTR_CT.half_life,
+                                   len(panel.symbols), lag=risk_ct.RSTR_CT.trailing_end)
+        end_idxs = [panel.date_index(Utils.to_date(calc_date)) for calc_date in calc_dates]
+        for _ in rolling_ewma.roll_log_returns(panel['close'], end_idxs):
+            yield rolling_ewma.weighted_sum(), rolling_ewma.ready()
+
+    @classmethod
+    def _load_panel(cls, start_date, end_date):
+        """
+        读取批量计算所需的个股复权收盘价面板数据
+        面板数据自start_date向前多取一倍的回溯交易日, 以覆盖停牌较多的个股
+        :return: DailyPanel
+        """
+        panel_start = Utils.get_trading_days(end=start_date, ndays=2*(risk_ct.RSTR_CT.trailing_start+1)).iloc[0]
+        return Utils.get_daily_panel(['close'], panel_start, end_date, fq=True)
+
+    @classmethod
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -79,8 +145,7 @@ class RSTR(Factor):
             个股代码, 如SH600000, 600000
         :param calc_date: datetime-like, str
             计算日期, 格式: YYYY-MM-DD
-        :param q: 队列, 用于进程间通信
-        :return: 添加因子载荷至队列中
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[%s] Calc RSTR factor of %s.' % (Utils.datetimelike_to_str(calc_date), code))
         rstr_data = None
@@ -89,7 +154,7 @@ class RSTR(Factor):
         except Exception as e:
             print(e)
         if rstr_data is not None:
-            q.put(rstr_data)
+            return rstr_data
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -107,6 +172,10 @@ class RSTR(Factor):
             是否保存至因子数据库
         :param kwargs:
             'multi_proc': bool, True=采用多进程, False=采用单进程, 默认为False
+            'batch': bool, 默认为False
+                是否采用面板数据批量计算全部个股的因子载荷, 为True时忽略multi_proc
+            'rolling': bool, 默认为False
+                是否沿交易日滚动计算因子载荷, 适用于计算较长区间内每个交易日的因子载荷, 为True时忽略multi_proc
         :return: dict
             因子载荷
         """
@@ -117,7 +186,13 @@ class RSTR(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
+        batch = kwargs.get('batch', False)
+        rolling = kwargs.get('rolling', False)
+        if batch or rolling:
+            panel = cls._load_panel(trading_days_series.iloc[0], trading_days_series.iloc[-1])
+        if rolling:
+            calc_dates = [calc_date for calc_date in trading_days_series if (not month_end) or Utils.is_month_end(calc_date)]
+            rolling_loadings = cls._calc_factor_loading_rolling(panel, calc_dates)
         # 遍历交易日序列, 计算RSTR因子载荷
         dict_rstr = {}
         for calc_date in trading_days_series:
@@ -125,31 +200,35 @@ class RSTR(Factor):
                 continue
             logging.info('[%s] Calc RSTR factor loading.' % Utils.datetimelike_to_str(calc_date))
             # 遍历个股, 计算个股的RSTR因子值
-            s = (calc_date - datetime.timedelta(days=risk_ct.RSTR_CT.half_life*3)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, risk_ct.RSTR_CT.half_life*3)
             ids = []        # 个股代码list
             rstrs = []      # RSTR因子值list
 
             if 'multi_proc' not in kwargs:
                 kwargs['multi_proc'] = False
-            if not kwargs['multi_proc']:
+            if batch or rolling:
+                # 采用面板数据批量(或滚动)计算RSTR因子值, 面板数据内行情不足的个股逐个计算
+                rolling_loading = next(rolling_loadings) if rolling else None
+                df_rstr, fallback_codes = cls._calc_factor_loading_batch(list(stock_codes), calc_date, panel,
+                                                                        rolling_loading)
+                ids += list(df_rstr['code'])
+                rstrs += list(df_rstr['rstr'])
+                for code in fallback_codes:
+                    rstr_data = cls._calc_factor_loading(code, calc_date)
+                    if rstr_data is not None:
+                        ids.append(rstr_data['code'])
+                        rstrs.append(rstr_data['rstr'])
+            elif not kwargs['multi_proc']:
                 # 采用单进程计算RSTR因子值
-                for _, stock_info in stock_basics.iterrows():
-                    logging.info("[%s] Calc %s's RSTR factor loading." % (calc_date.strftime('%Y-%m-%d'), stock_info.symbol))
-                    rstr_data = cls._calc_factor_loading(stock_info.symbol, calc_date)
+                for code in stock_codes:
+                    logging.info("[%s] Calc %s's RSTR factor loading." % (calc_date.strftime('%Y-%m-%d'), code))
+                    rstr_data = cls._calc_factor_loading(code, calc_date)
                     if rstr_data is not None:
                         ids.append(rstr_data['code'])
                         rstrs.append(rstr_data['rstr'])
             else:
                 # 采用多进程并行计算RSTR因子值
-                q = Manager().Queue()   # d队列, 用于进程间通信, 存储每个进程计算的因子载荷
-                p = Pool(4)             # 进程池, 最多同时开启4个进程
-                for _, stock_info in stock_basics.iterrows():
-                    p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-                p.close()
-                p.join()
-                while not q.empty():
-                    rstr_data = q.get(True)
+                for rstr_data in cls._parallel_calc(list(stock_codes), calc_date):
                     ids.append(rstr_data['code'])
                     rstrs.append(rstr_data['rstr'])
 
@@ -157,9 +236,8 @@ class RSTR(Factor):
             dict_rstr = {'date': [date_label]*len(ids), 'id': ids, 'factorvalue': rstrs}
             if save:
                 Utils.factor_loading_persistent(cls._db_file, Utils.datetimelike_to_str(calc_date, dash=False), dict_rstr, ['date', 'id', 'factorvalue'])
-            # 暂停180秒
-            logging.info('Suspending for 180s.')
-            time.sleep(180)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         return dict_rstr
 
 
@@ -30,7 +30,7 @@ class NLSIZE(Factor):
         pass
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_proc(cls, code, calc_date):
         pass
 
     @classmethod
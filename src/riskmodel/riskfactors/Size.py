@@ -11,14 +11,12 @@ from src.factors.factor import Factor
 import src.riskmodel.riskfactors.cons as risk_ct
 import src.factors.cons as factor_ct
 from src.util.utils import Utils
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import  CDataHandler
 import pandas as pd
 import numpy as np
 import logging
 import os
-import datetime
-from multiprocessing import Pool, Manager
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -60,7 +58,7 @@ class LNCAP(Factor):
         return pd.Series([Utils.code_to_symbol(code), lncap], index=['code', 'lncap'])
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子载荷
         Parameters:
@@ -69,8 +67,7 @@ class LNCAP(Factor):
             个股代码, 如SH600000, 600000
         :param calc_date: datetime-like, str
             计算日期, 格式: YYYY-MM-DD
-        :param q: 队列, 用于进程间通信
-        :return: 添加因子载荷至队列
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[{}] Calc LNCAP factor of {}.'.format(Utils.datetimelike_to_str(calc_date), code))
         lncap_data = None
@@ -79,7 +76,7 @@ class LNCAP(Factor):
         except Exception as e:
             print(e)
         if lncap_data is not None:
-            q.put(lncap_data)
+            return lncap_data
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -107,7 +104,6 @@ class LNCAP(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列, 计算LNCAP因子载荷
         dict_lncap = None
         for calc_date in trading_days_series:
@@ -115,8 +111,7 @@ class LNCAP(Factor):
                 continue
             logging.info('[%s] Calc LNCAP factor loading.' % Utils.datetimelike_to_str(calc_date))
             # 遍历个股, 计算个股的LNCAP因子值
-            s = (calc_date - datetime.timedelta(days=risk_ct.LNCAP_CT.listed_days)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, risk_ct.LNCAP_CT.listed_days)
             ids = []    # 个股代码list
             lncaps = [] # LNCAP因子值list
 
@@ -124,22 +119,15 @@ class LNCAP(Factor):
                 kwargs['multi_proc'] = False
             if not kwargs['multi_proc']:
                 # 采用单进程计算LNCAP因子值
-                for _, stock_info in stock_basics.iterrows():
-                    logging.info("[%s] Calc %s's LNCAP factor loading." % (calc_date.strftime('%Y-%m-%d'), stock_info.symbol))
-                    lncap_data = cls._calc_factor_loading(stock_info.symbol, calc_date)
+                for code in stock_codes:
+                    logging.info("[%s] Calc %s's LNCAP factor loading." % (calc_date.strftime('%Y-%m-%d'), code))
+                    lncap_data = cls._calc_factor_loading(code, calc_date)
                     if lncap_data is not None:
                         ids.append(lncap_data['code'])
                         lncaps.append(lncap_data['lncap'])
             else:
                 # 采用多进程并行计算LNCAP因子值
-                q = Manager().Queue()   # 队列, 用于进程间通信, 存储每个进程计算的因子载荷
-                p = Pool(4)             # 进程池, 最多同时开启4个进程
-                for _, stock_info in stock_basics.iterrows():
-                    p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-                p.close()
-                p.join()
-                while not q.empty():
-                    lncap_data = q.get(True)
+                for lncap_data in cls._parallel_calc(list(stock_codes), calc_date):
                     ids.append(lncap_data['code'])
                     lncaps.append(lncap_data['lncap'])
 
@@ -147,9 +135,8 @@ class LNCAP(Factor):
             dict_lncap = {'date': [date_label]*len(ids), 'id': ids, 'factorvalue': lncaps}
             if save:
                 Utils.factor_loading_persistent(cls._db_file, Utils.datetimelike_to_str(calc_date, dash=False), dict_lncap, ['date', 'id', 'factorvalue'])
-            # 暂停180秒
-            logging.info('Suspending for 180s.')
-            time.sleep(180)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         return dict_lncap
 
 
@@ -11,15 +11,13 @@ from src.factors.factor import Factor
 import src.riskmodel.riskfactors.cons as risk_ct
 import src.factors.cons as factor_ct
 from src.util.utils import Utils
+from src.util.throttle import ResourceThrottle
 from src.util.dataapi.CDataHandler import  CDataHandler
 from src.util.Cache import Cache
 import pandas as pd
 import numpy as np
 import logging
 import os
-import datetime
-from multiprocessing import Pool, Manager
-import time
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(filename)s[line:%(lineno)d] - %(levelname)s: %(message)s')
@@ -67,7 +65,40 @@ class BTOP(Factor):
         return pd.Series([Utils.code_to_symbol(code), btop], index=['code', 'btop'])
 
     @classmethod
-    def _calc_factor_loading_proc(cls, code, calc_date, q):
+    def _calc_factor_loading_batch(cls, codes, calc_date):
+        """
+        批量计算指定日期、一组个股的BTOP因子载荷, 计算规则与_calc_factor_loading一致
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表, 如SH600000, 600000
+        :param calc_date: datetime-like, str
+            计算日期, 格式: YYYY-MM-DD
+        :return: pd.DataFrame
+        --------
+            个股的BTOP因子载荷
+            0. code
+            1. btop
+            不包含计算失败的个股
+        """
+        # 读取个股的财务数据
+        fin_report_date = Utils.get_fin_report_date(calc_date)
+        fin_basic_data = Utils.get_fin_basic_data_panel(codes, fin_report_date, ['TotalAsset', 'TotalLiability'])
+        # 读取个股的市值因子(LNCAP)
+        df_lncap = cls._LNCAP_Cache.get(Utils.datetimelike_to_str(calc_date, dash=False))
+        if df_lncap is None:
+            lncap_path = os.path.join(factor_ct.FACTOR_DB.db_path, risk_ct.LNCAP_CT.db_file)
+            df_lncap = Utils.read_factor_loading(lncap_path, Utils.datetimelike_to_str(calc_date, dash=False))
+            cls._LNCAP_Cache.set(Utils.datetimelike_to_str(calc_date, dash=False), df_lncap)
+        lncap = df_lncap.drop_duplicates(subset='id', keep='first').set_index('id')['factorvalue']
+        symbols = [symbol for symbol in fin_basic_data.index if symbol in lncap.index]
+        fin_basic_data = fin_basic_data.loc[symbols]
+        # 账面市值比=净资产/市值
+        btop = (fin_basic_data['TotalAsset'] - fin_basic_data['TotalLiability']).values * 10000 / np.exp(lncap.loc[symbols].values.astype(np.float64))
+        return pd.DataFrame({'code': symbols, 'btop': btop}, columns=['code', 'btop'])
+
+    @classmethod
+    def _calc_factor_loading_proc(cls, code, calc_date):
         """
         用于并行计算因子治安和
         Parameters:
@@ -76,8 +107,7 @@ class BTOP(Factor):
             个股代码, 如SH600000, 600000
         :param calc_date: datetime-like, str
             计算日期, 格式: YYYY-MM-DD
-        :param q: 队列, 用于进程间通信
-        :return: 添加因子载荷至队列
+        :return: 因子载荷, 无法计算时返回None
         """
         logging.info('[{}] Calc BTOP factor of {}.'.format(Utils.datetimelike_to_str(calc_date), code))
         btop_data = None
@@ -86,7 +116,7 @@ class BTOP(Factor):
         except Exception as e:
             print(e)
         if btop_data is not None:
-            q.put(btop_data)
+            return btop_data
 
     @classmethod
     def calc_factor_loading(cls, start_date, end_date=None, month_end=True, save=False, **kwargs):
@@ -104,6 +134,8 @@ class BTOP(Factor):
             是否保存至因子数据库
         :param kwargs:
             'multi_proc': bool, True=采用多进程, False=采用单进程, 默认为False
+            'batch': bool, 默认False
+                是否从财务数据合并存储批量计算全部个股的因子载荷, 为True时忽略multi_proc
         :return: dict
             因子载荷数据
         """
@@ -114,7 +146,6 @@ class BTOP(Factor):
             trading_days_series = Utils.get_trading_days(start=start_date, end=end_date)
         else:
             trading_days_series = Utils.get_trading_days(end=start_date, ndays=1)
-        all_stock_basics = CDataHandler.DataApi.get_secu_basics()
         # 遍历交易日序列, 计算BTOP因子载荷
         dict_btop = None
         for calc_date in trading_days_series:
@@ -122,31 +153,28 @@ class BTOP(Factor):
                 continue
             logging.info('[%s] Calc BTOP factor loading.' % Utils.datetimelike_to_str(calc_date))
             # 遍历个股, 计算个股的BTOP因子值
-            s = (calc_date - datetime.timedelta(days=risk_ct.BTOP_CT.listed_days)).strftime('%Y%m%d')
-            stock_basics = all_stock_basics[all_stock_basics.list_date < s]
+            stock_codes = CDataHandler.get_universe(calc_date, risk_ct.BTOP_CT.listed_days)
             ids = []    # 个股代码list
             btops = []  # BTOP因子值list
 
             if 'multi_proc' not in kwargs:
                 kwargs['multi_proc'] = False
-            if not kwargs['multi_proc']:
+            if kwargs.get('batch', False):
+                # 批量计算BTOP因子值
+                df_btop = cls._calc_factor_loading_batch(list(stock_codes), calc_date)
+                ids = list(df_btop['code'])
+                btops = list(df_btop['btop'])
+            elif not kwargs['multi_proc']:
                 # 采用单进程计算BTOP因子值
-                for _, stock_info in stock_basics.iterrows():
-                    logging.info("[%s] Calc %s's BTOP factor loading." % (Utils.datetimelike_to_str(calc_date, dash=True), stock_info.symbol))
-                    btop_data = cls._calc_factor_loading(stock_info.symbol, calc_date)
+                for code in stock_codes:
+                    logging.info("[%s] Calc %s's BTOP factor loading." % (Utils.datetimelike_to_str(calc_date, dash=True), code))
+                    btop_data = cls._calc_factor_loading(code, calc_date)
                     if btop_data is not None:
                         ids.append(btop_data['code'])
                         btops.append(btop_data['btop'])
             else:
                 # 采用多进程并行计算BTOP因子值
-                q = Manager().Queue()   # 队列, 用于进程间通信, 存储每个进程计算的因子载荷
-                p = Pool(4)             # 进程池, 最多同时开启4个进程
-                for _, stock_info in stock_basics.iterrows():
-                    p.apply_async(cls._calc_factor_loading_proc, args=(stock_info.symbol, calc_date, q,))
-                p.close()
-                p.join()
-                while not q.empty():
-                    btop_data = q.get(True)
+                for btop_data in cls._parallel_calc(list(stock_codes), calc_date):
                     ids.append(btop_data['code'])
                     btops.append(btop_data['btop'])
 
@@ -154,9 +182,8 @@ class BTOP(Factor):
             dict_btop = {'date': [date_label]*len(ids), 'id': ids, 'factorvalue': btops}
             if save:
                 Utils.factor_loading_persistent(cls._db_file, Utils.datetimelike_to_str(calc_date, dash=False), dict_btop, ['date', 'id', 'factorvalue'])
-            # 暂停180秒
-            logging.info('Suspending for 180s.')
-            time.sleep(180)
+            # 系统资源紧张时暂停
+            ResourceThrottle.wait()
         return dict_btop
 
 
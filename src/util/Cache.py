@@ -6,37 +6,124 @@
 # @Author  : YuJun
 # @Email   : yujun_mail@163.com
 
+import sys
+import mmap
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
 
 class Cache(object):
+    """
+    LRU缓存
+    --------
+    基于OrderedDict, get/set均为O(1)操作
+    同时限制缓存的条目数量(maxsize)和占用内存字节数(maxbytes), 超出任一限制时淘汰最久未使用的条目
+    统计命中(hits)、未命中(misses)和淘汰(evictions)次数
+    """
 
-    def __init__(self, maxsize=100):
-        self.cache = {}
-        self.order = []     # least recently used first
+    def __init__(self, maxsize=100, maxbytes=None):
+        """
+        :param maxsize: int, 默认100
+            最大条目数量, 为None时不限制
+        :param maxbytes: int, 默认None
+            最大占用内存字节数, 为None时不限制
+        """
+        self.cache = OrderedDict()  # least recently used first, value为(item, nbytes)
         self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def get(self, key):
         try:
-            item = self.cache[key]  # KeyError if not present
-            self.order.remove(key)
-            self.order.append(key)
+            item = self.cache[key][0]   # KeyError if not present
+            self.cache.move_to_end(key)
+            self.hits += 1
         except KeyError:
             item = None
+            self.misses += 1
         return item
 
     def set(self, key, value):
         if key in self.cache:
-            self.order.remove(key)
-        elif len(self.cache) >= self.maxsize:
-            # discard least recently used item
-            del self.cache[self.order.pop(0)]
-        self.cache[key] = value
-        self.order.append(key)
+            self.nbytes -= self.cache.pop(key)[1]
+        nbytes = _sizeof(value)
+        if self.maxbytes is not None and nbytes > self.maxbytes:
+            # 单个条目超过内存限制, 不缓存
+            return
+        self.cache[key] = (value, nbytes)
+        self.nbytes += nbytes
+        self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用的条目, 直至满足条目数量和内存限制"""
+        while len(self.cache) > 0 and ((self.maxsize is not None and len(self.cache) > self.maxsize) or
+                                       (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            _, (_, nbytes) = self.cache.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
 
     def size(self):
         return len(self.cache)
 
     def set_maxsize(self, max_size):
         self.maxsize = max_size
+        self._evict()
+
+    def set_maxbytes(self, max_bytes):
+        self.maxbytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        self.cache.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        """
+        缓存统计信息
+        :return: dict
+            size: 条目数量, nbytes: 占用内存字节数, hits: 命中次数, misses: 未命中次数, evictions: 淘汰次数
+        """
+        return {'size': len(self.cache), 'nbytes': self.nbytes, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+def _memmap_backed(arr):
+    """数组是否为内存映射文件的视图(不占用进程堆内存)"""
+    base = arr
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return True
+        base = base.base
+    return isinstance(base, mmap.mmap)
+
+
+def _sizeof(value, depth=0):
+    """
+    估计缓存条目占用的内存字节数
+    DataFrame/Series按memory_usage(deep=True)计算, ndarray按nbytes计算(内存映射的数组不计),
+    容器及一般对象递归累加其元素或属性(最多3层)
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return 0 if _memmap_backed(value) else int(value.nbytes)
+    size = sys.getsizeof(value)
+    if depth >= 3:
+        return size
+    if isinstance(value, dict):
+        size += sum(_sizeof(v, depth + 1) for v in value.values())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_sizeof(v, depth + 1) for v in value)
+    elif hasattr(value, '__dict__'):
+        size += sum(_sizeof(v, depth + 1) for v in vars(value).values())
+    return size
+
 
 if __name__ == '__main__':
     pass
@@ -12,14 +12,26 @@ DB_PATH = '/Volumes/DB/FactorDB'
 MKT_DAILY_FQ = 'ElementaryFactor/mkt_daily_FQ'
 # 日行情非复权数据相对目录
 MKT_DAILY_NOFQ = 'ElementaryFactor/mkt_daily_NoFQ'
+# 日行情复权数据列式存储相对目录
+MKT_DAILY_FQ_STORE = 'ElementaryFactor/mkt_daily_FQ_store'
+# 日行情非复权数据列式存储相对目录
+MKT_DAILY_NOFQ_STORE = 'ElementaryFactor/mkt_daily_NoFQ_store'
 # 分钟行情复权数据相对目录
 MKT_MIN_FQ = 'ElementaryFactor/mkt_1min_FQ'
 # 分钟行情非复权数据相对目录
 MKT_MIN_NOFQ = 'ElementaryFactor/mkt_1min_NoFQ'
+# 分钟行情复权数据按日存储相对目录
+MKT_MIN_FQ_STORE = 'ElementaryFactor/mkt_1min_FQ_store'
+# 分钟行情非复权数据按日存储相对目录
+MKT_MIN_NOFQ_STORE = 'ElementaryFactor/mkt_1min_NoFQ_store'
+# 分钟行情复权数据日内时点价格表相对目录
+MKT_CHECKPOINT_FQ = 'ElementaryFactor/mkt_checkpoint_FQ'
 # 股本结构数据相对目录
 CAP_STRUCT = 'ElementaryFactor/cap_struct'
 # 主要财务指标相对目录
 FIN_BASIC_DATA_PATH = 'ElementaryFactor/fin_data/fin_data_basics'
+# 全部个股主要财务数据的合并存储文件
+FIN_BASIC_DATA_STORE = 'ElementaryFactor/fin_data/fin_data_basics_store.pack'
 # 个股行业分类相对目录
 INDUSTRY_CLASSIFY_DATA_PATH = 'ElementaryFactor/industry_classify'
 # 个股IPO信息数据相对目录
@@ -31,6 +43,17 @@ MKT_DAILY_FQ_HEADER = ['code', 'date', 'open', 'high', 'low', 'close', 'vol', 'a
 MKT_DAILY_NOFQ_HEADER = ['date', 'open', 'high', 'low', 'close', 'vol', 'amount', 'turnover1', 'turnover2']
 # 分钟行情复权数据的表头
 MKT_MIN_FQ_HEADER = ['code', 'datetime', 'open', 'high', 'low', 'close', 'vol', 'amount', 'factor']
+# 交易日历文件
+TRADING_CALENDAR = 'ElementaryFactor/trading_calendar.csv'
+# 用于增量更新交易日历的指数代码(读取其日行情数据)
+TRADING_CALENDAR_INDEX = 'SH000001'
+
+# 日内时点价格表的时点: (名称, 分钟线时间, 取分钟线的价格字段)
+MKT_CHECKPOINTS = [('p0930', '09:31:00', 'open'),
+                   ('p1030', '10:30:00', 'close'),
+                   ('p1130', '11:30:00', 'close'),
+                   ('p1400', '14:00:00', 'close'),
+                   ('p1500', '15:00:00', 'close')]
 # 股票股本结构数据的表头
 CAP_STRUCT_HEADER = ['code', 'date', 'reason', 'total', 'liquid_a', 'liquid_b', 'liquid_h']
 
@@ -40,6 +63,10 @@ FIN_BASIC_DATA_HEADER = ['ReportDate', 'BasicEPS', 'UnitNetAsset', 'UnitNetOpera
                          'NetProfit', 'DeductedNetProfit', 'NetOperateCashFlow', 'CashEquivalentsChg', 'TotalAsset',
                          'CurrentAsset', 'TotalLiability', 'CurrentLiability', 'ShareHolderEquity', 'ROE']
 
+# 计算TTM值的财务数据字段
+FIN_BASIC_TTM_HEADER = ['MainOperateRevenue', 'MainOperateProfit', 'OperateProfit', 'InvestIncome', 'NonOperateNetIncome',
+                        'TotalProfit', 'NetProfit', 'DeductedNetProfit', 'NetOperateCashFlow']
+
 # 申万行业分类信息表头
 SW_INDUSTRY_CLASSIFY_HEADER = ['ind_code', 'ind_name']
 
@@ -48,6 +75,51 @@ FACTOR_LOADING_PERSISTENCE_TYPE='shelve,csv'
 # 读取因子载荷采用的持久化形式，csv或shelve
 USING_PERSISTENCE_TYPE='csv'
 
+# 是否优先从列式存储读取行情数据，列式存储不存在时读取csv文件
+USING_MKT_STORE = True
+# 是否优先从合并存储读取财务数据，合并存储不存在时读取csv文件
+USING_FIN_STORE = True
+
+# 指数移动加权和滚动计算时, 每滚动多少期用完整窗口重新计算一次以校验累积误差
+EWMA_CHECK_INTERVAL = 63
+# 滚动计算结果与重新计算结果的允许误差(相对误差)
+EWMA_CHECK_TOLERANCE = 1e-10
+
+# 数据缓存(Utils._DataCache)的最大条目数量及最大占用内存字节数
+DATA_CACHE_MAXSIZE = 500
+DATA_CACHE_MAXBYTES = 2 * 1024**3
+
+# 批量计算区间收益率时, 面板数据在开始日期前多读取的交易日天数(用于取得期初收盘价), 停牌更久的证券逐个计算
+INTERVAL_RET_LOOKBACK = 20
+
+# 是否启用跨进程共享的数据缓存(指数分钟行情、交易日历等各进程共用的数据只解析一次)
+USING_SHARED_CACHE = True
+# 共享内存块创建后超过多少秒仍未写入完成, 视为写入进程已异常退出, 删除后重新写入
+SHARED_CACHE_STALE_SECONDS = 60
+
+# 是否启用个股因子计算结果的磁盘缓存
+USING_RESULT_CACHE = True
+# 计算结果磁盘缓存的保存目录(相对于数据库根目录的相对路径)及大小上限(字节)
+RESULT_CACHE_PATH = 'ResultCache'
+RESULT_CACHE_MAXBYTES = 2 * 1024**3
+
+# 计算因子载荷的进程池的进程数量, 为0时采用全部CPU核数
+COMPUTE_WORKERS = 0
+# 计算因子载荷时每次提交给进程池的个股数量
+COMPUTE_CHUNKSIZE = 16
+
+# 是否在每个计算日期结束后检查系统资源并在资源紧张时暂停, 数据保存在本地磁盘时可关闭
+THROTTLE_ENABLED = True
+# 系统资源限制: 1分钟平均负载/CPU核数, 内存使用比例, 本进程打开文件数/文件数上限
+THROTTLE_MAX_LOAD = 1.5
+THROTTLE_MAX_MEMORY = 0.9
+THROTTLE_MAX_FDS = 0.8
+# 资源超限时的暂停时长(秒), 从最小值开始每次加倍至最大值
+THROTTLE_MIN_PAUSE = 1
+THROTTLE_MAX_PAUSE = 60
+# 单次检查累计暂停时长的上限(秒), 超过后不再等待
+THROTTLE_MAX_WAIT = 600
+
 # 去极值方法中mad的乘数
 CLEAN_EXTREME_VALUE_MULTI_CONST=5.2
 
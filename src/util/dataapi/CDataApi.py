@@ -28,5 +28,21 @@ class CDataApi(object):
         """
         pass
 
+    @classmethod
+    def get_trading_days(cls, start_date, end_date):
+        """
+        取得交易日序列
+        Parameters
+        --------
+        :param start_date: str
+            开始日期，格式：YYYYMMDD
+        :param end_date: str
+            结束日期，格式：YYYYMMDD
+        :return: list of str
+            交易日序列，格式：YYYYMMDD，升序排列
+            如果出错，返回None
+        """
+        pass
+
 if __name__ == '__main__':
     pass
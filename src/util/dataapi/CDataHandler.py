@@ -7,7 +7,19 @@
 # @Email   : yujun_mail@163.com
 
 from src.util.dataapi import cons as ct
-from src.util.dataapi.jaqs_api import JaqsApi
+from src.util.dataapi.secu_basics import SecuBasicsSnapshot
+
+
+def _create_data_api():
+    """按ct.DATA_API创建数据接口, 只导入所选接口的模块"""
+    if ct.DATA_API == 'jaqs':
+        from src.util.dataapi.jaqs_api import JaqsApi
+        return JaqsApi()
+    elif ct.DATA_API == 'local':
+        from src.util.dataapi.local_api import LocalDataApi
+        return LocalDataApi()
+    else:
+        return None
 
 
 class CDataHandler(object):
@@ -16,8 +28,24 @@ class CDataHandler(object):
     处理行情、基本面、因子相关数据的读取和存储
     """
     # 设置数据因子api
-    DataApi = JaqsApi() if ct.DATA_API == 'jaqs' else None
+    DataApi = _create_data_api()
 
+    @classmethod
+    def get_universe(cls, calc_date, listed_days=90, version=None):
+        """
+        取得计算日期的样本股票池
+        Parameters:
+        --------
+        :param calc_date: datetime-like
+            计算日期
+        :param listed_days: int, 默认90
+            上市天数(自然日), 只包含上市日期早于calc_date前listed_days天的个股
+        :param version: str, 默认None
+            证券基础信息快照版本(YYYYMMDD), 为None时取ct.SECU_BASICS_VERSION或当天更新的快照
+        :return: np.array of str
+            个股代码数组, 如600000
+        """
+        return SecuBasicsSnapshot.get_snapshot(version).get_universe(calc_date, listed_days)
 
 
 if __name__ == '__main__':
@@ -6,9 +6,17 @@
 # @Author  : YuJun
 # @Email   : yujun_mail@163.com
 
-# 设置数据引擎api
+# 设置数据引擎api: 'jaqs'=jaqs接口(首次使用时登录), 'local'=读取本地文件(离线运行)
 DATA_API='jaqs'
 
+# 本地数据接口的证券基础信息文件(相对于数据库根目录的相对路径)
+LOCAL_SECU_BASICS='ElementaryFactor/secu_basics/secu_basics.csv'
+
+# 证券基础信息快照的保存目录(相对于数据库根目录的相对路径), 快照文件名为secu_basics_YYYYMMDD.pack
+SECU_BASICS_SNAPSHOT_PATH='ElementaryFactor/secu_basics/snapshot'
+# 使用的证券基础信息快照版本(YYYYMMDD), 为None时每天从数据接口更新一份快照并使用; 指定版本可保证计算结果可复现
+SECU_BASICS_VERSION=None
+
 # jaqs接口的数据源
 JAQS_DATA_SERVER='tcp://data.tushare.org:8910'
 # jaqs接口登录用户名
@@ -6,15 +6,31 @@
 # @Author  : YuJun
 # @Email   : yujun_mail@163.com
 
+import os
+import logging
 from jaqs.data.dataapi import DataApi
 import src.util.dataapi.cons as ct
 from src.util.dataapi.CDataApi import CDataApi
 from src.util.utils import Utils
 
 class JaqsApi(CDataApi):
-    # 登录jaqs接口
-    _api = DataApi(addr=ct.JAQS_DATA_SERVER)
-    _api.login(ct.JAQS_LOGIN_USR, ct.JAQS_LONGIN_TOKEN)
+    # jaqs接口, 在每个进程中第一次使用时登录
+    _api = None
+    _pid = None
+
+    @classmethod
+    def _get_api(cls):
+        """
+        取得已登录的jaqs接口, 当前进程尚未登录时先登录
+        :return: jaqs.data.dataapi.DataApi
+        """
+        if cls._api is None or cls._pid != os.getpid():
+            api = DataApi(addr=ct.JAQS_DATA_SERVER)
+            _, msg = api.login(ct.JAQS_LOGIN_USR, ct.JAQS_LONGIN_TOKEN)
+            logging.info('Jaqs data api login: %s' % msg)
+            cls._api = api
+            cls._pid = os.getpid()
+        return cls._api
 
     @classmethod
     def get_secu_basics(cls, inst_type=1):
@@ -33,7 +49,7 @@ class JaqsApi(CDataApi):
             4: list_date, string, 上市日期
             如果出错，返回None
         """
-        df_basics, msg = cls._api.query(
+        df_basics, msg = cls._get_api().query(
                                         view='jz.instrumentInfo',
                                         fields='status,list_date,name,market',
                                         filter='inst_type=%d&status=1&market=SH,SZ&symbol=' % inst_type,
@@ -43,6 +59,28 @@ class JaqsApi(CDataApi):
         df_basics.symbol = df_basics.symbol.map(lambda x: x.split('.')[0])
         return df_basics
 
+    @classmethod
+    def get_trading_days(cls, start_date, end_date):
+        """
+        取得交易日序列
+        Parameters
+        --------
+        :param start_date: str
+            开始日期，格式：YYYYMMDD
+        :param end_date: str
+            结束日期，格式：YYYYMMDD
+        :return: list of str
+            交易日序列，格式：YYYYMMDD，升序排列
+            如果出错，返回None
+        """
+        df_days, msg = cls._get_api().query(view='jz.secTradeCal',
+                                      fields='trade_date',
+                                      filter='start_date=%s&end_date=%s' % (start_date, end_date),
+                                      data_format='pandas')
+        if msg != '0,':
+            return None
+        return sorted(df_days['trade_date'].astype(str))
+
     @classmethod
     def download_index_cons(cls, idx_code, start_date, end_date):
         """
@@ -61,7 +99,7 @@ class JaqsApi(CDataApi):
         code = Utils.code_to_tssymbol(idx_code, True)
         start = Utils.datetimelike_to_str(start_date, False)
         end = Utils.datetimelike_to_str(end_date, False)
-        df_idx_cons, msg = cls._api.query(view='lb.indexCons',
+        df_idx_cons, msg = cls._get_api().query(view='lb.indexCons',
                                           fields='',
                                           filter='index_code=%s&start_date=%s&end_date=%s' % (code, start, end),
                                           data_format='pandas')
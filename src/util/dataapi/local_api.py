@@ -0,0 +1,94 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 读取本地文件的数据接口, 用于离线运行
+# @Filename: local_api
+# @Date:   : 2026-10-18 17:40
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import pandas as pd
+import src.util.dataapi.cons as ct
+from src.util.dataapi.CDataApi import CDataApi
+from src.util import cons as util_ct
+
+
+class LocalDataApi(CDataApi):
+    """
+    本地文件数据接口
+    --------
+    证券基础信息读取自ct.LOCAL_SECU_BASICS文件(可由save_secu_basics从其他数据接口导出),
+    交易日序列读取自交易日历文件, 不访问网络
+    """
+    _secu_basics = None     # 已读取的证券基础信息
+
+    @classmethod
+    def get_secu_basics(cls, inst_type=1):
+        """
+        取得证券基础信息表
+        Parameters
+        --------
+        :param inst_type: int
+            证券类别，本地文件只包含股票(inst_type=1)
+        return: DataFrame
+        --------
+            0: symbol, string, 个股代码, 如600000
+            1: name, string, 证券名称
+            2: status, string, 上市状态, 1:上市, 3:退市, 8:暂停上市
+            3: market, string, 交易所代码
+            4: list_date, string, 上市日期
+            如果本地文件不存在或inst_type不为1，返回None
+        """
+        if inst_type != 1:
+            return None
+        if cls._secu_basics is None:
+            file_path = os.path.join(util_ct.DB_PATH, ct.LOCAL_SECU_BASICS)
+            if not os.path.isfile(file_path):
+                return None
+            cls._secu_basics = pd.read_csv(file_path, dtype={'symbol': str, 'name': str, 'status': str,
+                                                             'market': str, 'list_date': str})
+        return cls._secu_basics.copy()
+
+    @classmethod
+    def get_trading_days(cls, start_date, end_date):
+        """
+        取得交易日序列
+        Parameters
+        --------
+        :param start_date: str
+            开始日期，格式：YYYYMMDD
+        :param end_date: str
+            结束日期，格式：YYYYMMDD
+        :return: list of str
+            交易日序列，格式：YYYYMMDD，升序排列
+            如果交易日历文件不存在，返回None
+        """
+        file_path = os.path.join(util_ct.DB_PATH, util_ct.TRADING_CALENDAR)
+        if not os.path.isfile(file_path):
+            return None
+        days = pd.read_csv(file_path, header=0, dtype={'date': str})['date'].str.replace('-', '')
+        return sorted(days[(days >= start_date) & (days <= end_date)])
+
+    @classmethod
+    def save_secu_basics(cls, data_api):
+        """
+        从其他数据接口读取证券基础信息并保存至本地文件
+        :param data_api: CDataApi
+            数据接口, 如JaqsApi
+        :return: bool
+            保存成功返回True, 否则返回False
+        """
+        df_basics = data_api.get_secu_basics()
+        if df_basics is None:
+            return False
+        file_path = os.path.join(util_ct.DB_PATH, ct.LOCAL_SECU_BASICS)
+        if not os.path.exists(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        df_basics.to_csv(file_path, index=False)
+        cls._secu_basics = None
+        return True
+
+
+if __name__ == '__main__':
+    from src.util.dataapi.jaqs_api import JaqsApi
+    LocalDataApi.save_secu_basics(JaqsApi)
@@ -0,0 +1,167 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 证券基础信息的版本化本地快照, 及基于快照的样本股票池构建
+# @Filename: secu_basics
+# @Date:   : 2026-10-18 18:05
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import re
+import datetime
+import logging
+import numpy as np
+import pandas as pd
+import src.util.dataapi.cons as ct
+from src.util import cons as util_ct
+from src.util.packfile import PackFile
+
+
+class SecuBasicsSnapshot(object):
+    """
+    证券基础信息快照
+    --------
+    把数据接口返回的股票基础信息(symbol, list_date, status)保存为打包文件
+    ct.SECU_BASICS_SNAPSHOT_PATH/secu_basics_YYYYMMDD.pack, 文件名中的日期即快照版本, 包含:
+        codes: 个股代码数组, 如600000, 按上市日期升序排列(上市日期相同时按代码排列)
+        list_dates: 上市日期数组, datetime64[D], 上市日期未知时为NaT(排在最后)
+        status: 上市状态数组
+    由于个股按上市日期排序, 任一计算日期的样本股票池(上市日期早于计算日期前listed_days天的个股)都是codes的前缀,
+    通过一次searchsorted即可取得, 不需要逐日筛选DataFrame
+    数据接口只返回快照时点仍在上市的个股(JaqsApi按status=1筛选), 已退市个股不包含在快照中
+    未指定快照版本时, 每天第一次取快照时从数据接口更新一份当天版本的快照, 新上市的个股随之进入样本股票池;
+    指定快照版本时使用固定的快照, 用于复现历史计算结果
+    """
+    _snapshots = {}     # 进程内已读取的快照, key为版本
+    _refresh_date = None    # 最近一次尝试从数据接口更新快照的日期
+
+    def __init__(self, codes, list_dates, status, version):
+        self.codes = codes
+        self.list_dates = list_dates
+        self.status = status
+        self.version = version
+
+    @classmethod
+    def _snapshot_dir(cls):
+        return os.path.join(util_ct.DB_PATH, ct.SECU_BASICS_SNAPSHOT_PATH)
+
+    @classmethod
+    def get_versions(cls):
+        """
+        取得本地已保存的快照版本
+        :return: list of str
+            快照版本(YYYYMMDD), 升序排列
+        """
+        snapshot_dir = cls._snapshot_dir()
+        if not os.path.isdir(snapshot_dir):
+            return []
+        versions = []
+        for file_name in os.listdir(snapshot_dir):
+            matched = re.match(r'^secu_basics_(\d{8})\.pack$', file_name)
+            if matched is not None:
+                versions.append(matched.group(1))
+        return sorted(versions)
+
+    @classmethod
+    def get_snapshot(cls, version=None):
+        """
+        取得证券基础信息快照
+        Parameters:
+        --------
+        :param version: str, 默认None
+            快照版本(YYYYMMDD), 为None时取ct.SECU_BASICS_VERSION; 两者均为None时取当天版本的快照,
+            本地没有当天版本的快照时从数据接口读取并保存一份(每天只尝试一次), 读取失败时取最新的快照
+        :return: SecuBasicsSnapshot
+        """
+        if version is None:
+            version = ct.SECU_BASICS_VERSION
+        if version is None:
+            versions = cls.get_versions()
+            today = datetime.date.today().strftime('%Y%m%d')
+            if len(versions) > 0 and versions[-1] >= today:
+                version = versions[-1]
+            elif len(versions) == 0:
+                return cls.save_snapshot()
+            elif cls._refresh_date != today:
+                cls._refresh_date = today
+                try:
+                    return cls.save_snapshot()
+                except Exception as e:
+                    logging.warning('Failed to refresh secu basics snapshot, using version %s: %s' % (versions[-1], e))
+                    version = versions[-1]
+            else:
+                version = versions[-1]
+        version = str(version)
+        if version not in cls._snapshots:
+            file_path = os.path.join(cls._snapshot_dir(), 'secu_basics_%s.pack' % version)
+            if not os.path.isfile(file_path):
+                raise ValueError('Secu basics snapshot of version %s does not exist.' % version)
+            arrays, _ = PackFile.read(file_path)
+            cls._snapshots[version] = cls(arrays['codes'], arrays['list_dates'], arrays['status'], version)
+        return cls._snapshots[version]
+
+    @classmethod
+    def from_secu_basics(cls, df_basics, version):
+        """
+        由证券基础信息表构建快照
+        Parameters:
+        --------
+        :param df_basics: pd.DataFrame
+            证券基础信息表, 格式同CDataApi.get_secu_basics的返回值
+        :param version: str
+            快照版本(YYYYMMDD)
+        :return: SecuBasicsSnapshot
+        """
+        df_basics = df_basics.sort_values(by='symbol')
+        codes = np.array(df_basics['symbol'].astype(str), dtype=str)
+        list_dates = np.array(pd.to_datetime(df_basics['list_date'].astype(str), format='%Y%m%d', errors='coerce'),
+                              dtype='datetime64[D]')
+        status = np.array(df_basics['status'].astype(str), dtype=str)
+        # 按上市日期稳定排序, NaT排在最后
+        order = np.argsort(list_dates, kind='stable')
+        return cls(codes[order], list_dates[order], status[order], version)
+
+    @classmethod
+    def save_snapshot(cls, df_basics=None):
+        """
+        保存当天版本的证券基础信息快照, 已存在的同版本快照将被替换
+        Parameters:
+        --------
+        :param df_basics: pd.DataFrame, 默认None
+            证券基础信息表, 为None时从数据接口(CDataHandler.DataApi)读取
+        :return: SecuBasicsSnapshot
+        """
+        if df_basics is None:
+            from src.util.dataapi.CDataHandler import CDataHandler
+            df_basics = CDataHandler.DataApi.get_secu_basics()
+            if df_basics is None:
+                raise ValueError('Failed to read secu basics from data api.')
+        version = datetime.date.today().strftime('%Y%m%d')
+        snapshot = cls.from_secu_basics(df_basics, version)
+        snapshot_dir = cls._snapshot_dir()
+        if not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        PackFile.write(os.path.join(snapshot_dir, 'secu_basics_%s.pack' % version),
+                       [('codes', snapshot.codes), ('list_dates', snapshot.list_dates), ('status', snapshot.status)])
+        cls._snapshots[version] = snapshot
+        logging.info('Secu basics snapshot of version %s saved, %d securities.' % (version, len(snapshot.codes)))
+        return snapshot
+
+    def get_universe(self, calc_date, listed_days=90):
+        """
+        取得计算日期的样本股票池, 即上市日期早于calc_date前listed_days天的个股
+        Parameters:
+        --------
+        :param calc_date: datetime-like
+            计算日期
+        :param listed_days: int, 默认90
+            上市天数(自然日)
+        :return: np.array of str
+            个股代码数组, 如600000, 按上市日期升序排列
+        """
+        threshold = pd.Timestamp(calc_date).to_datetime64().astype('datetime64[D]') - np.timedelta64(int(listed_days), 'D')
+        return self.codes[:int(self.list_dates.searchsorted(threshold, side='left'))]
+
+
+if __name__ == '__main__':
+    SecuBasicsSnapshot.save_snapshot()
@@ -0,0 +1,203 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 指数移动加权平均(EWMA)权重及滚动计算
+# @Filename: ewma
+# @Date:   : 2026-10-18 11:05
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import numpy as np
+import logging
+from src.util import cons as ct
+
+
+class EWMA(object):
+    """指数移动加权平均权重, 同一(序列长度, 半衰期)的权重只计算一次"""
+    _weights = {}   # 已计算的权重, key为(T, half_life)
+
+    @classmethod
+    def get_alpha(cls, half_life):
+        """
+        由半衰期计算衰减系数alpha, 即(1-alpha)^half_life = 0.5
+        :param half_life: int
+            半衰期
+        :return: float
+        """
+        return 1 - np.exp(np.log(0.5)/half_life)
+
+    @classmethod
+    def get_weights(cls, T, half_life):
+        """
+        取得指数移动加权平均的权重序列
+        最新一期权重为alpha, 往前每期乘以(1-alpha), 最早一期权重为(1-alpha)^(T-1), 权重之和为1
+        Parameters:
+        --------
+        :param T: int
+            序列长度
+        :param half_life: int
+            半衰期
+        :return: np.array
+            按时间升序排列的权重, 只读
+        """
+        key = (T, half_life)
+        weights = cls._weights.get(key)
+        if weights is None:
+            alpha = cls.get_alpha(half_life)
+            weights = np.float_power(1-alpha, np.arange(T-1, -1, -1)) * alpha
+            if T > 0:
+                weights[0] = np.float_power(1-alpha, T-1)
+            weights.setflags(write=False)
+            cls._weights[key] = weights
+        return weights
+
+
+class RollingEWMA(object):
+    """
+    指数移动加权和的滚动计算
+    --------
+    对每个证券维护窗口内T个观测值的衰减和D1=Σ(1-alpha)^k·x、D2=Σ(1-alpha)^k·x²及简单和S1=Σx(k=0为最新一期),
+    窗口每向前移动一期(新增一个观测值, 剔除最早的观测值)只需O(1)的更新:
+        D' = x_new + (1-alpha)·D - (1-alpha)^T·x_oldest
+    按EWMA.get_weights的权重, 加权和Σw·x = alpha·D1 + (1-alpha)^T·x_oldest
+    观测值可设置滞后期lag, 即新增的观测值滞后lag期后才进入窗口
+    每滚动ct.EWMA_CHECK_INTERVAL期, 用窗口内的观测值重新计算一次, 以校验并消除累积误差
+    """
+
+    def __init__(self, T, half_life, num, lag=0):
+        """
+        :param T: int
+            窗口长度
+        :param half_life: int
+            半衰期
+        :param num: int
+            证券数量
+        :param lag: int, 默认0
+            观测值进入窗口的滞后期数
+        """
+        self.T = T
+        self.half_life = half_life
+        self.lag = lag
+        self._alpha = EWMA.get_alpha(half_life)
+        self._decay = 1 - self._alpha
+        self._decay_T = np.float_power(self._decay, T)
+        self._decay_powers = np.float_power(self._decay, np.arange(T-1, -1, -1))
+        self._sum_weights = EWMA.get_weights(T, half_life).sum()
+        self._window = np.zeros((T, num))               # 窗口内观测值的环形缓冲
+        self._lagged = np.zeros((max(lag, 1), num))     # 尚未进入窗口的观测值的环形缓冲
+        self._count = np.zeros(num, dtype=np.int64)     # 各证券累计新增的观测值数量
+        self._d1 = np.zeros(num)
+        self._d2 = np.zeros(num)
+        self._s1 = np.zeros(num)
+        self._num_push = 0
+
+    def push(self, cols, values):
+        """
+        新增一期观测值
+        Parameters:
+        --------
+        :param cols: np.array of int
+            新增观测值的证券序号(不重复)
+        :param values: np.array
+            对应的观测值
+        """
+        count = self._count[cols]
+        self._count[cols] += 1
+        if self.lag > 0:
+            lag_pos = count % self.lag
+            lagged = self._lagged[lag_pos, cols]
+            self._lagged[lag_pos, cols] = values
+            # 滞后期满的观测值才进入窗口
+            entering = count >= self.lag
+            cols, values, count = cols[entering], lagged[entering], count[entering] - self.lag
+        pos = count % self.T
+        oldest = np.where(count >= self.T, self._window[pos, cols], 0.)
+        self._d1[cols] = values + self._decay * self._d1[cols] - self._decay_T * oldest
+        self._d2[cols] = values * values + self._decay * self._d2[cols] - self._decay_T * oldest * oldest
+        self._s1[cols] += values - oldest
+        self._window[pos, cols] = values
+        self._num_push += 1
+        if self._num_push % ct.EWMA_CHECK_INTERVAL == 0:
+            self.check()
+
+    def roll_log_returns(self, arr_close, end_idxs):
+        """
+        沿(交易日 × 证券)收盘价矩阵逐日新增各证券的日对数收益率, 每个证券只在有收盘价的交易日新增观测值
+        Parameters:
+        --------
+        :param arr_close: np.array, T × num
+            收盘价矩阵, 无行情数据时为NaN
+        :param end_idxs: list of int
+            升序排列的截止行号(不含)
+        :return: generator
+            依次在新增至每个截止行号后返回self
+        """
+        arr_last_close = np.full(arr_close.shape[1], np.nan)
+        t = 0
+        for end_idx in end_idxs:
+            while t < end_idx:
+                valid = ~np.isnan(arr_close[t])
+                cols = (valid & ~np.isnan(arr_last_close)).nonzero()[0]
+                self.push(cols, np.log(arr_close[t, cols] / arr_last_close[cols]))
+                arr_last_close[valid] = arr_close[t, valid]
+                t += 1
+            yield self
+
+    def ready(self):
+        """窗口内观测值是否已满T个, 返回bool数组"""
+        return self._count - self.lag >= self.T
+
+    def _oldest(self):
+        """窗口内最早的观测值"""
+        return self._window[(self._count - self.lag) % self.T, np.arange(len(self._count))]
+
+    def weighted_sum(self):
+        """
+        窗口内观测值的加权和Σw·x, 窗口未满的证券为NaN
+        :return: np.array
+        """
+        values = self._alpha * self._d1 + self._decay_T * self._oldest()
+        return np.where(self.ready(), values, np.nan)
+
+    def weighted_sum_sq(self):
+        """
+        窗口内观测值平方的加权和Σw·x², 窗口未满的证券为NaN
+        :return: np.array
+        """
+        oldest = self._oldest()
+        values = self._alpha * self._d2 + self._decay_T * oldest * oldest
+        return np.where(self.ready(), values, np.nan)
+
+    def weighted_var(self):
+        """
+        窗口内观测值相对于其简单平均的加权方差Σw·(x-mean)², 窗口未满的证券为NaN
+        :return: np.array
+        """
+        mean = self._s1 / self.T
+        values = self.weighted_sum_sq() - 2 * mean * self.weighted_sum() + mean * mean * self._sum_weights
+        return np.maximum(values, 0.)
+
+    def check(self):
+        """
+        用窗口内的观测值重新计算衰减和及简单和, 累积误差超过ct.EWMA_CHECK_TOLERANCE时记录日志
+        :return: float, 最大相对误差
+        """
+        cols = self.ready().nonzero()[0]
+        if len(cols) == 0:
+            return 0.
+        # 把环形缓冲按时间先后排列
+        rows = (self._count[cols] - self.lag + np.arange(self.T)[:, np.newaxis]) % self.T
+        arr_window = self._window[rows, cols]
+        max_drift = 0.
+        for state, exact in ((self._d1, self._decay_powers.dot(arr_window)),
+                             (self._d2, self._decay_powers.dot(arr_window * arr_window)),
+                             (self._s1, arr_window.sum(axis=0))):
+            drift = np.abs(state[cols] - exact) / np.maximum(np.abs(exact), 1.)
+            max_drift = max(max_drift, drift.max())
+            state[cols] = exact
+        if max_drift > ct.EWMA_CHECK_TOLERANCE:
+            logging.warning('Rolling EWMA drift %g exceeds tolerance, state recomputed.' % max_drift)
+        return max_drift
+
+
+if __name__ == '__main__':
+    print(EWMA.get_weights(252, 63).sum())
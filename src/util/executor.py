@@ -0,0 +1,81 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 计算因子载荷的共享进程池, 整个运行期间只创建一次
+# @Filename: executor
+# @Date:   : 2026-10-18 15:10
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import atexit
+import logging
+from multiprocessing import Pool
+from src.util import cons as ct
+from src.util.sharedcache import SharedCache
+
+
+class ComputeExecutor(object):
+    """
+    共享进程池
+    --------
+    进程池在第一次使用时创建, 之后各因子、各计算日期复用同一进程池, 进程退出时关闭
+    进程数量取ct.COMPUTE_WORKERS(为0时采用全部CPU核数), 任务按ct.COMPUTE_CHUNKSIZE分块提交
+    """
+    _pool = None    # 进程池
+    _pid = None     # 创建进程池的进程id, 子进程中不复用父进程的进程池
+
+    @classmethod
+    def get_workers(cls):
+        """进程池的进程数量"""
+        workers = ct.COMPUTE_WORKERS
+        if workers is None or workers <= 0:
+            workers = os.cpu_count() or 1
+        return workers
+
+    @classmethod
+    def get_pool(cls):
+        """
+        取得共享进程池, 不存在时创建
+        :return: multiprocessing.Pool
+        """
+        if cls._pool is None or cls._pid != os.getpid():
+            # 在创建子进程之前设置共享缓存的运行id, 使各子进程共用同一组共享内存块
+            SharedCache.get_run_id()
+            cls._pool = Pool(cls.get_workers())
+            cls._pid = os.getpid()
+            logging.info('Compute executor started with %d workers.' % cls.get_workers())
+        return cls._pool
+
+    @classmethod
+    def imap_unordered(cls, func, iterable, chunksize=None):
+        """
+        在共享进程池中对iterable的每个元素执行func, 按完成的先后顺序返回结果
+        Parameters:
+        --------
+        :param func: callable
+            单个参数的函数, 需可序列化(模块级函数、类方法或functools.partial)
+        :param iterable: iterable
+            参数序列
+        :param chunksize: int, 默认None
+            每次提交给进程的任务数量, 为None时取ct.COMPUTE_CHUNKSIZE
+        :return: iterator
+        """
+        if chunksize is None:
+            chunksize = ct.COMPUTE_CHUNKSIZE
+        return cls.get_pool().imap_unordered(func, iterable, chunksize=max(int(chunksize), 1))
+
+    @classmethod
+    def shutdown(cls):
+        """关闭共享进程池"""
+        if cls._pool is not None and cls._pid == os.getpid():
+            cls._pool.close()
+            cls._pool.join()
+        cls._pool = None
+        cls._pid = None
+
+
+atexit.register(ComputeExecutor.shutdown)
+
+
+if __name__ == '__main__':
+    print(ComputeExecutor.get_workers())
@@ -0,0 +1,230 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 全部个股主要财务数据的合并存储
+# @Filename: finstore
+# @Date:   : 2026-10-18 16:20
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from pandas import Series, DataFrame
+from src.util import cons as ct
+from src.util.packfile import PackFile
+
+
+class FinDataStore(object):
+    """
+    主要财务数据合并存储
+    --------
+    把fin_data_basics目录下每个个股一个csv文件的主要财务数据, 合并为(报告期 × 个股 × 字段)的三维数组
+    存储为单个打包文件(ct.FIN_BASIC_DATA_STORE), 包含:
+        symbols: 个股代码数组
+        report_dates: 报告期数组, datetime64[D], 升序排列
+        exists: 二维bool数组(报告期 × 个股), 个股是否有该报告期的财务数据
+        values: 三维float64数组(报告期 × 个股 × 字段), 字段为ct.FIN_BASIC_DATA_HEADER中除ReportDate外的各列
+    同一报告期在csv文件中有多行数据时, 取第一行, 与Utils.get_fin_basic_data一致
+    附加属性stamp记录开始构建的时间(纳秒), 有csv文件在构建之后更新时, 合并存储文件视为过期, 不再读取
+    """
+    _store = None   # 已打开的合并存储文件
+    _store_checked = False  # 是否已检查过合并存储文件
+    _csv_store = None   # 合并存储文件不可用时, 由csv文件构建的存储
+
+    def __init__(self, symbols, report_dates, exists, values, fields):
+        self.symbols = symbols
+        self.report_dates = report_dates
+        self.fields = list(fields)
+        self._exists = exists
+        self._values = values
+        self._symbol_idx = {symbol: k for k, symbol in enumerate(symbols)}
+        self._field_idx = {field: k for k, field in enumerate(self.fields)}
+
+    @classmethod
+    def get_store(cls, load_csv=False):
+        """
+        取得主要财务数据合并存储
+        Parameters:
+        --------
+        :param load_csv: bool, 默认False
+            合并存储文件不可用(未启用合并存储、文件不存在或已过期)时, 是否读取全部csv文件构建(只在进程内构建一次, 不保存)
+        :return: FinDataStore
+            如果合并存储文件不可用且load_csv=False, 返回None
+        """
+        if ct.USING_FIN_STORE and not cls._store_checked:
+            cls._store = cls._read_pack()
+            cls._store_checked = True
+        if ct.USING_FIN_STORE and cls._store is not None:
+            return cls._store
+        if not load_csv:
+            return None
+        if cls._csv_store is None:
+            cls._csv_store = cls.from_csv()
+        return cls._csv_store
+
+    @classmethod
+    def _read_pack(cls):
+        """
+        读取合并存储文件
+        :return: FinDataStore, 文件不存在, 或有csv文件在构建之后更新(文件已过期)时返回None
+        """
+        store_path = os.path.join(ct.DB_PATH, ct.FIN_BASIC_DATA_STORE)
+        if not os.path.isfile(store_path):
+            return None
+        arrays, attrs = PackFile.read(store_path)
+        stamp = attrs.get('stamp', os.stat(store_path).st_mtime_ns)
+        fin_data_path = os.path.join(ct.DB_PATH, ct.FIN_BASIC_DATA_PATH)
+        if os.path.isdir(fin_data_path):
+            for entry in os.scandir(fin_data_path):
+                if entry.name.endswith('.csv') and entry.stat().st_mtime_ns > stamp:
+                    logging.warning('Fin basic data store is older than %s, reading csv files instead. '
+                                    'Rebuild it with FinDataStore.convert_from_csv.' % entry.name)
+                    return None
+        return cls(arrays['symbols'], arrays['report_dates'], arrays['exists'], arrays['values'], attrs['fields'])
+
+    @classmethod
+    def reset(cls):
+        """关闭已打开的存储, 存储重建后调用"""
+        cls._store = None
+        cls._store_checked = False
+        cls._csv_store = None
+
+    def has_symbol(self, symbol):
+        return symbol in self._symbol_idx
+
+    def _date_index(self, report_date):
+        """报告期在report_dates中的序号, 不存在时返回-1"""
+        report_date = np.datetime64(report_date, 'D')
+        k = int(self.report_dates.searchsorted(report_date))
+        if k < len(self.report_dates) and self.report_dates[k] == report_date:
+            return k
+        return -1
+
+    def get_report(self, symbol, report_date):
+        """
+        读取个股指定报告期的财务数据
+        Parameters:
+        --------
+        :param symbol: str
+            个股代码, 如SH600000
+        :param report_date: datetime-like
+            报告期
+        :return: pd.Series
+            index为ct.FIN_BASIC_DATA_HEADER, 与Utils.get_fin_basic_data的返回值一致; 没有数据时返回None
+        """
+        col = self._symbol_idx.get(symbol, -1)
+        row = self._date_index(report_date)
+        if col < 0 or row < 0 or not self._exists[row, col]:
+            return None
+        return Series([pd.Timestamp(self.report_dates[row])] + list(self._values[row, col]),
+                      index=['ReportDate'] + self.fields)
+
+    def get_report_panel(self, symbols, report_date, fields=None):
+        """
+        读取一组个股指定报告期的财务数据
+        Parameters:
+        --------
+        :param symbols: list of str
+            个股代码列表, 如SH600000
+        :param report_date: datetime-like
+            报告期
+        :param fields: list of str, 默认None
+            字段列表, 为None时读取全部字段
+        :return: pd.DataFrame
+            index为个股代码, columns为fields, 没有该报告期数据的个股不包含在内
+        """
+        if fields is None:
+            fields = self.fields
+        cols = np.array([self._symbol_idx.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        row = self._date_index(report_date)
+        if row < 0:
+            found = np.zeros(len(cols), dtype=bool)
+        else:
+            found = (cols >= 0) & self._exists[row, np.maximum(cols, 0)]
+        field_idxs = [self._field_idx[field] for field in fields]
+        if found.any():
+            values = self._values[row][cols[found]][:, field_idxs]
+        else:
+            values = np.empty((0, len(fields)))
+        return DataFrame(values, index=[symbol for symbol, b in zip(symbols, found) if b], columns=fields)
+
+    def get_ttm_panel(self, symbols, report_dates, fields):
+        """
+        计算一组个股的TTM财务数据, TTM值=最新报告期值+上年年报值-上年同期值
+        Parameters:
+        --------
+        :param symbols: list of str
+            个股代码列表, 如SH600000
+        :param report_dates: tuple of datetime-like
+            (最新报告期, 上年年报报告期, 上年同期报告期)
+        :param fields: list of str
+            需计算TTM值的字段
+        :return: pd.DataFrame
+            index为个股代码, columns为fields, 三个报告期中任一报告期没有数据的个股不包含在内
+        """
+        date1, date2, date3 = report_dates
+        panel1 = self.get_report_panel(symbols, date1, fields)
+        panel2 = self.get_report_panel(symbols, date2, fields)
+        panel3 = self.get_report_panel(symbols, date3, fields)
+        found = [symbol for symbol in panel1.index if symbol in panel2.index and symbol in panel3.index]
+        return panel1.loc[found] + panel2.loc[found] - panel3.loc[found]
+
+    @classmethod
+    def _read_csv(cls, file_path):
+        """读取个股的主要财务数据csv文件, 读取方式与Utils.get_fin_basic_data一致"""
+        df_fin_basic_data = pd.read_csv(file_path, na_values='--', parse_dates=[0],
+                                        names=ct.FIN_BASIC_DATA_HEADER, header=0)
+        df_fin_basic_data = df_fin_basic_data[df_fin_basic_data.ReportDate.notnull()]
+        df_fin_basic_data = df_fin_basic_data.drop_duplicates(subset='ReportDate', keep='first')
+        report_dates = np.array(df_fin_basic_data['ReportDate'], dtype='datetime64[D]')
+        values = np.column_stack([pd.to_numeric(df_fin_basic_data[field], errors='coerce').to_numpy(dtype=np.float64)
+                                  for field in ct.FIN_BASIC_DATA_HEADER[1:]])
+        return report_dates, values
+
+    @classmethod
+    def from_csv(cls):
+        """
+        读取fin_data_basics目录下全部个股的csv文件, 构建合并存储
+        :return: FinDataStore
+        """
+        fin_data_path = os.path.join(ct.DB_PATH, ct.FIN_BASIC_DATA_PATH)
+        symbols = sorted([os.path.splitext(f)[0] for f in os.listdir(fin_data_path) if f.endswith('.csv')])
+        fields = ct.FIN_BASIC_DATA_HEADER[1:]
+        secu_data = []
+        for symbol in symbols:
+            try:
+                secu_data.append(cls._read_csv(os.path.join(fin_data_path, '%s.csv' % symbol)))
+            except Exception as e:
+                logging.warning('Failed to read fin basic data of %s: %s' % (symbol, e))
+                secu_data.append((np.array([], dtype='datetime64[D]'), np.empty((0, len(fields)))))
+        if len(secu_data) > 0:
+            report_dates = np.unique(np.concatenate([dates for dates, _ in secu_data]))
+        else:
+            report_dates = np.array([], dtype='datetime64[D]')
+        exists = np.zeros((len(report_dates), len(symbols)), dtype=bool)
+        values = np.full((len(report_dates), len(symbols), len(fields)), np.nan)
+        for col, (dates, secu_values) in enumerate(secu_data):
+            rows = report_dates.searchsorted(dates)
+            exists[rows, col] = True
+            values[rows, col] = secu_values
+        return cls(np.array(symbols, dtype=str), report_dates, exists, values, fields)
+
+    @classmethod
+    def convert_from_csv(cls):
+        """把fin_data_basics目录下的csv文件转换为合并存储文件, 已存在的合并存储文件将被替换"""
+        # 记录开始构建的时间, 构建过程中被更新的csv文件也视为比合并存储更新
+        stamp = time.time_ns()
+        store = cls.from_csv()
+        store_path = os.path.join(ct.DB_PATH, ct.FIN_BASIC_DATA_STORE)
+        PackFile.write(store_path, [('symbols', store.symbols), ('report_dates', store.report_dates),
+                                    ('exists', store._exists), ('values', store._values)],
+                       attrs={'fields': store.fields, 'stamp': stamp})
+        cls.reset()
+        logging.info('Fin basic data store of %d securities, %d report dates saved.' %
+                     (len(store.symbols), len(store.report_dates)))
+
+
+if __name__ == '__main__':
+    FinDataStore.convert_from_csv()
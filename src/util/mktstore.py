@@ -0,0 +1,683 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 行情数据的列式存储
+# @Filename: mktstore
+# @Date:   : 2026-10-18 09:12
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import time
+import shutil
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from src.util import cons as ct
+from src.util.Cache import Cache
+from src.util.packfile import PackFile
+
+
+class DailyMktStore(object):
+    """
+    日行情列式存储
+    --------
+    把mkt_daily_FQ(NoFQ)目录下每个个股一个csv文件的日行情数据, 转换为按列存储的二进制文件, 读取时采用内存映射方式
+    存储目录结构:
+        symbols.npy: 证券代码数组
+        offsets.npy: 每个证券的行情数据在各列数组中的起止位置, 长度=证券数量+1
+        codes.npy: 每个证券的code列取值(仅复权行情)
+        date.npy: 日期列, datetime64[D], 每个证券内部按日期升序排列
+        <column>.npy: 其余各列数据, float64
+        stamp.npy: 开始转换的时间(纳秒)
+    csv文件在转换之后被更新(如每日追加行情)时, 该证券的列式存储已过期, 读取方应改为读取csv文件(见is_current)
+    """
+    _stores = {}    # 已打开的存储, key为存储目录
+
+    def __init__(self, store_path, header, csv_path=None):
+        self.store_path = store_path
+        self.header = header
+        self.csv_path = csv_path
+        stamp_path = os.path.join(store_path, 'stamp.npy')
+        if os.path.isfile(stamp_path):
+            self._stamp = int(np.load(stamp_path))
+        else:
+            self._stamp = os.stat(os.path.join(store_path, 'offsets.npy')).st_mtime_ns
+        self._current = {}  # 各证券的列式存储是否为最新, 每个进程只检查一次
+        self._num_columns = [col for col in header if col not in ('code', 'date')]
+        symbols = np.load(os.path.join(store_path, 'symbols.npy'))
+        self._symbol_idx = {symbol: k for k, symbol in enumerate(symbols)}
+        self._offsets = np.load(os.path.join(store_path, 'offsets.npy'))
+        if 'code' in header:
+            self._codes = np.load(os.path.join(store_path, 'codes.npy'), allow_pickle=True)
+        else:
+            self._codes = None
+        self._dates = np.load(os.path.join(store_path, 'date.npy'), mmap_mode='r')
+        self._columns = {col: np.load(os.path.join(store_path, '%s.npy' % col), mmap_mode='r')
+                         for col in self._num_columns}
+
+    @classmethod
+    def get_store(cls, fq):
+        """
+        取得日行情列式存储
+        Parameters:
+        --------
+        :param fq: bool
+            是否为复权行情
+        :return: DailyMktStore
+            如果未启用列式存储或列式存储不存在, 返回None
+        """
+        if not ct.USING_MKT_STORE:
+            return None
+        store_path, csv_path, header = _daily_mkt_paths(fq)
+        store = cls._stores.get(store_path)
+        if store is None:
+            if not os.path.isfile(os.path.join(store_path, 'offsets.npy')):
+                return None
+            store = cls(store_path, header, csv_path)
+            cls._stores[store_path] = store
+        return store
+
+    @classmethod
+    def reset(cls):
+        """关闭已打开的存储, 存储重建后调用"""
+        cls._stores = {}
+
+    def has_symbol(self, symbol):
+        return symbol in self._symbol_idx
+
+    def is_current(self, symbol):
+        """
+        证券的列式存储是否为最新, 即存储中包含该证券, 且其csv文件在转换之后没有更新
+        csv文件的修改时间在每个进程内只检查一次
+        :param symbol: str
+            证券代码, 如SH600000
+        :return: bool, 为False时应读取csv文件
+        """
+        if symbol not in self._symbol_idx:
+            return False
+        current = self._current.get(symbol)
+        if current is None:
+            current = True
+            if self.csv_path is not None:
+                try:
+                    current = os.stat(os.path.join(self.csv_path, '%s.csv' % symbol)).st_mtime_ns <= self._stamp
+                except OSError:
+                    pass
+            self._current[symbol] = current
+        return current
+
+    @property
+    def symbols(self):
+        return list(self._symbol_idx.keys())
+
+    def get_dates(self, symbol):
+        """
+        取得证券的日期序列
+        :param symbol: str
+            证券代码, 如SH600000
+        :return: np.array of datetime64[D], 升序排列, 为映射数组的切片
+        """
+        k = self._symbol_idx[symbol]
+        return self._dates[self._offsets[k]:self._offsets[k+1]]
+
+    def get_column(self, symbol, col):
+        """
+        取得证券某一列的数据
+        :param symbol: str
+            证券代码, 如SH600000
+        :param col: str
+            列名, 如close
+        :return: np.array, 为映射数组的切片
+        """
+        k = self._symbol_idx[symbol]
+        return self._columns[col][self._offsets[k]:self._offsets[k+1]]
+
+    def get_frame(self, symbol, lo=0, hi=None):
+        """
+        读取证券第lo至hi行(不含)的行情数据, 格式与csv文件读取的结果一致
+        Parameters:
+        --------
+        :param symbol: str
+            证券代码, 如SH600000
+        :param lo: int
+            开始行
+        :param hi: int, 默认None
+            结束行(不含), 为None时读取至最后一行
+        :return: pd.DataFrame
+            index为行情数据在该证券所有行情中的行号, 与读取csv文件得到的index一致
+        """
+        k = self._symbol_idx[symbol]
+        start, end = self._offsets[k], self._offsets[k+1]
+        if hi is None:
+            hi = end - start
+        lo = max(0, lo)
+        hi = max(lo, min(hi, end - start))
+        data = {}
+        for col in self.header:
+            if col == 'code':
+                data[col] = np.repeat(self._codes[k], hi - lo)
+            elif col == 'date':
+                data[col] = np.datetime_as_string(self._dates[start+lo:start+hi], unit='D').astype(object)
+            else:
+                data[col] = np.array(self._columns[col][start+lo:start+hi])
+        return DataFrame(data, columns=self.header, index=np.arange(lo, hi))
+
+    @classmethod
+    def convert_from_csv(cls, fq):
+        """
+        把日行情csv文件目录转换为列式存储, 已存在的列式存储将被替换
+        Parameters:
+        --------
+        :param fq: bool
+            是否为复权行情
+        :return: int
+            转换的证券数量
+        """
+        store_path, csv_path, header = _daily_mkt_paths(fq)
+        num_columns = [col for col in header if col not in ('code', 'date')]
+        # 记录开始转换的时间, 转换过程中被更新的csv文件也视为比存储更新
+        stamp = time.time_ns()
+        symbols = []
+        codes = []
+        lengths = []
+        dates = []
+        columns = {col: [] for col in num_columns}
+        for file_name in sorted(os.listdir(csv_path)):
+            symbol, ext = os.path.splitext(file_name)
+            if ext != '.csv':
+                continue
+            df_mkt = pd.read_csv(os.path.join(csv_path, file_name), names=header, header=0)
+            arr_dates = np.array(df_mkt['date'], dtype='datetime64[D]')
+            # 列式存储按日期二分查找, 要求每个证券的日期升序排列
+            if len(arr_dates) > 1 and np.any(arr_dates[1:] < arr_dates[:-1]):
+                order = np.argsort(arr_dates, kind='mergesort')
+                df_mkt = df_mkt.iloc[order]
+                arr_dates = arr_dates[order]
+            symbols.append(symbol)
+            codes.append(df_mkt['code'].iloc[0] if 'code' in header and len(df_mkt) > 0 else symbol)
+            lengths.append(len(df_mkt))
+            dates.append(arr_dates)
+            for col in num_columns:
+                columns[col].append(np.array(df_mkt[col], dtype=np.float64))
+        offsets = np.zeros(len(symbols)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        # 先写入临时目录, 再替换原存储目录, 避免读取到不完整的存储
+        tmp_path = store_path + '.tmp'
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'symbols.npy'), np.array(symbols, dtype=str))
+        np.save(os.path.join(tmp_path, 'codes.npy'), np.array(codes))
+        np.save(os.path.join(tmp_path, 'date.npy'), _concat(dates, 'datetime64[D]'))
+        for col in num_columns:
+            np.save(os.path.join(tmp_path, '%s.npy' % col), _concat(columns[col], np.float64))
+        np.save(os.path.join(tmp_path, 'offsets.npy'), offsets)
+        np.save(os.path.join(tmp_path, 'stamp.npy'), np.array(stamp, dtype=np.int64))
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+        os.rename(tmp_path, store_path)
+        cls._stores.pop(store_path, None)
+        return len(symbols)
+
+
+class DailyPanel(object):
+    """
+    日行情面板数据
+    --------
+    各字段为(交易日 × 证券)的二维数组, 证券在某个交易日没有行情数据(未上市、停牌)时取值为NaN
+        dates: 交易日序列, np.array of datetime64[D], 升序排列
+        symbols: 证券代码序列, np.array of str
+        first_dates: 每个证券第一天行情数据的日期(可能早于面板的开始日期), 没有行情数据时为NaT
+    """
+
+    def __init__(self, dates, symbols, data, first_dates):
+        self.dates = dates
+        self.symbols = symbols
+        self.data = data
+        self.first_dates = first_dates
+        self._symbol_idx = {symbol: k for k, symbol in enumerate(symbols)}
+
+    def __getitem__(self, field):
+        return self.data[field]
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols)
+
+    def symbol_index(self, symbols):
+        """
+        取得证券在面板中的列号
+        :param symbols: list-like of str
+            证券代码, 如SH600000
+        :return: np.array of int, 不在面板中的证券返回-1
+        """
+        return np.array([self._symbol_idx.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+
+    def date_index(self, date):
+        """
+        取得截止指定日期(含)的交易日数量, 即date对应的行号+1
+        :param date: np.datetime64 or str, 格式YYYY-MM-DD
+        :return: int
+        """
+        return int(self.dates.searchsorted(np.datetime64(date, 'D'), side='right'))
+
+    def valid(self, field='close'):
+        """有行情数据的标志矩阵"""
+        return ~np.isnan(self.data[field])
+
+    def tail(self, field, end_idx, n, cols=None):
+        """
+        取得各证券截止第end_idx行(不含)的最后n条有效数据(跳过停牌等缺失数据), 用于按证券自身的交易日计算
+        Parameters:
+        --------
+        :param field: str
+            字段名称
+        :param end_idx: int
+            截止行号(不含), 如date_index(calc_date)
+        :param n: int
+            数据条数
+        :param cols: np.array of int, 默认None
+            证券的列号, 为None时取全部证券
+        :return: tuple(values, rows, ok)
+            values: n × M数组, 按日期升序排列, 有效数据不足n条的证券前面几行为NaN
+            rows: n × M数组, values各元素在面板中的行号, 无数据时为-1
+            ok: M维bool数组, 证券的有效数据是否不少于n条
+        """
+        arr = self.data[field][:end_idx]
+        if cols is not None:
+            arr = arr[:, cols]
+        valid = ~np.isnan(arr)
+        # 每条有效数据自后往前的序号(从1开始)
+        rank = np.cumsum(valid[::-1], axis=0)[::-1]
+        r, c = np.nonzero(valid & (rank <= n))
+        values = np.full((n, arr.shape[1]), np.nan)
+        rows = np.full((n, arr.shape[1]), -1, dtype=np.int64)
+        values[n - rank[r, c], c] = arr[r, c]
+        rows[n - rank[r, c], c] = r
+        ok = valid.sum(axis=0) >= n
+        return values, rows, ok
+
+    @classmethod
+    def build(cls, dates, symbols, fields, reader):
+        """
+        构建日行情面板数据
+        Parameters:
+        --------
+        :param dates: np.array of datetime64[D]
+            交易日序列, 升序排列
+        :param symbols: list-like of str
+            证券代码序列
+        :param fields: list of str
+            字段名称, 如['close', 'amount']
+        :param reader: callable
+            reader(symbol)返回证券的(日期序列, {字段: 数组}), 没有行情数据时返回None
+        :return: DailyPanel
+        """
+        symbols = np.array(symbols, dtype=str)
+        data = {field: np.full((len(dates), len(symbols)), np.nan) for field in fields}
+        first_dates = np.full(len(symbols), np.datetime64('NaT'), dtype='datetime64[D]')
+        if len(dates) > 0:
+            for j, symbol in enumerate(symbols):
+                secu_data = reader(symbol)
+                if secu_data is None:
+                    continue
+                secu_dates, secu_columns = secu_data
+                if len(secu_dates) == 0:
+                    continue
+                first_dates[j] = secu_dates[0]
+                lo = secu_dates.searchsorted(dates[0], side='left')
+                hi = secu_dates.searchsorted(dates[-1], side='right')
+                if hi <= lo:
+                    continue
+                # 只保留交易日序列中的日期
+                pos = dates.searchsorted(secu_dates[lo:hi])
+                pos[pos >= len(dates)] = len(dates) - 1
+                keep = dates[pos] == secu_dates[lo:hi]
+                for field in fields:
+                    data[field][pos[keep], j] = np.asarray(secu_columns[field][lo:hi])[keep]
+        return cls(dates, symbols, data, first_dates)
+
+
+class MinMktStore(object):
+    """
+    分钟行情按日存储
+    --------
+    把mkt_1min_FQ(NoFQ)/<YYYY-MM-DD>/目录下每个证券一个csv文件的分钟行情数据, 转换为每个交易日一个打包文件<YYYY-MM-DD>.pack,
+    读取时采用内存映射方式
+    打包文件包含的数组:
+        symbols: 证券代码
+        codes: 每个证券code列的取值
+        offsets: 每个证券的分钟行情在各列数组中的起止位置, 长度=证券数量+1
+        datetime: 时间列, 定长字节串
+        <column>: 其余各列数据, float64
+    """
+    _days = Cache(60)   # 已打开的交易日分钟行情存储, key为文件路径
+
+    def __init__(self, arrays):
+        self._arrays = arrays
+        self._symbol_idx = {symbol: k for k, symbol in enumerate(arrays['symbols'].tolist())}
+        self._offsets = arrays['offsets']
+
+    @classmethod
+    def get_day(cls, trade_date, fq):
+        """
+        取得指定交易日的分钟行情存储
+        Parameters:
+        --------
+        :param trade_date: str
+            交易日, 格式YYYY-MM-DD
+        :param fq: bool
+            是否为复权行情
+        :return: MinMktStore
+            如果未启用列式存储或该交易日的存储文件不存在, 返回None
+        """
+        if not ct.USING_MKT_STORE:
+            return None
+        file_path = os.path.join(_min_mkt_paths(fq)[0], '%s.pack' % trade_date)
+        day = cls._days.get(file_path)
+        if day is None:
+            if not os.path.isfile(file_path):
+                return None
+            day = cls(PackFile.read(file_path)[0])
+            cls._days.set(file_path, day)
+        return day
+
+    @classmethod
+    def reset(cls):
+        """关闭已打开的存储, 存储重建后调用"""
+        cls._days = Cache(60)
+
+    def has_symbol(self, symbol):
+        return symbol in self._symbol_idx
+
+    @property
+    def symbols(self):
+        return list(self._symbol_idx.keys())
+
+    def get_column(self, symbol, col):
+        """
+        取得证券当日分钟行情某一列的数据
+        :param symbol: str
+            证券代码, 如SH600000
+        :param col: str
+            列名, 如close
+        :return: np.array, 为映射数组的切片
+        """
+        k = self._symbol_idx[symbol]
+        return self._arrays[col][self._offsets[k]:self._offsets[k+1]]
+
+    def get_all(self, col):
+        """
+        取得当日全部证券首尾相接的某一列数据, 各证券的起止位置见offsets
+        :param col: str
+            列名, 如datetime, close
+        :return: np.array, 为映射数组
+        """
+        return self._arrays[col]
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    def get_frame(self, symbol):
+        """
+        读取证券当日的分钟行情数据, 格式与csv文件读取的结果一致
+        :param symbol: str
+            证券代码, 如SH600000
+        :return: pd.DataFrame
+        """
+        k = self._symbol_idx[symbol]
+        start, end = self._offsets[k], self._offsets[k+1]
+        data = {}
+        for col in ct.MKT_MIN_FQ_HEADER:
+            if col == 'code':
+                data[col] = np.repeat(self._arrays['codes'][k], end - start).astype(object)
+            elif col == 'datetime':
+                data[col] = self._arrays['datetime'][start:end].astype(str).astype(object)
+            else:
+                data[col] = np.array(self._arrays[col][start:end])
+        return DataFrame(data, columns=ct.MKT_MIN_FQ_HEADER)
+
+    @classmethod
+    def convert_from_csv(cls, fq, trade_dates=None, overwrite=False):
+        """
+        把分钟行情csv文件目录转换为按日存储
+        Parameters:
+        --------
+        :param fq: bool
+            是否为复权行情
+        :param trade_dates: list of str, 默认None
+            需转换的交易日列表, 格式YYYY-MM-DD, 为None时转换csv目录下的全部交易日
+        :param overwrite: bool, 默认False
+            是否覆盖已存在的存储文件
+        :return: int
+            转换的交易日数量
+        """
+        store_path, csv_path = _min_mkt_paths(fq)
+        if not os.path.exists(store_path):
+            os.makedirs(store_path)
+        if trade_dates is None:
+            trade_dates = sorted([d for d in os.listdir(csv_path) if os.path.isdir(os.path.join(csv_path, d))])
+        num_columns = [col for col in ct.MKT_MIN_FQ_HEADER if col not in ('code', 'datetime')]
+        converted = 0
+        for trade_date in trade_dates:
+            file_path = os.path.join(store_path, '%s.pack' % trade_date)
+            day_path = os.path.join(csv_path, trade_date)
+            if not os.path.isdir(day_path) or (os.path.isfile(file_path) and not overwrite):
+                continue
+            symbols = []
+            codes = []
+            lengths = []
+            datetimes = []
+            columns = {col: [] for col in num_columns}
+            for file_name in sorted(os.listdir(day_path)):
+                symbol, ext = os.path.splitext(file_name)
+                if ext != '.csv':
+                    continue
+                df_mkt = pd.read_csv(os.path.join(day_path, file_name), names=ct.MKT_MIN_FQ_HEADER, skiprows=[0])
+                symbols.append(symbol)
+                codes.append(str(df_mkt['code'].iloc[0]) if len(df_mkt) > 0 else symbol)
+                lengths.append(len(df_mkt))
+                datetimes.append(np.array(df_mkt['datetime'].astype(str), dtype=bytes))
+                for col in num_columns:
+                    columns[col].append(np.array(df_mkt[col], dtype=np.float64))
+            offsets = np.zeros(len(symbols)+1, dtype=np.int64)
+            offsets[1:] = np.cumsum(lengths)
+            arrays = [('symbols', np.array(symbols, dtype=str)),
+                      ('codes', np.array(codes, dtype=str)),
+                      ('offsets', offsets),
+                      ('datetime', _concat(datetimes, bytes))]
+            arrays += [(col, _concat(columns[col], np.float64)) for col in num_columns]
+            PackFile.write(file_path, arrays, {'trade_date': trade_date})
+            # 使已打开的旧存储失效
+            cls._days.set(file_path, None)
+            converted += 1
+        return converted
+
+
+class CheckpointPrices(object):
+    """
+    日内时点价格表
+    --------
+    从复权分钟行情中提取每个证券每天在ct.MKT_CHECKPOINTS各时点的价格, 每个交易日保存为一个打包文件<YYYY-MM-DD>.pack
+    打包文件包含的数组:
+        symbols: 证券代码
+        prices: 证券数量 × 时点数量的价格矩阵, 缺少对应时点分钟线的为NaN
+    """
+    _days = Cache(60)   # 已打开的交易日时点价格表, key为文件路径
+
+    def __init__(self, arrays, checkpoints):
+        self._prices = arrays['prices']
+        self._symbol_idx = {symbol: k for k, symbol in enumerate(arrays['symbols'].tolist())}
+        self._checkpoint_idx = {checkpoint: k for k, checkpoint in enumerate(checkpoints)}
+
+    @classmethod
+    def get_day(cls, trade_date):
+        """
+        取得指定交易日的时点价格表
+        :param trade_date: str
+            交易日, 格式YYYY-MM-DD
+        :return: CheckpointPrices, 时点价格表不存在或时点设置已改变时返回None
+        """
+        file_path = os.path.join(ct.DB_PATH, ct.MKT_CHECKPOINT_FQ, '%s.pack' % trade_date)
+        day = cls._days.get(file_path)
+        if day is None:
+            if not os.path.isfile(file_path):
+                return None
+            arrays, attrs = PackFile.read(file_path)
+            if attrs.get('checkpoints') != [list(checkpoint) for checkpoint in ct.MKT_CHECKPOINTS]:
+                return None
+            day = cls(arrays, [checkpoint[0] for checkpoint in ct.MKT_CHECKPOINTS])
+            cls._days.set(file_path, day)
+        return day
+
+    def has_symbol(self, symbol):
+        return symbol in self._symbol_idx
+
+    def get_prices(self, symbol, checkpoints):
+        """
+        取得证券在各时点的价格
+        :param symbol: str
+            证券代码, 如SH600000
+        :param checkpoints: list of str
+            时点名称, 如['p0930', 'p1500']
+        :return: np.array
+        """
+        return self._prices[self._symbol_idx[symbol], [self._checkpoint_idx[checkpoint] for checkpoint in checkpoints]]
+
+    def get_prices_batch(self, symbols, checkpoints):
+        """
+        取得一组证券在各时点的价格
+        :param symbols: list of str
+            证券代码列表, 如['SH600000', 'SZ000002']
+        :param checkpoints: list of str
+            时点名称, 如['p0930', 'p1500']
+        :return: tuple(np.array, np.array)
+            0. 证券数量 × 时点数量的价格矩阵, 时点价格表中没有的证券为NaN
+            1. 证券是否在时点价格表中, bool数组
+        """
+        rows = np.array([self._symbol_idx.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        has_data = rows >= 0
+        prices = np.full((len(symbols), len(checkpoints)), np.nan)
+        prices[has_data] = self._prices[rows[has_data]][:, [self._checkpoint_idx[checkpoint] for checkpoint in checkpoints]]
+        return prices, has_data
+
+    @classmethod
+    def extract(cls, trade_date, datetimes, offsets, columns):
+        """
+        从一个交易日全部证券的分钟行情中提取各时点的价格
+        Parameters:
+        --------
+        :param trade_date: str
+            交易日, 格式YYYY-MM-DD
+        :param datetimes: np.array of bytes
+            全部证券首尾相接的分钟线时间
+        :param offsets: np.array of int
+            每个证券的分钟线在datetimes中的起止位置, 长度=证券数量+1
+        :param columns: dict
+            价格字段对应的数组, 与datetimes对应
+        :return: np.array, 证券数量 × 时点数量的价格矩阵
+        """
+        prices = np.full((len(offsets)-1, len(ct.MKT_CHECKPOINTS)), np.nan)
+        for j, (_, checkpoint_time, field) in enumerate(ct.MKT_CHECKPOINTS):
+            idxs = np.nonzero(datetimes == ('%s %s' % (trade_date, checkpoint_time)).encode())[0]
+            secu_idxs = offsets.searchsorted(idxs, side='right') - 1
+            # 同一证券有多条对应时点的分钟线时取第一条
+            secu_idxs, first = np.unique(secu_idxs, return_index=True)
+            prices[secu_idxs, j] = np.asarray(columns[field])[idxs[first]]
+        return prices
+
+    @classmethod
+    def build(cls, trade_dates=None, overwrite=False):
+        """
+        生成时点价格表, 优先从分钟行情按日存储提取, 存储中没有时读取分钟行情csv文件
+        Parameters:
+        --------
+        :param trade_dates: list of str, 默认None
+            交易日列表, 格式YYYY-MM-DD, 为None时处理复权分钟行情csv目录下的全部交易日
+        :param overwrite: bool, 默认False
+            是否覆盖已存在的时点价格表
+        :return: int
+            生成的交易日数量
+        """
+        store_path = os.path.join(ct.DB_PATH, ct.MKT_CHECKPOINT_FQ)
+        csv_path = _min_mkt_paths(True)[1]
+        if not os.path.exists(store_path):
+            os.makedirs(store_path)
+        if trade_dates is None:
+            trade_dates = sorted([d for d in os.listdir(csv_path) if os.path.isdir(os.path.join(csv_path, d))])
+        fields = sorted(set([checkpoint[2] for checkpoint in ct.MKT_CHECKPOINTS]))
+        built = 0
+        for trade_date in trade_dates:
+            file_path = os.path.join(store_path, '%s.pack' % trade_date)
+            if os.path.isfile(file_path) and not overwrite:
+                continue
+            min_store = MinMktStore.get_day(trade_date, True)
+            if min_store is not None:
+                symbols = min_store.symbols
+                datetimes = min_store.get_all('datetime')
+                offsets = min_store.offsets
+                columns = {field: min_store.get_all(field) for field in fields}
+            else:
+                day_path = os.path.join(csv_path, trade_date)
+                if not os.path.isdir(day_path):
+                    continue
+                symbols = []
+                lengths = []
+                list_datetimes = []
+                list_columns = {field: [] for field in fields}
+                for file_name in sorted(os.listdir(day_path)):
+                    symbol, ext = os.path.splitext(file_name)
+                    if ext != '.csv':
+                        continue
+                    df_mkt = pd.read_csv(os.path.join(day_path, file_name), names=ct.MKT_MIN_FQ_HEADER, skiprows=[0])
+                    symbols.append(symbol)
+                    lengths.append(len(df_mkt))
+                    list_datetimes.append(np.array(df_mkt['datetime'].astype(str), dtype=bytes))
+                    for field in fields:
+                        list_columns[field].append(np.array(df_mkt[field], dtype=np.float64))
+                offsets = np.zeros(len(symbols)+1, dtype=np.int64)
+                offsets[1:] = np.cumsum(lengths)
+                datetimes = _concat(list_datetimes, bytes)
+                columns = {field: _concat(list_columns[field], np.float64) for field in fields}
+            prices = cls.extract(trade_date, datetimes, offsets, columns)
+            PackFile.write(file_path, [('symbols', np.array(symbols, dtype=str)), ('prices', prices)],
+                           {'checkpoints': [list(checkpoint) for checkpoint in ct.MKT_CHECKPOINTS]})
+            # 使已打开的旧时点价格表失效
+            cls._days.set(file_path, None)
+            built += 1
+        return built
+
+
+def _min_mkt_paths(fq):
+    """返回分钟行情按日存储目录及csv文件目录"""
+    if fq:
+        return os.path.join(ct.DB_PATH, ct.MKT_MIN_FQ_STORE), os.path.join(ct.DB_PATH, ct.MKT_MIN_FQ)
+    else:
+        return os.path.join(ct.DB_PATH, ct.MKT_MIN_NOFQ_STORE), os.path.join(ct.DB_PATH, ct.MKT_MIN_NOFQ)
+
+
+def _daily_mkt_paths(fq):
+    """返回日行情列式存储目录、csv文件目录及表头"""
+    if fq:
+        return (os.path.join(ct.DB_PATH, ct.MKT_DAILY_FQ_STORE), os.path.join(ct.DB_PATH, ct.MKT_DAILY_FQ),
+                ct.MKT_DAILY_FQ_HEADER)
+    else:
+        return (os.path.join(ct.DB_PATH, ct.MKT_DAILY_NOFQ_STORE), os.path.join(ct.DB_PATH, ct.MKT_DAILY_NOFQ),
+                ct.MKT_DAILY_NOFQ_HEADER)
+
+
+def _concat(arrays, dtype):
+    if len(arrays) == 0:
+        return np.array([], dtype=dtype)
+    return np.concatenate(arrays).astype(dtype)
+
+
+if __name__ == '__main__':
+    # 把日行情csv文件转换为列式存储
+    print('converted %d symbols.' % DailyMktStore.convert_from_csv(fq=True))
+    print('converted %d symbols.' % DailyMktStore.convert_from_csv(fq=False))
+    # 把分钟行情csv文件转换为按日存储
+    print('converted %d days.' % MinMktStore.convert_from_csv(fq=True))
+    # 生成日内时点价格表
+    print('built %d days.' % CheckpointPrices.build())
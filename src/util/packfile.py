@@ -0,0 +1,107 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 多个数组打包存储为单个二进制文件, 读取时采用内存映射方式
+# @Filename: packfile
+# @Date:   : 2026-10-18 14:20
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import json
+import struct
+import numpy as np
+
+
+class PackFile(object):
+    """
+    数组打包文件
+    --------
+    文件结构:
+        magic: 8字节, b'MFPACK01'
+        meta_len: 8字节, little-endian uint64, 元数据长度
+        meta: json格式的元数据, 包括各数组的名称、dtype、shape、在文件中的偏移量及附加属性attrs
+        各数组的数据, 起始位置按_ALIGN字节对齐
+    读取时整个文件只做一次内存映射, 各数组为映射内存的视图, 不复制数据
+    """
+    _MAGIC = b'MFPACK01'
+    _ALIGN = 64
+
+    @classmethod
+    def write(cls, file_path, arrays, attrs=None):
+        """
+        把多个数组写入打包文件, 先写入临时文件再替换, 避免读取到不完整的文件
+        Parameters:
+        --------
+        :param file_path: str
+            文件路径
+        :param arrays: dict or list of tuple(name, np.array)
+            需保存的数组, 数组的dtype不能为object
+        :param attrs: dict, 默认None
+            附加属性, 需可序列化为json
+        :return:
+        """
+        if isinstance(arrays, dict):
+            arrays = list(arrays.items())
+        arrays = [(name, np.ascontiguousarray(arr)) for name, arr in arrays]
+        # 计算各数组的偏移量(相对于数据区起始位置)
+        meta_arrays = []
+        offset = 0
+        for name, arr in arrays:
+            meta_arrays.append({'name': name, 'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset})
+            offset = _align(offset + arr.nbytes, cls._ALIGN)
+        meta = json.dumps({'arrays': meta_arrays, 'attrs': attrs or {}}).encode('utf-8')
+        data_start = _align(len(cls._MAGIC) + 8 + len(meta), cls._ALIGN)
+        tmp_path = file_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(cls._MAGIC)
+            f.write(struct.pack('<Q', len(meta)))
+            f.write(meta)
+            for (name, arr), meta_array in zip(arrays, meta_arrays):
+                f.seek(data_start + meta_array['offset'])
+                f.write(arr.tobytes())
+            # 保证文件长度覆盖最后一个数组对齐后的位置
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def read(cls, file_path):
+        """
+        读取打包文件
+        Parameters:
+        --------
+        :param file_path: str
+            文件路径
+        :return: tuple(dict, dict)
+            0. 数组, key为数组名称, value为只读的内存映射数组
+            1. 附加属性
+        """
+        with open(file_path, 'rb') as f:
+            magic = f.read(len(cls._MAGIC))
+            if magic != cls._MAGIC:
+                raise ValueError('%s is not a pack file.' % file_path)
+            meta_len = struct.unpack('<Q', f.read(8))[0]
+            meta = json.loads(f.read(meta_len).decode('utf-8'))
+        data_start = _align(len(cls._MAGIC) + 8 + meta_len, cls._ALIGN)
+        if os.path.getsize(file_path) > 0:
+            buf = np.memmap(file_path, dtype=np.uint8, mode='r')
+        else:
+            buf = np.zeros(0, dtype=np.uint8)
+        arrays = {}
+        for meta_array in meta['arrays']:
+            dtype = np.dtype(meta_array['dtype'])
+            shape = tuple(meta_array['shape'])
+            nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            start = data_start + meta_array['offset']
+            if nbytes == 0:
+                arrays[meta_array['name']] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[meta_array['name']] = buf[start:start+nbytes].view(dtype).reshape(shape)
+        return arrays, meta['attrs']
+
+
+def _align(n, align):
+    return (n + align - 1) // align * align
+
+
+if __name__ == '__main__':
+    pass
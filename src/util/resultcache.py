@@ -0,0 +1,155 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 个股因子计算结果的磁盘缓存, 以计算输入的内容为key, 重复计算时直接读取
+# @Filename: resultcache
+# @Date:   : 2026-10-18 19:10
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import json
+import pickle
+import hashlib
+import logging
+from src.util import cons as ct
+
+
+class ResultCache(object):
+    """
+    计算结果磁盘缓存
+    --------
+    key为以下内容的哈希值:
+        因子名称、个股代码、计算日期、因子配置参数、计算所用输入文件的修改时间
+    因此因子参数或行情数据发生变化后, 对应的缓存自然失效, 不需要手工清理
+    每个结果保存为ct.RESULT_CACHE_PATH/<key前2位>/<key>.pkl, 先写入临时文件再替换, 进程池的各进程可同时读写
+    读取命中时更新文件的修改时间, 缓存总大小超过ct.RESULT_CACHE_MAXBYTES时按修改时间淘汰最久未使用的结果
+    只缓存计算成功的结果, 计算结果为None(无法计算, 包括读取数据时的临时错误)时不缓存, 重新计算时再次尝试
+    淘汰需遍历全部缓存文件, 由因子的calc_factor_loading在计算完全部日期后调用一次
+    """
+
+    @classmethod
+    def _cache_dir(cls):
+        return os.path.join(ct.DB_PATH, ct.RESULT_CACHE_PATH)
+
+    @classmethod
+    def file_stamps(cls, file_paths):
+        """
+        输入文件的修改时间
+        :param file_paths: list of str
+        :return: list of [str, int]
+            文件路径及修改时间(纳秒), 文件不存在时修改时间为-1
+        """
+        stamps = []
+        for file_path in file_paths:
+            try:
+                stamps.append([file_path, os.stat(file_path).st_mtime_ns])
+            except OSError:
+                stamps.append([file_path, -1])
+        return stamps
+
+    @classmethod
+    def make_key(cls, name, code, calc_date, params=None, input_files=None):
+        """
+        生成缓存key
+        Parameters:
+        --------
+        :param name: str
+            因子名称
+        :param code: str
+            个股代码
+        :param calc_date: datetime-like
+            计算日期
+        :param params: dict, 默认None
+            因子配置参数, 需可序列化为json
+        :param input_files: list of str, 默认None
+            计算所用的输入文件
+        :return: str
+        """
+        content = json.dumps([name, str(code), calc_date.strftime('%Y%m%d') if hasattr(calc_date, 'strftime') else str(calc_date),
+                              params, cls.file_stamps(input_files or [])], sort_keys=True, default=str)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _file_path(cls, key):
+        return os.path.join(cls._cache_dir(), key[:2], '%s.pkl' % key)
+
+    @classmethod
+    def get(cls, key):
+        """
+        读取缓存的计算结果
+        :param key: str
+        :return: tuple(bool, object)
+            是否命中, 计算结果
+        """
+        file_path = cls._file_path(key)
+        try:
+            with open(file_path, 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        try:
+            os.utime(file_path, None)
+        except OSError:
+            pass
+        return True, result
+
+    @classmethod
+    def put(cls, key, result):
+        """
+        保存计算结果
+        :param key: str
+        :param result: object, 需可pickle
+        """
+        file_path = cls._file_path(key)
+        tmp_path = '%s.%d.tmp' % (file_path, os.getpid())
+        try:
+            if not os.path.exists(os.path.dirname(file_path)):
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            logging.warning('Failed to save result cache %s: %s' % (key, e))
+
+    @classmethod
+    def evict(cls, maxbytes=None):
+        """
+        缓存总大小超过限制时, 按修改时间淘汰最久未使用的结果
+        :param maxbytes: int, 默认None
+            缓存大小上限(字节), 为None时取ct.RESULT_CACHE_MAXBYTES
+        :return: int, 淘汰的结果数量
+        """
+        if maxbytes is None:
+            maxbytes = ct.RESULT_CACHE_MAXBYTES
+        cache_dir = cls._cache_dir()
+        if maxbytes is None or not os.path.isdir(cache_dir):
+            return 0
+        entries = []
+        total = 0
+        for sub_dir in os.scandir(cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.name.endswith('.pkl'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total <= maxbytes:
+            return 0
+        entries.sort()
+        evicted = 0
+        for _, size, file_path in entries:
+            if total <= maxbytes:
+                break
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        logging.info('Result cache evicted %d results.' % evicted)
+        return evicted
+
+
+if __name__ == '__main__':
+    ResultCache.evict()
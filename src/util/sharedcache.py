@@ -0,0 +1,277 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 跨进程共享的数据缓存, 基于共享内存, 进程池的各进程共用一份已解析的数据
+# @Filename: sharedcache
+# @Date:   : 2026-10-18 18:40
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import re
+import time
+import uuid
+import json
+import struct
+import atexit
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+from src.util import cons as ct
+
+_SHM_DIR = '/dev/shm'   # Linux下共享内存块所在目录
+
+
+class SharedCache(object):
+    """
+    共享内存缓存
+    --------
+    每个缓存条目保存为一个共享内存块, 块名称由运行id和key的哈希值确定, 因此不需要额外的索引:
+    任一进程写入的条目, 其他进程按同一key即可找到
+    共享内存块的结构:
+        ready: 1字节, 写入完成后置为1, 读取时未写入完成的条目视为不存在
+        meta_len: 8字节, little-endian uint64, 元数据长度
+        meta: json格式的元数据, 包括条目类型、各数组的名称、dtype、shape及偏移量
+        各数组的数据, 起始位置按_ALIGN字节对齐
+    支持的条目类型为DataFrame和np.ndarray, 读取时复制数据, 不持有共享内存块
+    运行id在第一次使用时设置为<当前进程id>x<随机数>并写入环境变量, 之后创建的子进程继承同一运行id;
+    随机数保证进程id被复用时, 异常退出(如被kill)的运行遗留的共享内存块不会被新的运行当作缓存命中
+    设置运行id的进程退出时删除本次运行创建的全部共享内存块, 并在设置运行id时删除进程已不存在的运行遗留的共享内存块
+    """
+    _RUN_ID_ENV = 'MULTIFACTOR_SHARED_CACHE_RUN'
+    _ALIGN = 64
+    _created = []   # 本进程创建的共享内存块名称
+    _owner_pid = None   # 设置运行id的进程id
+
+    @classmethod
+    def get_run_id(cls):
+        """取得运行id, 未设置时以当前进程id及随机数生成运行id, 并在进程退出时清理共享内存"""
+        run_id = os.environ.get(cls._RUN_ID_ENV)
+        if run_id is None:
+            run_id = '%dx%s' % (os.getpid(), uuid.uuid4().hex[:6])
+            os.environ[cls._RUN_ID_ENV] = run_id
+            cls._owner_pid = os.getpid()
+            atexit.register(cls.cleanup)
+            cls._remove_orphans()
+        return run_id
+
+    @classmethod
+    def _block_name(cls, key):
+        return 'mf%s_%s' % (cls.get_run_id(), hashlib.sha1(key.encode('utf-8')).hexdigest()[:14])
+
+    @classmethod
+    def _remove_orphans(cls):
+        """删除所属进程已不存在的运行遗留的共享内存块(Linux下位于/dev/shm)"""
+        if not os.path.isdir(_SHM_DIR):
+            return
+        for name in os.listdir(_SHM_DIR):
+            matched = re.match(r'^mf(\d+)x[0-9a-f]+_[0-9a-f]+$', name)
+            if matched is None:
+                continue
+            try:
+                os.kill(int(matched.group(1)), 0)
+            except ProcessLookupError:
+                cls._unlink(name)
+            except OSError:
+                pass
+
+    @classmethod
+    def _unlink(cls, name):
+        """删除共享内存块, 块不存在时忽略"""
+        try:
+            # 由resource_tracker跟踪后再删除, 与unlink时的取消跟踪相对应
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+        except ValueError:
+            # 大小为0的块(创建过程中断)无法映射, 直接删除
+            try:
+                os.remove(os.path.join(_SHM_DIR, name))
+            except OSError:
+                pass
+        except (FileNotFoundError, OSError):
+            pass
+
+    @classmethod
+    def _is_abandoned(cls, name):
+        """
+        共享内存块是否已被放弃, 即创建后超过ct.SHARED_CACHE_STALE_SECONDS秒仍未写入完成(写入进程已异常退出)
+        只能在Linux下根据/dev/shm中文件的创建时间判断, 其他平台返回False
+        """
+        file_path = os.path.join(_SHM_DIR, name)
+        try:
+            if time.time() - os.stat(file_path).st_ctime <= ct.SHARED_CACHE_STALE_SECONDS:
+                return False
+            if os.path.getsize(file_path) == 0:
+                return True
+            shm = cls._open(name)
+        except (FileNotFoundError, OSError, ValueError):
+            return False
+        try:
+            return shm.buf[0] != 1
+        finally:
+            shm.close()
+
+    @classmethod
+    def _open(cls, name, create=False, size=0):
+        """
+        打开共享内存块, 不由resource_tracker跟踪(由运行id所属进程统一删除)
+        打开已有的块时, 如果块的大小仍为0(其他进程正在创建), 抛出ValueError, 不打开文件描述符
+        """
+        if not create and os.path.isdir(_SHM_DIR) and os.path.getsize(os.path.join(_SHM_DIR, name)) == 0:
+            raise ValueError('Shared memory block %s is being created.' % name)
+        try:
+            return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+            try:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+            return shm
+
+    @classmethod
+    def get(cls, key):
+        """
+        读取缓存条目
+        :param key: str
+        :return: DataFrame or np.ndarray, 条目不存在或未写入完成时返回None
+        """
+        if not ct.USING_SHARED_CACHE:
+            return None
+        try:
+            shm = cls._open(cls._block_name(key))
+        except (FileNotFoundError, OSError, ValueError):
+            # 其他进程已创建共享内存块但尚未设置大小时, 映射空文件抛出ValueError, 视为条目不存在
+            return None
+        try:
+            buf = shm.buf
+            if buf[0] != 1:
+                return None
+            meta_len = struct.unpack('<Q', bytes(buf[1:9]))[0]
+            meta = json.loads(bytes(buf[9:9+meta_len]).decode('utf-8'))
+            data_start = _align(9 + meta_len, cls._ALIGN)
+            arrays = {}
+            for meta_array in meta['arrays']:
+                dtype = np.dtype(meta_array['dtype'])
+                shape = tuple(meta_array['shape'])
+                count = int(np.prod(shape, dtype=np.int64))
+                start = data_start + meta_array['offset']
+                arrays[meta_array['name']] = np.frombuffer(buf, dtype=dtype, count=count, offset=start).reshape(shape).copy()
+            return _decode(meta, arrays)
+        finally:
+            del buf
+            shm.close()
+
+    @classmethod
+    def put(cls, key, value):
+        """
+        写入缓存条目, 同一key的条目已存在(包括其他进程正在写入)时不写入
+        :param key: str
+        :param value: DataFrame or np.ndarray
+        :return: bool, 是否写入
+        """
+        if not ct.USING_SHARED_CACHE:
+            return False
+        meta, arrays = _encode(value)
+        offset = 0
+        meta_arrays = []
+        for name, arr in arrays:
+            meta_arrays.append({'name': name, 'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset})
+            offset = _align(offset + arr.nbytes, cls._ALIGN)
+        meta['arrays'] = meta_arrays
+        meta_bytes = json.dumps(meta).encode('utf-8')
+        data_start = _align(9 + len(meta_bytes), cls._ALIGN)
+        name = cls._block_name(key)
+        try:
+            shm = cls._open(name, create=True, size=max(data_start + offset, 1))
+        except FileExistsError:
+            if not cls._is_abandoned(name):
+                return False
+            # 写入进程异常退出遗留的未完成的块, 删除后重新写入
+            cls._unlink(name)
+            try:
+                shm = cls._open(name, create=True, size=max(data_start + offset, 1))
+            except OSError:
+                return False
+        except OSError as e:
+            logging.warning('Failed to create shared cache block for %s: %s' % (key, e))
+            return False
+        cls._created.append(name)
+        try:
+            buf = shm.buf
+            buf[1:9] = struct.pack('<Q', len(meta_bytes))
+            buf[9:9+len(meta_bytes)] = meta_bytes
+            for (_, arr), meta_array in zip(arrays, meta_arrays):
+                start = data_start + meta_array['offset']
+                buf[start:start+arr.nbytes] = arr.tobytes()
+            buf[0] = 1
+        finally:
+            del buf
+            shm.close()
+        return True
+
+    @classmethod
+    def cleanup(cls):
+        """删除本次运行创建的全部共享内存块, 只在运行id所属进程中执行"""
+        run_id = os.environ.get(cls._RUN_ID_ENV)
+        if run_id is None or cls._owner_pid != os.getpid():
+            return
+        names = set(cls._created)
+        prefix = 'mf%s_' % run_id
+        # 子进程创建的共享内存块(Linux下位于/dev/shm)
+        if os.path.isdir(_SHM_DIR):
+            names.update([f for f in os.listdir(_SHM_DIR) if f.startswith(prefix)])
+        for name in names:
+            cls._unlink(name)
+        cls._created = []
+
+
+def _align(n, align):
+    return (n + align - 1) // align * align
+
+
+def _encode(value):
+    """把缓存条目转换为元数据和数组列表, DataFrame的object/字符串列转换为定长unicode数组"""
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            raise TypeError('Object arrays can not be put into shared cache.')
+        return {'type': 'array'}, [('value', np.ascontiguousarray(value))]
+    if isinstance(value, pd.DataFrame):
+        meta = {'type': 'frame'}
+        if isinstance(value.index, pd.RangeIndex):
+            meta['range_index'] = [value.index.start, value.index.stop, value.index.step]
+            arrays = []
+        else:
+            index = np.asarray(value.index)
+            arrays = [('index', np.ascontiguousarray(index.astype(str) if index.dtype == object else index))]
+        columns = []
+        for k, column in enumerate(value.columns):
+            arr = value.iloc[:, k].to_numpy()
+            is_str = arr.dtype == object or not isinstance(value.iloc[:, k].dtype, np.dtype)
+            if is_str:
+                arr = arr.astype(str)
+            arrays.append(('c%d' % k, np.ascontiguousarray(arr)))
+            columns.append([str(column), is_str])
+        meta['columns'] = columns
+        return meta, arrays
+    raise TypeError('Unsupported shared cache value type: %s' % type(value))
+
+
+def _decode(meta, arrays):
+    if meta['type'] == 'array':
+        return arrays['value']
+    data = {}
+    for k, (column, is_str) in enumerate(meta['columns']):
+        arr = arrays['c%d' % k]
+        data[column] = arr.astype(object) if is_str else arr
+    if 'range_index' in meta:
+        index = pd.RangeIndex(*meta['range_index'])
+    else:
+        index = arrays['index']
+    return pd.DataFrame(data, index=index, columns=[column for column, _ in meta['columns']])
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,120 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 按系统资源(负载、内存、打开文件数)自适应暂停, 替代固定时长的time.sleep
+# @Filename: throttle
+# @Date:   : 2026-10-18 15:40
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import time
+import logging
+from src.util import cons as ct
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class ResourceThrottle(object):
+    """
+    资源节流
+    --------
+    度量1分钟平均负载(除以CPU核数)、内存使用比例、本进程打开文件数占上限的比例,
+    任一项超过ct.THROTTLE_MAX_*时暂停, 暂停时长从ct.THROTTLE_MIN_PAUSE秒开始加倍, 直至资源恢复或累计暂停达到ct.THROTTLE_MAX_WAIT秒
+    安装了psutil时采用psutil度量, 否则读取os.getloadavg和/proc; 无法度量的项不做限制
+    """
+
+    @classmethod
+    def _load(cls):
+        """1分钟平均负载/CPU核数"""
+        try:
+            if psutil is not None:
+                load = psutil.getloadavg()[0]
+            else:
+                load = os.getloadavg()[0]
+        except (AttributeError, OSError):
+            return None
+        return load / (os.cpu_count() or 1)
+
+    @classmethod
+    def _memory(cls):
+        """内存使用比例"""
+        if psutil is not None:
+            return psutil.virtual_memory().percent / 100.0
+        try:
+            meminfo = {}
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    name, value = line.split(':', 1)
+                    meminfo[name] = float(value.split()[0])
+            return 1.0 - meminfo['MemAvailable'] / meminfo['MemTotal']
+        except (IOError, OSError, KeyError, ValueError, ZeroDivisionError):
+            return None
+
+    @classmethod
+    def _fds(cls):
+        """本进程打开文件数/文件数上限"""
+        if resource is None:
+            return None
+        soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        if soft_limit <= 0:
+            return None
+        try:
+            if psutil is not None:
+                num_fds = psutil.Process().num_fds()
+            else:
+                num_fds = len(os.listdir('/proc/self/fd'))
+        except (AttributeError, OSError):
+            return None
+        return float(num_fds) / soft_limit
+
+    @classmethod
+    def measure(cls):
+        """
+        度量当前的系统资源
+        :return: dict
+            key为'load', 'memory', 'fds', 无法度量的项为None
+        """
+        return {'load': cls._load(), 'memory': cls._memory(), 'fds': cls._fds()}
+
+    @classmethod
+    def over_limits(cls):
+        """
+        超过限制的资源
+        :return: dict
+            key为超限的资源名称, value为度量值
+        """
+        limits = {'load': ct.THROTTLE_MAX_LOAD, 'memory': ct.THROTTLE_MAX_MEMORY, 'fds': ct.THROTTLE_MAX_FDS}
+        return {name: value for name, value in cls.measure().items() if value is not None and value > limits[name]}
+
+    @classmethod
+    def wait(cls):
+        """
+        资源超限时暂停, 直至资源恢复或累计暂停达到ct.THROTTLE_MAX_WAIT秒; ct.THROTTLE_ENABLED为False时直接返回
+        :return: float
+            累计暂停的秒数
+        """
+        if not ct.THROTTLE_ENABLED:
+            return 0.
+        waited = 0.
+        pause = ct.THROTTLE_MIN_PAUSE
+        while waited < ct.THROTTLE_MAX_WAIT:
+            over_limits = cls.over_limits()
+            if len(over_limits) == 0:
+                break
+            pause = min(pause, ct.THROTTLE_MAX_WAIT - waited)
+            logging.info('Resource limits exceeded (%s), suspending for %ss.' %
+                         (', '.join('%s=%.2f' % (name, value) for name, value in sorted(over_limits.items())), pause))
+            time.sleep(pause)
+            waited += pause
+            pause = min(pause * 2, ct.THROTTLE_MAX_PAUSE)
+        return waited
+
+
+if __name__ == '__main__':
+    print(ResourceThrottle.measure())
@@ -0,0 +1,275 @@
+#!/usr/bin/env/ python3
+# -*- coding: utf-8 -*-
+# @Abstract: 交易日历, 基于有序的交易日数组以二分查找回答日期区间、前后第n个交易日及月初月末等查询
+# @Filename: tradingcalendar
+# @Date:   : 2026-10-18 16:55
+# @Author  : YuJun
+# @Email   : yujun_mail@163.com
+
+import os
+import datetime
+import logging
+import multiprocessing
+import numpy as np
+import pandas as pd
+from src.util import cons as ct
+from src.util.mktstore import DailyMktStore, _daily_mkt_paths
+from src.util.sharedcache import SharedCache
+
+
+class TradingCalendar(object):
+    """
+    交易日历
+    --------
+    交易日保存为升序排列的datetime64数组, 并预先计算每个交易日是否为月末、月初交易日及'YYYY-MM-DD'格式的日期字符串,
+    各查询通过searchsorted定位, 不再对整个交易日序列做布尔筛选
+    """
+    _calendar = None    # 进程内共享的交易日历
+
+    def __init__(self, days):
+        """
+        :param days: array-like of datetime-like
+            交易日序列
+        """
+        days = np.unique(np.array(pd.to_datetime(pd.Series(days)), dtype='datetime64[ns]'))
+        self.days = days
+        self.timestamps = pd.DatetimeIndex(days)
+        self.day_strs = np.datetime_as_string(days, unit='D')
+        months = days.astype('datetime64[M]')
+        month_change = months[1:] != months[:-1]
+        # 最后一个交易日的下一个交易日未知, 不视为月末交易日
+        self.month_end_flags = np.concatenate((month_change, [False]))
+        self.month_start_flags = np.concatenate(([len(days) > 0], month_change))[:len(days)]
+
+    @classmethod
+    def get_calendar(cls):
+        """
+        取得进程内共享的交易日历, 第一次调用时加载
+        交易日序列同时写入跨进程的共享缓存, 进程池的各进程直接读取, 每次运行只加载一次
+        :return: TradingCalendar
+        """
+        if cls._calendar is None:
+            days = SharedCache.get('trading_calendar')
+            if days is None:
+                days = cls._load_days()
+                SharedCache.put('trading_calendar', np.asarray(days, dtype='datetime64[ns]'))
+            cls._calendar = cls(days)
+        return cls._calendar
+
+    @classmethod
+    def set_calendar(cls, calendar):
+        """替换进程内共享的交易日历"""
+        cls._calendar = calendar
+
+    @classmethod
+    def _load_days(cls):
+        """
+        读取交易日序列
+        --------
+        优先读取本地的交易日历文件(ct.TRADING_CALENDAR), 文件未过期时不访问其他数据源
+        文件不存在, 或在主进程中发现文件已过期时, 依次用以下数据源增量更新并保存:
+            1. 本地的指数日行情数据(ct.TRADING_CALENDAR_INDEX)
+            2. 数据接口(CDataHandler.DataApi), 每天最多访问一次
+            3. tushare, 仅在本地交易日历文件不存在且前两个数据源都失败时访问
+        子进程只读取本地文件, 不更新
+        :return: np.array of datetime64[ns]
+        """
+        file_path = os.path.join(ct.DB_PATH, ct.TRADING_CALENDAR)
+        days = cls._read_file(file_path)
+        if days is not None and (multiprocessing.current_process().name != 'MainProcess' or not cls._is_stale(days)):
+            return days
+        new_days = cls._read_index_days()
+        if days is not None:
+            new_days = np.union1d(days, new_days)
+        if cls._is_stale(new_days) and not cls._checked_today(file_path):
+            new_days = np.union1d(new_days, cls._read_api_days(new_days[-1] if len(new_days) > 0 else None))
+        if len(new_days) == 0:
+            new_days = cls._read_tushare_days()
+        if days is None or len(new_days) > len(days):
+            cls._write_file(file_path, new_days)
+        elif os.path.isfile(file_path):
+            # 记录当天已检查过数据接口
+            os.utime(file_path, None)
+        return new_days
+
+    @classmethod
+    def _is_stale(cls, days):
+        """交易日序列是否已过期, 即最后一个交易日早于最近一个工作日"""
+        if len(days) == 0:
+            return True
+        last_busday = np.busday_offset(np.datetime64(datetime.date.today(), 'D'), 0, roll='backward')
+        return days[-1].astype('datetime64[D]') < last_busday
+
+    @classmethod
+    def _checked_today(cls, file_path):
+        """交易日历文件当天是否已更新或检查过"""
+        if not os.path.isfile(file_path):
+            return False
+        return datetime.date.fromtimestamp(os.path.getmtime(file_path)) == datetime.date.today()
+
+    @classmethod
+    def _read_file(cls, file_path):
+        """读取交易日历文件, 文件不存在时返回None"""
+        if not os.path.isfile(file_path):
+            return None
+        df_days = pd.read_csv(file_path, header=0)
+        return np.array(pd.to_datetime(df_days['date']), dtype='datetime64[ns]')
+
+    @classmethod
+    def _write_file(cls, file_path, days):
+        """保存交易日历文件, 先写入临时文件再替换"""
+        tmp_path = file_path + '.tmp'
+        pd.DataFrame({'date': np.datetime_as_string(days, unit='D')}).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, file_path)
+        logging.info('Trading calendar saved, last trading day: %s.' % np.datetime_as_string(days[-1], unit='D'))
+
+    @classmethod
+    def _read_index_days(cls):
+        """从本地的指数日行情数据读取交易日序列, 读取失败时返回空数组"""
+        symbol = ct.TRADING_CALENDAR_INDEX
+        for fq in (False, True):
+            store = DailyMktStore.get_store(fq)
+            if store is not None and store.is_current(symbol):
+                return np.array(store.get_dates(symbol), dtype='datetime64[ns]')
+            _, csv_path, header = _daily_mkt_paths(fq)
+            file_path = os.path.join(csv_path, '%s.csv' % symbol)
+            if os.path.isfile(file_path):
+                df_mkt = pd.read_csv(file_path, names=header, header=0)
+                return np.unique(np.array(pd.to_datetime(df_mkt['date']), dtype='datetime64[ns]'))
+        return np.array([], dtype='datetime64[ns]')
+
+    @classmethod
+    def _read_api_days(cls, start):
+        """通过数据接口读取start之后的交易日序列, 读取失败时返回空数组"""
+        try:
+            from src.util.dataapi.CDataHandler import CDataHandler
+            if start is None:
+                start = np.datetime64('1990-12-19')
+            str_start = pd.Timestamp(start).strftime('%Y%m%d')
+            str_end = datetime.date.today().strftime('%Y%m%d')
+            days = CDataHandler.DataApi.get_trading_days(str_start, str_end)
+        except Exception as e:
+            logging.warning('Failed to read trading days from data api: %s' % e)
+            return np.array([], dtype='datetime64[ns]')
+        if days is None:
+            return np.array([], dtype='datetime64[ns]')
+        return np.array(pd.to_datetime(pd.Series(days).astype(str)), dtype='datetime64[ns]')
+
+    @classmethod
+    def _read_tushare_days(cls):
+        """从tushare读取上证指数的交易日序列"""
+        import tushare as ts
+        ts_conn = ts.get_apis()
+        df_SZZS = ts.bar(code='000001', conn=ts_conn, asset='INDEX')
+        ts.close_apis(ts_conn)
+        return np.unique(np.array(pd.to_datetime(pd.Series(df_SZZS.index)), dtype='datetime64[ns]'))
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def _to_datetime64(cls, date):
+        return pd.Timestamp(date).to_datetime64().astype('datetime64[ns]')
+
+    def index_of(self, date, side='left'):
+        """
+        日期在交易日序列中的插入位置
+        :param date: datetime-like
+        :param side: str, 'left' or 'right'
+            'left': 第一个不早于date的交易日的序号; 'right': 第一个晚于date的交易日的序号
+        :return: int
+        """
+        return int(self.days.searchsorted(self._to_datetime64(date), side=side))
+
+    def index_range(self, start=None, end=None, ndays=None):
+        """
+        交易日区间在交易日序列中的起止序号, 区间的取法与Utils.get_trading_days一致
+        Parameters:
+        --------
+        :param start: datetime-like, 默认None
+            开始日期
+        :param end: datetime-like, 默认None
+            结束日期
+        :param ndays: int, 默认None
+            交易日天数
+        :return: tuple(int, int)
+            起止序号(不含止)
+        """
+        n = len(self.days)
+        if start is not None and end is not None:
+            lo, hi = self.index_of(start, 'left'), self.index_of(end, 'right')
+        elif start is not None and ndays is not None:
+            lo = self.index_of(start, 'left')
+            hi = min(lo + max(ndays, 0), n)
+        elif end is not None and ndays is not None:
+            hi = self.index_of(end, 'right')
+            lo = max(hi - ndays, 0) if ndays > 0 else 0
+        elif start is not None:
+            lo, hi = self.index_of(start, 'left'), n
+        elif end is not None:
+            lo, hi = 0, self.index_of(end, 'right')
+        elif ndays is not None:
+            lo, hi = (max(n - ndays, 0) if ndays > 0 else 0), n
+        else:
+            lo, hi = 0, n
+        return lo, max(lo, hi)
+
+    def get_days(self, start=None, end=None, ndays=None):
+        """
+        取得交易日区间, 参数含义同index_range
+        :return: np.array of datetime64[ns], 升序排列
+        """
+        lo, hi = self.index_range(start, end, ndays)
+        return self.days[lo:hi]
+
+    def get_day_strs(self, start=None, end=None, ndays=None):
+        """
+        取得交易日区间的日期字符串, 参数含义同index_range
+        :return: np.array of str, 格式YYYY-MM-DD, 升序排列
+        """
+        lo, hi = self.index_range(start, end, ndays)
+        return self.day_strs[lo:hi]
+
+    def is_trading_day(self, date):
+        """是否为交易日"""
+        k = self.index_of(date, 'left')
+        return k < len(self.days) and self.days[k] == self._to_datetime64(date)
+
+    def prev_n_day(self, end, ndays=1):
+        """
+        截止日期前的第ndays个交易日, 与Utils.get_prev_n_day一致: end为交易日时不计end本身
+        :param end: datetime-like
+        :param ndays: int
+        :return: pandas.Timestamp
+        """
+        k = self.index_of(end, 'left') - ndays
+        if k < 0:
+            raise IndexError('No trading day %d days before %s.' % (ndays, end))
+        return self.timestamps[k]
+
+    def next_n_day(self, start, ndays=1):
+        """
+        开始日期后的第ndays个交易日: start为交易日时不计start本身
+        :param start: datetime-like
+        :param ndays: int
+        :return: pandas.Timestamp
+        """
+        k = self.index_of(start, 'right') + ndays - 1
+        if k >= len(self.days):
+            raise IndexError('No trading day %d days after %s.' % (ndays, start))
+        return self.timestamps[k]
+
+    def is_month_end(self, date):
+        """是否为月末交易日"""
+        k = self.index_of(date, 'left')
+        return bool(k < len(self.days) and self.days[k] == self._to_datetime64(date) and self.month_end_flags[k])
+
+    def is_month_start(self, date):
+        """是否为月初交易日"""
+        k = self.index_of(date, 'left')
+        return bool(k < len(self.days) and self.days[k] == self._to_datetime64(date) and self.month_start_flags[k])
+
+
+if __name__ == '__main__':
+    calendar = TradingCalendar(pd.bdate_range('2017-01-01', '2017-12-31'))
+    print(calendar.prev_n_day('2017-06-30', 5), calendar.is_month_end('2017-06-30'))
@@ -16,7 +16,10 @@ import shelve
 from enum import Enum, auto
 from src.util import cons as ct
 from src.util.Cache import Cache
-import tushare as ts
+from src.util.sharedcache import SharedCache
+from src.util.mktstore import DailyMktStore, DailyPanel, MinMktStore, CheckpointPrices, _daily_mkt_paths, _min_mkt_paths
+from src.util.finstore import FinDataStore
+from src.util.tradingcalendar import TradingCalendar
 
 
 class SecuTradingStatus(Enum):
@@ -31,7 +34,7 @@ class SecuTradingStatus(Enum):
 
 class Utils(object):
 
-    _DataCache = Cache(500)    # 数据缓存
+    _DataCache = Cache(ct.DATA_CACHE_MAXSIZE, ct.DATA_CACHE_MAXBYTES)    # 数据缓存
 
     @classmethod
     def calc_interval_ret(cls, secu_code, start=None, end=None, ndays=None):
@@ -55,10 +58,9 @@ class Utils(object):
             float，证券的区间收益率
             计算失败，返回None
         """
-        symbol = _code_to_symbol(secu_code)
-        file_path = '%s.csv' % (os.path.join(ct.DB_PATH, ct.MKT_DAILY_FQ, symbol))
-        headers = ['code', 'date', 'open', 'high', 'low', 'close', 'vol', 'amount', 'turnover1', 'turnover2', 'factor']
-        df_mkt = pd.read_csv(file_path, names=headers, header=0)
+        df_mkt = cls._read_secu_daily_mkt(secu_code, fq=True)
+        if df_mkt is None:
+            return None
         # 如果start或end是datetime.datetime/datetime.date类型，将其转化为字符串
         if isinstance(start, datetime.datetime) or isinstance(start, datetime.date):
             start = start.strftime('%Y-%m-%d')
@@ -68,13 +70,12 @@ class Utils(object):
             # 取得开始日期前一交易日和结束日期之间的索引值列表，根据这个索引值列表取得复权行情切片，计算区间收益率
             inds = list(df_mkt[(df_mkt.date >= start) & (df_mkt.date <= end)].index.values)
             if len(inds) > 0:
-                if inds[0] > 0:
-                    inds.insert(0, inds[0]-1)
-                    df_mkt = df_mkt.ix[inds]
+                if inds[0] > df_mkt.index[0]:
+                    start_close = df_mkt.loc[inds[0]-1, 'close']
                 else:
-                    # 如果开始日期小于等于该证券上市日期，那么把第一天的收盘价设置为开盘价
-                    df_mkt.iloc[0, 5] = df_mkt.iat[0, 3]
-                interval_ret = df_mkt.iloc[-1, 5]/df_mkt.iloc[0, 5] - 1.0
+                    # 如果开始日期小于等于该证券上市日期，那么以上市首日的开盘价作为期初价格
+                    start_close = df_mkt.loc[inds[0], 'open']
+                interval_ret = df_mkt.loc[inds[-1], 'close'] / start_close - 1.0
             else:
                 # 如果在指定的开始、结束日期间该证券没有行情数据，返回None
                 interval_ret = None
@@ -114,8 +115,123 @@ class Utils(object):
             interval_ret = None
         return interval_ret
 
-    # 交易日序列静态变量，Series
-    utils_trading_days = Series()
+    @classmethod
+    def interval_returns(cls, codes, start, end, panel=None):
+        """
+        批量计算一组证券在开始、结束日期间的区间收益率, 计算方式与calc_interval_ret指定开始、结束日期时一致:
+        期初价格为开始日期前最后一个交易日的收盘价, 开始日期不晚于证券上市日期时取上市首日的开盘价,
+        期末价格为结束日期前(含)最后一个交易日的收盘价
+        Parameters:
+        --------
+        :param codes: list-like of str
+            证券代码, e.g. 600000 or SH600000
+        :param start: datetime-like, str
+            开始日期, 格式: YYYY-MM-DD
+        :param end: datetime-like, str
+            结束日期, 格式: YYYY-MM-DD
+        :param panel: DailyPanel, 默认None
+            包含open、close字段的复权日行情面板, 为None时读取开始日期前ct.INTERVAL_RET_LOOKBACK个交易日至结束日期的面板
+        :return: pd.Series
+        --------
+            index为codes, 值为区间收益率, 计算失败(区间内没有行情数据)的证券为NaN
+        """
+        codes = list(codes)
+        start = cls.to_date(start)
+        if panel is None:
+            lookback_days = cls.get_trading_days(end=start, ndays=ct.INTERVAL_RET_LOOKBACK + 1)
+            panel_start = lookback_days.iloc[0] if len(lookback_days) > 0 else start
+            panel = cls.get_daily_panel(['open', 'close'], panel_start, end, fq=True,
+                                        symbols=[cls.code_to_symbol(code) for code in codes])
+        close, opn, cols, first_dates = cls._panel_prices(panel, codes)
+        n, m = close.shape
+        lo = int(panel.dates.searchsorted(np.datetime64(start, 'D'), side='left'))
+        hi = panel.date_index(cls.to_date(end))
+        valid = ~np.isnan(close)
+        rows = np.arange(n).reshape((n, 1))
+        # 每行及之前最后一条有效数据的行号, 每行及之后第一条有效数据的行号
+        last_valid = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+        next_valid = np.minimum.accumulate(np.where(valid, rows, n)[::-1], axis=0)[::-1]
+        end_row = last_valid[hi-1] if hi > 0 else np.full(m, -1)
+        first_row = next_valid[lo] if lo < n else np.full(m, n)
+        prev_row = last_valid[lo-1] if lo > 0 else np.full(m, -1)
+        has_data = (end_row >= lo) & (end_row >= 0)
+        k = np.arange(m)
+        end_close = close[np.maximum(end_row, 0), k]
+        # 区间内第一个交易日为上市首日时, 期初价格为上市首日的开盘价
+        is_ipo = has_data & (first_row < n) & (first_dates == panel.dates[np.minimum(first_row, n-1)])
+        start_close = np.where(prev_row >= 0, close[np.maximum(prev_row, 0), k],
+                               np.where(is_ipo, opn[np.minimum(first_row, n-1), k], np.nan))
+        rets = np.where(has_data, end_close / start_close - 1.0, np.nan)
+        # 不在面板中的证券, 及期初收盘价早于面板开始日期(长期停牌)的证券, 逐个计算
+        fallback = (cols < 0) | (has_data & (prev_row < 0) & ~is_ipo)
+        return cls._fill_interval_rets(Series(rets, index=codes), fallback, start=start, end=end)
+
+    @classmethod
+    def trailing_returns(cls, codes, end, ndays, panel=None):
+        """
+        批量计算一组证券截止结束日期的过去ndays个交易日的收益率, 计算方式与calc_interval_ret指定结束日期、天数时一致:
+        按证券自身有行情数据的交易日计数, 交易日不足ndays+1天时期初价格取上市首日的开盘价
+        Parameters:
+        --------
+        :param codes: list-like of str
+            证券代码, e.g. 600000 or SH600000
+        :param end: datetime-like, str
+            结束日期, 格式: YYYY-MM-DD
+        :param ndays: int
+            交易日天数
+        :param panel: DailyPanel, 默认None
+            包含open、close字段的复权日行情面板, 为None时读取结束日期前2*ndays+ct.INTERVAL_RET_LOOKBACK个交易日的面板
+        :return: pd.Series
+        --------
+            index为codes, 值为区间收益率, 计算失败(结束日期前没有行情数据)的证券为NaN
+        """
+        codes = list(codes)
+        end = cls.to_date(end)
+        if panel is None:
+            trading_days = cls.get_trading_days(end=end, ndays=2*ndays + ct.INTERVAL_RET_LOOKBACK)
+            panel_start = trading_days.iloc[0] if len(trading_days) > 0 else end
+            panel = cls.get_daily_panel(['open', 'close'], panel_start, end, fq=True,
+                                        symbols=[cls.code_to_symbol(code) for code in codes])
+        close, opn, cols, first_dates = cls._panel_prices(panel, codes)
+        n, m = close.shape
+        hi = panel.date_index(end)
+        values, _, ok = panel.tail('close', hi, ndays+1, np.maximum(cols, 0))
+        end_close = values[-1]
+        has_data = (cols >= 0) & ~np.isnan(end_close)
+        # 交易日不足ndays+1天, 且面板包含上市首日时, 期初价格为上市首日的开盘价
+        valid = ~np.isnan(close[:hi])
+        first_row = valid.argmax(axis=0) if hi > 0 else np.zeros(m, dtype=np.int64)
+        k = np.arange(m)
+        ok = has_data & ok
+        is_ipo = has_data & ~ok & (first_dates == panel.dates[first_row])
+        start_close = np.where(ok, values[0], np.where(is_ipo, opn[first_row, k], np.nan))
+        rets = np.where(has_data, end_close / start_close - 1.0, np.nan)
+        # 不在面板中的证券, 及上市首日或结束日期前最后一个交易日早于面板开始日期的证券, 逐个计算
+        before_panel = first_dates < panel.dates[0] if n > 0 else np.ones(m, dtype=bool)
+        fallback = (cols < 0) | (has_data & ~ok & ~is_ipo) | (~has_data & before_panel)
+        return cls._fill_interval_rets(Series(rets, index=codes), fallback, end=end, ndays=ndays)
+
+    @classmethod
+    def _panel_prices(cls, panel, codes):
+        """
+        取得一组证券在日行情面板中的复权收盘价、开盘价
+        :return: tuple(close, open, cols, first_dates)
+            不在面板中的证券, 收盘价、开盘价为NaN, 列号为-1, 首个行情日期为NaT
+        """
+        cols = panel.symbol_index([cls.code_to_symbol(code) for code in codes])
+        found = cols >= 0
+        close = np.where(found, panel['close'][:, np.maximum(cols, 0)], np.nan)
+        opn = np.where(found, panel['open'][:, np.maximum(cols, 0)], np.nan)
+        first_dates = np.where(found, panel.first_dates[np.maximum(cols, 0)], np.datetime64('NaT'))
+        return close, opn, cols, first_dates.astype('datetime64[D]')
+
+    @classmethod
+    def _fill_interval_rets(cls, rets, fallback, start=None, end=None, ndays=None):
+        """对面板数据无法确定期初价格的证券, 调用calc_interval_ret逐个计算区间收益率"""
+        for code in rets.index[fallback]:
+            ret = cls.calc_interval_ret(code, start=start, end=end, ndays=ndays)
+            rets[code] = np.nan if ret is None else ret
+        return rets
 
     @classmethod
     def get_trading_days(cls, start=None, end=None, ndays=None, ascending=True):
@@ -137,32 +253,15 @@ class Utils(object):
         --------
             Series of pandas.Timestamp，交易日列表，默认按交易日升序排列
         """
-        if len(Utils.utils_trading_days) == 0:
-            ts_conn = ts.get_apis()
-            df_SZZS = ts.bar(code='000001', conn=ts_conn, asset='INDEX')
-            ts.close_apis(ts_conn)
-            Utils.utils_trading_days = Series(df_SZZS.index).sort_values()
         if start is not None:
             start = cls.to_date(start)
         if end is not None:
             end = cls.to_date(end)
-        if start is not None and end is not None:
-            trading_days = Utils.utils_trading_days[(Utils.utils_trading_days >= start) & (Utils.utils_trading_days <= end)]
-        elif start is not None and ndays is not None:
-            trading_days = Utils.utils_trading_days[Utils.utils_trading_days >= start].iloc[:ndays]
-        elif end is not None and ndays is not None:
-            trading_days = Utils.utils_trading_days[Utils.utils_trading_days <= end].iloc[-ndays:]
-        elif start is not None:
-            trading_days = Utils.utils_trading_days[Utils.utils_trading_days >= start]
-        elif end is not None:
-            trading_days = Utils.utils_trading_days[Utils.utils_trading_days <= end]
-        elif ndays is not None:
-            trading_days = Utils.utils_trading_days.iloc[-ndays:]
-        else:
-            trading_days = Utils.utils_trading_days
-        trading_days = trading_days.reset_index(drop=True)
+        calendar = TradingCalendar.get_calendar()
+        lo, hi = calendar.index_range(start, end, ndays)
+        trading_days = Series(calendar.timestamps[lo:hi])
         if not ascending:
-            trading_days = trading_days.sort_values(ascending=False)
+            trading_days = trading_days.iloc[::-1]
         return trading_days
 
     @classmethod
@@ -175,12 +274,7 @@ class Utils(object):
             天数
         :return: pandas.Timestamp
         """
-        end = cls.to_date(end)
-        trading_days = cls.get_trading_days(end=end)
-        if trading_days.iloc[-1] == end:
-            return trading_days.iloc[-(ndays+1)]
-        else:
-            return trading_days.iloc[-ndays]
+        return TradingCalendar.get_calendar().prev_n_day(cls.to_date(end), ndays)
 
     @classmethod
     def is_month_end(cls, trading_day):
@@ -189,15 +283,7 @@ class Utils(object):
         :param trading_day: datetime-like, str
         :return: bool
         """
-        trading_day = Utils.to_date(trading_day)
-        trading_days = Utils.get_trading_days(start=trading_day, ndays=2)
-        if trading_day != trading_days[0]:
-            return False
-        else:
-            if trading_day.month == trading_days[1].month:
-                return False
-            else:
-                return True
+        return TradingCalendar.get_calendar().is_month_end(cls.to_date(trading_day))
 
     @classmethod
     def is_month_start(cls, trading_day):
@@ -206,15 +292,7 @@ class Utils(object):
         :param trading_day: datetime-like, str
         :return:
         """
-        trading_day = cls.to_date(trading_day)
-        trading_days = cls.get_trading_days(end=trading_day, ndays=2)
-        if trading_day != trading_days[1]:
-            return False
-        else:
-            if trading_day.month == trading_days[0].month:
-                return False
-            else:
-                return True
+        return TradingCalendar.get_calendar().is_month_start(cls.to_date(trading_day))
 
     @classmethod
     def get_secu_daily_mkt(cls, secu_code, start=None, end=None, ndays=None,fq=False, range_lookup=False):
@@ -256,17 +334,12 @@ class Utils(object):
             factor  复权系数
         """
         symbol = _code_to_symbol(secu_code)
-        if fq:
-            file_path = '%s.csv' % os.path.join(ct.DB_PATH, ct.MKT_DAILY_FQ, symbol)
-            if not os.path.exists(file_path):
-                return None
-            df_mkt = pd.read_csv(file_path, names=ct.MKT_DAILY_FQ_HEADER, header=0)
-        else:
-            file_path = '%s.csv' % os.path.join(ct.DB_PATH, ct.MKT_DAILY_NOFQ, symbol)
-            if not os.path.exists(file_path):
-                return None
-            df_mkt = pd.read_csv(file_path, names=ct.MKT_DAILY_NOFQ_HEADER, header=0)
-        if len(df_mkt) == 0:
+        # 优先从列式存储中读取行情数据
+        store = DailyMktStore.get_store(fq)
+        if store is not None and store.is_current(symbol):
+            return cls._get_secu_daily_mkt_from_store(store, symbol, start, end, ndays, range_lookup)
+        df_mkt = cls._read_secu_daily_mkt(symbol, fq)
+        if df_mkt is None:
             return None
         if start is not None:
             start = cls.datetimelike_to_str(start, dash=True)
@@ -301,6 +374,173 @@ class Utils(object):
             mkt_data = None
         return mkt_data
 
+    @classmethod
+    def _read_secu_daily_mkt(cls, secu_code, fq=False):
+        """
+        读取证券上市以来的全部日行情数据, 优先读取列式存储, 列式存储中不存在时读取csv文件
+        Parameters:
+        --------
+        :param secu_code: str
+            证券代码, e.g. 600000 or SH600000
+        :param fq: bool, 默认False
+            是否读取复权行情数据
+        :return: pd.DataFrame
+            表头为ct.MKT_DAILY_FQ_HEADER或ct.MKT_DAILY_NOFQ_HEADER
+            如果没有行情数据, 返回None
+        """
+        symbol = _code_to_symbol(secu_code)
+        store = DailyMktStore.get_store(fq)
+        if store is not None and store.is_current(symbol):
+            df_mkt = store.get_frame(symbol)
+        else:
+            if fq:
+                file_path = '%s.csv' % os.path.join(ct.DB_PATH, ct.MKT_DAILY_FQ, symbol)
+                header = ct.MKT_DAILY_FQ_HEADER
+            else:
+                file_path = '%s.csv' % os.path.join(ct.DB_PATH, ct.MKT_DAILY_NOFQ, symbol)
+                header = ct.MKT_DAILY_NOFQ_HEADER
+            if not os.path.exists(file_path):
+                return None
+            df_mkt = pd.read_csv(file_path, names=header, header=0)
+        if len(df_mkt) == 0:
+            return None
+        return df_mkt
+
+    @classmethod
+    def _get_secu_daily_mkt_from_store(cls, store, symbol, start, end, ndays, range_lookup):
+        """
+        从日行情列式存储中读取证券的日行情数据, 参数及返回值的含义与get_secu_daily_mkt相同
+        先在日期序列上二分查找需要的行, 只对这些行构建DataFrame
+        """
+        dates = store.get_dates(symbol)
+        n = len(dates)
+        if n == 0:
+            return None
+        if start is not None:
+            start = _to_datetime64(start)
+        if end is not None:
+            end = _to_datetime64(end)
+        if start is not None and end is not None:
+            lo = dates.searchsorted(start, side='left')
+            hi = dates.searchsorted(end, side='right')
+            mkt_data = store.get_frame(symbol, lo, hi)
+        elif start is not None and ndays is not None:
+            lo = dates.searchsorted(start, side='left')
+            mkt_data = store.get_frame(symbol, lo, lo + ndays)
+        elif end is not None and ndays is not None:
+            hi = dates.searchsorted(end, side='right')
+            mkt_data = store.get_frame(symbol, hi - ndays, hi)
+        elif start is not None:
+            if range_lookup:
+                hi = dates.searchsorted(start, side='right')
+                # 如果start之前没有行情数据, 与读取csv文件时一样抛出IndexError
+                mkt_data = store.get_frame(symbol, max(hi-1, 0), hi).iloc[-1]
+            else:
+                k = dates.searchsorted(start, side='left')
+                if k < n and dates[k] == start:
+                    mkt_data = store.get_frame(symbol, k, k+1).iloc[0]
+                else:
+                    mkt_data = Series()
+        elif end is not None:
+            hi = dates.searchsorted(end, side='right')
+            mkt_data = store.get_frame(symbol, 0, hi)
+        else:
+            mkt_data = None
+        return mkt_data
+
+    @classmethod
+    def get_daily_panel(cls, fields, start, end, fq=True, symbols=None):
+        """
+        读取全部证券在指定日期区间内的日行情面板数据(交易日 × 证券)
+        同一参数的面板数据在进程内只构建一次
+        Parameters:
+        --------
+        :param fields: list of str
+            字段名称, 如['close', 'amount', 'vol', 'turnover1', 'factor']
+        :param start: datetime-like, str
+            开始日期, 格式: YYYY-MM-DD or YYYYMMDD
+        :param end: datetime-like, str
+            结束日期, 格式: YYYY-MM-DD or YYYYMMDD
+        :param fq: bool, 默认True
+            是否读取复权行情数据
+        :param symbols: list-like of str, 默认None
+            证券代码列表, 为None时读取行情数据库中的全部证券
+        :return: DailyPanel
+        --------
+            dates: 交易日序列, np.array of datetime64[D]
+            symbols: 证券代码序列, np.array of str
+            panel[field]: 二维数组, 行为交易日, 列为证券, 没有行情数据时为NaN
+        """
+        fields = list(fields)
+        str_start = cls.datetimelike_to_str(cls.to_date(start), dash=False)
+        str_end = cls.datetimelike_to_str(cls.to_date(end), dash=False)
+        key = 'daily_panel_%s_%s_%s_%s_%s' % ('|'.join(fields), str_start, str_end, fq,
+                                               '' if symbols is None else '|'.join(symbols))
+        panel = cls._DataCache.get(key)
+        if panel is not None:
+            return panel
+        trading_days = np.array(cls.get_trading_days(start=start, end=end), dtype='datetime64[D]')
+        store = DailyMktStore.get_store(fq)
+        if symbols is None:
+            if store is not None:
+                symbols = store.symbols
+            else:
+                mkt_path = os.path.join(ct.DB_PATH, ct.MKT_DAILY_FQ if fq else ct.MKT_DAILY_NOFQ)
+                symbols = sorted([os.path.splitext(f)[0] for f in os.listdir(mkt_path) if f.endswith('.csv')])
+        symbols = [cls.code_to_symbol(symbol) for symbol in symbols]
+
+        def _reader(symbol):
+            if store is not None and store.is_current(symbol):
+                return store.get_dates(symbol), {field: store.get_column(symbol, field) for field in fields}
+            df_mkt = cls._read_secu_daily_mkt(symbol, fq)
+            if df_mkt is None:
+                return None
+            return np.array(df_mkt['date'], dtype='datetime64[D]'), {field: np.array(df_mkt[field], dtype=np.float64) for field in fields}
+
+        panel = DailyPanel.build(trading_days, symbols, fields, _reader)
+        cls._DataCache.set(key, panel)
+        return panel
+
+    @classmethod
+    def get_daily_mkt_files(cls, code, index=False, fq=False):
+        """
+        证券日行情数据可能读取的文件(列式存储的偏移量文件及csv文件), 用于判断计算输入是否发生变化
+        :param code: string
+            证券代码，如600000,SH600000,SZ000002
+        :param index: bool,默认False
+        :param fq: bool,默认False
+            是否复权
+        :return: list of str
+        """
+        store_path, csv_path, _ = _daily_mkt_paths(fq)
+        return [os.path.join(store_path, 'offsets.npy'), os.path.join(csv_path, '%s.csv' % cls.code_to_symbol(code, index))]
+
+    @classmethod
+    def get_min_mkt_files(cls, code, trade_dates, index=False, fq=False, checkpoint=False):
+        """
+        证券在各交易日的分钟行情数据可能读取的文件(按日存储文件及csv文件), 用于判断计算输入是否发生变化
+        :param code: string
+            证券代码，如600000,SH600000,SZ000002
+        :param trade_dates: list-like of datetime-like, str
+            交易日列表
+        :param index: bool,默认False
+        :param fq: bool,默认False
+            是否复权
+        :param checkpoint: bool,默认False
+            是否包含日内时点价格表文件
+        :return: list of str
+        """
+        symbol = cls.code_to_symbol(code, index)
+        store_path, csv_path = _min_mkt_paths(fq)
+        file_paths = []
+        for trade_date in trade_dates:
+            str_date = cls.datetimelike_to_str(trade_date)
+            file_paths.append(os.path.join(store_path, '%s.pack' % str_date))
+            file_paths.append(os.path.join(csv_path, str_date, '%s.csv' % symbol))
+            if checkpoint:
+                file_paths.append(os.path.join(ct.DB_PATH, ct.MKT_CHECKPOINT_FQ, '%s.pack' % str_date))
+        return file_paths
+
     @classmethod
     def get_min_mkt(cls, code, trade_date, index=False, fq=False):
         """
@@ -331,19 +571,112 @@ class Utils(object):
         """
         symbol = cls.code_to_symbol(code, index)
         str_date = cls.datetimelike_to_str(trade_date)
-        if fq:
-            mkt_file_path = os.path.join(ct.DB_PATH, ct.MKT_MIN_FQ, str_date, '%s.csv' % symbol)
-        else:
-            mkt_file_path = os.path.join(ct.DB_PATH, ct.MKT_MIN_NOFQ, str_date, '%s.csv' % symbol)
         key = '%s_1min_mkt_%s' % (symbol, cls.to_date(trade_date).strftime('%Y%m%d'))
         df_mkt_min = cls._DataCache.get(key)
-        if df_mkt_min is None and os.path.isfile(mkt_file_path):
-            df_mkt_min = pd.read_csv(mkt_file_path, names=ct.MKT_MIN_FQ_HEADER, skiprows=[0])
-            cls._DataCache.set(key, df_mkt_min)
+        if df_mkt_min is None:
+            # 指数分钟行情被所有个股的计算共用, 通过共享缓存在各进程间只解析一次
+            if index:
+                df_mkt_min = SharedCache.get('%s_%s' % (key, fq))
+            if df_mkt_min is None:
+                df_mkt_min = cls._read_min_mkt(symbol, str_date, fq)
+                if index and df_mkt_min is not None:
+                    SharedCache.put('%s_%s' % (key, fq), df_mkt_min)
+            if df_mkt_min is not None:
+                cls._DataCache.set(key, df_mkt_min)
         # else:
         #     df_mkt_min = None
         return df_mkt_min
 
+    @classmethod
+    def _read_min_mkt(cls, symbol, str_date, fq):
+        """
+        读取证券指定日期的分钟行情数据, 优先从按日存储读取, 存储中没有时读取csv文件
+        Parameters:
+        --------
+        :param symbol: str
+            证券代码, 如SH600000
+        :param str_date: str
+            交易日, 格式YYYY-MM-DD
+        :param fq: bool
+            是否复权
+        :return: pd.DataFrame, 列同ct.MKT_MIN_FQ_HEADER, 如果没有行情数据返回None
+        """
+        min_store = MinMktStore.get_day(str_date, fq)
+        if min_store is not None and min_store.has_symbol(symbol):
+            return min_store.get_frame(symbol)
+        if fq:
+            mkt_file_path = os.path.join(ct.DB_PATH, ct.MKT_MIN_FQ, str_date, '%s.csv' % symbol)
+        else:
+            mkt_file_path = os.path.join(ct.DB_PATH, ct.MKT_MIN_NOFQ, str_date, '%s.csv' % symbol)
+        if not os.path.isfile(mkt_file_path):
+            return None
+        return pd.read_csv(mkt_file_path, names=ct.MKT_MIN_FQ_HEADER, skiprows=[0])
+
+    @classmethod
+    def get_checkpoint_prices(cls, code, trade_date, checkpoints, index=False):
+        """
+        读取证券（个股或指数）指定日期在日内各时点的复权价格
+        优先从日内时点价格表读取, 时点价格表中没有时从分钟行情数据中提取
+        Parameters:
+        --------
+        :param code: string
+            证券代码，如600000,SH600000,SZ000002
+        :param trade_date: datetime-like, str
+            交易日，当类型为str时格式为YYYY-MM-DD
+        :param checkpoints: list of str
+            时点名称(见ct.MKT_CHECKPOINTS), 如['p0930', 'p1130', 'p1500']
+        :param index: bool,默认False
+        :return: np.array
+            各时点的价格, 缺少对应时点分钟线的为NaN; 如果当天没有分钟行情数据返回None
+        """
+        symbol = cls.code_to_symbol(code, index)
+        str_date = cls.datetimelike_to_str(trade_date)
+        checkpoint_prices = CheckpointPrices.get_day(str_date)
+        if checkpoint_prices is not None and checkpoint_prices.has_symbol(symbol):
+            return checkpoint_prices.get_prices(symbol, checkpoints)
+        df_mkt_min = cls.get_min_mkt(symbol, str_date, index=index, fq=True)
+        if df_mkt_min is None:
+            return None
+        offsets = np.array([0, len(df_mkt_min)])
+        datetimes = np.array(df_mkt_min['datetime'].astype(str), dtype=bytes)
+        fields = set([checkpoint[2] for checkpoint in ct.MKT_CHECKPOINTS])
+        prices = CheckpointPrices.extract(str_date, datetimes, offsets, {field: df_mkt_min[field] for field in fields})[0]
+        checkpoint_idx = {checkpoint[0]: k for k, checkpoint in enumerate(ct.MKT_CHECKPOINTS)}
+        return prices[[checkpoint_idx[checkpoint] for checkpoint in checkpoints]]
+
+    @classmethod
+    def get_checkpoint_price_panel(cls, codes, trade_dates, checkpoints, index=False):
+        """
+        读取一组证券在多个交易日的日内各时点复权价格
+        Parameters:
+        --------
+        :param codes: list of str
+            证券代码列表，如600000,SH600000,SZ000002
+        :param trade_dates: list-like of datetime-like, str
+            交易日列表
+        :param checkpoints: list of str
+            时点名称(见ct.MKT_CHECKPOINTS), 如['p0930', 'p1130', 'p1500']
+        :param index: bool,默认False
+        :return: tuple(np.array, np.array)
+            0. 交易日数量 × 证券数量 × 时点数量的价格数组, 没有分钟行情数据或缺少对应时点分钟线的为NaN
+            1. 交易日数量 × 证券数量的bool数组, 证券当天是否有分钟行情数据
+        """
+        symbols = [cls.code_to_symbol(code, index) for code in codes]
+        prices = np.full((len(trade_dates), len(symbols), len(checkpoints)), np.nan)
+        has_data = np.zeros((len(trade_dates), len(symbols)), dtype=bool)
+        for t, trade_date in enumerate(trade_dates):
+            str_date = cls.datetimelike_to_str(trade_date)
+            checkpoint_prices = CheckpointPrices.get_day(str_date)
+            if checkpoint_prices is not None:
+                prices[t], has_data[t] = checkpoint_prices.get_prices_batch(symbols, checkpoints)
+            # 时点价格表中没有的证券, 从分钟行情数据中提取
+            for j in np.nonzero(~has_data[t])[0]:
+                secu_prices = cls.get_checkpoint_prices(symbols[j], str_date, checkpoints, index=index)
+                if secu_prices is not None:
+                    prices[t, j] = secu_prices
+                    has_data[t, j] = True
+        return prices, has_data
+
     @classmethod
     def get_min_mkts_fq(cls, code, days, ret_num):
         """
@@ -376,31 +709,103 @@ class Utils(object):
         # cfg.read('config.ini')
         # db_path = cfg.get('factor_db', 'db_path')   # 读取因子数据库路径
         # db_path = factor_ct.FACTOR_DB.db_path
-        df_min_mkt = DataFrame()
+        df_min_mkts = []
         k = 0
+        symbol = Utils.code_to_symbol(code)
         for trading_date in days:
-            mkt_file_path = os.path.join(ct.DB_PATH, ct.MKT_MIN_FQ, Utils.datetimelike_to_str(trading_date), '%s.csv' %
-                                         Utils.code_to_symbol(code))
-            if os.path.isfile(mkt_file_path):
-                # 读取个股每天的分钟行情数据
-                df = pd.read_csv(mkt_file_path,
-                                 names=['code', 'time', 'open', 'high', 'low', 'close', 'volume', 'amount', 'factor'],
-                                 skiprows=[0])
+            # 读取个股每天的分钟行情数据
+            df = cls._read_min_mkt(symbol, Utils.datetimelike_to_str(trading_date), True)
+            if df is not None:
+                df.columns = ['code', 'time', 'open', 'high', 'low', 'close', 'volume', 'amount', 'factor']
                 # 计算每分钟的涨跌幅，每天第一分钟的涨跌幅=close/open-1
                 df['ret'] = df['close'] / df['close'].shift(1) - 1.0
-                df.ix[0, 'ret'] = df.ix[0, 'close'] / df.ix[0, 'open'] - 1.0
-                # 拼接数据
-                df_min_mkt = df_min_mkt.append(df, ignore_index=True)
+                df.loc[0, 'ret'] = df.loc[0, 'close'] / df.loc[0, 'open'] - 1.0
+                df_min_mkts.append(df)
                 k += 1
                 if k >= ret_num:
                     break
+        # 拼接数据
+        df_min_mkt = pd.concat(df_min_mkts, ignore_index=True) if len(df_min_mkts) > 0 else DataFrame()
         be_enough = True
         if k < ret_num:
             be_enough = False
         return be_enough, df_min_mkt
 
+    @classmethod
+    def get_min_mkts_fq_arrays(cls, code, days, ret_num):
+        """
+        获取个股指定日期的复权分钟行情数据的每分钟涨跌幅、成交量和成交金额数组, 取数规则与get_min_mkts_fq一致
+        Parameters:
+        ------
+        :param code:string
+            个股代码，如SH600000或600000
+        :param days:list-like of string/datetime like, YYYY-MM-DD
+            日期列表
+        :param ret_num:int
+            返回的交易日数量
+        :return: tuple(bool, dict)
+        ------
+            0. be_enough: 给定的日期范围内读取分钟数据天数是否不小于ret_num天
+            1. dict: 'ret': 每分钟涨跌幅，每天第一分钟的涨跌幅=close/open-1
+                     'volume': 成交量(手)
+                     'amount': 成交金额(元)
+               各交易日的数据按days的顺序首尾相接，与get_min_mkts_fq返回的DataFrame的对应列一致
+        """
+        rets = []
+        volumes = []
+        amounts = []
+        k = 0
+        symbol = cls.code_to_symbol(code)
+        for trading_date in days:
+            str_date = cls.datetimelike_to_str(trading_date)
+            min_store = MinMktStore.get_day(str_date, True)
+            if min_store is not None and min_store.has_symbol(symbol):
+                arr_open = min_store.get_column(symbol, 'open')
+                arr_close = min_store.get_column(symbol, 'close')
+                arr_volume = min_store.get_column(symbol, 'vol')
+                arr_amount = min_store.get_column(symbol, 'amount')
+            else:
+                df = cls._read_min_mkt(symbol, str_date, True)
+                if df is None:
+                    continue
+                arr_open = np.array(df['open'], dtype=np.float64)
+                arr_close = np.array(df['close'], dtype=np.float64)
+                arr_volume = np.array(df['vol'], dtype=np.float64)
+                arr_amount = np.array(df['amount'], dtype=np.float64)
+            if len(arr_close) > 0:
+                arr_ret = np.empty(len(arr_close))
+                arr_ret[1:] = arr_close[1:] / arr_close[:-1] - 1.0
+                arr_ret[0] = arr_close[0] / arr_open[0] - 1.0
+                rets.append(arr_ret)
+                volumes.append(np.asarray(arr_volume, dtype=np.float64))
+                amounts.append(np.asarray(arr_amount, dtype=np.float64))
+            k += 1
+            if k >= ret_num:
+                break
+        min_mkts = {'ret': _concat_arrays(rets), 'volume': _concat_arrays(volumes), 'amount': _concat_arrays(amounts)}
+        return k >= ret_num, min_mkts
+
     # 个股股本结构数据静态变量
     utils_cap_struct = DataFrame()
+    # 股本结构数据的索引: 按(code, date)排序后各个股的数据起止行号{symbol: (start, end)}, 及变更日期数组
+    _cap_struct_slices = {}
+    _cap_struct_dates = None
+
+    @classmethod
+    def _load_cap_struct(cls):
+        """导入股本结构数据, 按(code, date)排序后建立各个股数据的起止行号索引"""
+        if cls.utils_cap_struct.shape[0] > 0:
+            return
+        cap_struct_path = os.path.join(ct.DB_PATH, ct.CAP_STRUCT, 'cap_struct.csv')
+        df_cap_struct = pd.read_csv(cap_struct_path, names=ct.CAP_STRUCT_HEADER, header=0)
+        df_cap_struct = df_cap_struct.sort_values(by=['code', 'date'], kind='mergesort').reset_index(drop=True)
+        arr_code = np.array(df_cap_struct['code'], dtype=str)
+        boundaries = np.flatnonzero(arr_code[1:] != arr_code[:-1]) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(arr_code)]))
+        cls._cap_struct_slices = {arr_code[start]: (start, end) for start, end in zip(starts, ends) if end > start}
+        cls._cap_struct_dates = np.array(df_cap_struct['date'], dtype=str)
+        cls.utils_cap_struct = df_cap_struct
 
     @classmethod
     def get_cap_struct(cls, code, date):
@@ -427,15 +832,43 @@ class Utils(object):
         code = cls.code_to_symbol(code)
         str_date = cls.datetimelike_to_str(cls.to_date(date))
         # 如果utils_cap_struct变量为空，那么先导入
-        if cls.utils_cap_struct.shape[0] == 0:
-            cap_struct_path = os.path.join(ct.DB_PATH, ct.CAP_STRUCT, 'cap_struct.csv')
-            cls.utils_cap_struct = pd.read_csv(cap_struct_path, names=ct.CAP_STRUCT_HEADER, header=0)
-        cap_struct = cls.utils_cap_struct[(cls.utils_cap_struct.code == code) & (cls.utils_cap_struct.date <= str_date)]
-        if cap_struct.shape[0] > 0:
-            return cap_struct.iloc[-1]
+        cls._load_cap_struct()
+        if code not in cls._cap_struct_slices:
+            return None
+        start, end = cls._cap_struct_slices[code]
+        k = start + np.searchsorted(cls._cap_struct_dates[start:end], str_date, side='right')
+        if k > start:
+            return cls.utils_cap_struct.iloc[k-1]
         else:
             return None
 
+    @classmethod
+    def get_cap_struct_panel(cls, codes, date):
+        """
+        读取一组个股指定日期最新的股本结构数据
+        Parameters:
+        --------
+        :param codes: list of str
+            股票代码列表，如600000或SH600000
+        :param date: datetime-like or str
+            日期
+        :return: pd.DataFrame
+            个股截止指定日期的最新股本结构数据，index为个股代码(如SH600000)，columns与get_cap_struct返回的数据一致
+            截止指定日期最新股本结构数据不存在的个股不包含在内
+        """
+        str_date = cls.datetimelike_to_str(cls.to_date(date))
+        cls._load_cap_struct()
+        symbols = [cls.code_to_symbol(code) for code in codes]
+        slices = np.array([cls._cap_struct_slices.get(symbol, (0, 0)) for symbol in symbols], dtype=np.int64).reshape((len(symbols), 2))
+        # 各个股变更日期不晚于指定日期的数据行数
+        accum_num = np.concatenate(([0], np.cumsum(cls._cap_struct_dates <= str_date)))
+        num = accum_num[slices[:, 1]] - accum_num[slices[:, 0]]
+        found = num > 0
+        rows = slices[found, 0] + num[found] - 1
+        df_cap_struct = cls.utils_cap_struct.iloc[rows]
+        df_cap_struct.index = [symbol for symbol, b in zip(symbols, found) if b]
+        return df_cap_struct
+
     @classmethod
     def get_fin_basic_data(cls, code, report_date):
         """
@@ -474,6 +907,10 @@ class Utils(object):
         date = cls.to_date(report_date)
         if not cls.is_fin_report_date(date):
             return None
+        # 优先从合并存储中读取财务数据
+        store = FinDataStore.get_store()
+        if store is not None and store.has_symbol(code):
+            return store.get_report(code, date)
         fin_basic_data_path = os.path.join(ct.DB_PATH, ct.FIN_BASIC_DATA_PATH, '%s.csv' % code)
         df_fin_basic_data = pd.read_csv(fin_basic_data_path, na_values='--', parse_dates=[0],
                                         names=ct.FIN_BASIC_DATA_HEADER, header=0)
@@ -508,6 +945,33 @@ class Utils(object):
         读取失败，返回None
         """
         code = cls.code_to_symbol(code)
+        date1, date2, date3 = cls.get_ttm_report_dates(date)
+        fin_basic_data1 = cls.get_fin_basic_data(code, date1)
+        if fin_basic_data1 is None:
+            return None
+        fin_basic_data2 = cls.get_fin_basic_data(code, date2)
+        if fin_basic_data2 is None:
+            return None
+        fin_basic_data3 = cls.get_fin_basic_data(code, date3)
+        if fin_basic_data3 is None:
+            return None
+        ttm_fin_basic_data = Series(dtype=object)
+        ttm_fin_basic_data['ReportDate'] = date1
+        for field in ct.FIN_BASIC_TTM_HEADER:
+            ttm_fin_basic_data[field] = fin_basic_data1[field] + fin_basic_data2[field] - fin_basic_data3[field]
+        return ttm_fin_basic_data
+
+    @classmethod
+    def get_ttm_report_dates(cls, date):
+        """
+        计算TTM财务数据所需的三个报告期
+        Parameters:
+        --------
+        :param date: datetime-like or str
+            日期，格式YYYY-MM-DD or YYYYMMDD
+        :return: tuple(datetime.datetime, datetime.datetime, datetime.datetime)
+            (最新报告期, 上年年报报告期, 上年同期报告期)，TTM值=最新报告期值+上年年报值-上年同期值
+        """
         date = cls.to_date(date)
         if date.month in (5, 6, 7, 8):
             date1 = datetime.datetime(date.year, 3, 31)
@@ -525,27 +989,45 @@ class Utils(object):
             date1 = datetime.datetime(date.year-1, 9, 30)
             date2 = datetime.datetime(date.year-2, 12, 31)
             date3 = datetime.datetime(date.year-2, 9, 30)
-        fin_basic_data1 = cls.get_fin_basic_data(code, date1)
-        if fin_basic_data1 is None:
-            return None
-        fin_basic_data2 = cls.get_fin_basic_data(code, date2)
-        if fin_basic_data2 is None:
-            return None
-        fin_basic_data3 = cls.get_fin_basic_data(code, date3)
-        if fin_basic_data3 is None:
-            return None
-        ttm_fin_basic_data = Series()
-        ttm_fin_basic_data['ReportDate'] = date1
-        ttm_fin_basic_data['MainOperateRevenue'] = fin_basic_data1['MainOperateRevenue'] + fin_basic_data2['MainOperateRevenue'] - fin_basic_data3['MainOperateRevenue']
-        ttm_fin_basic_data['MainOperateProfit'] = fin_basic_data1['MainOperateProfit'] + fin_basic_data2['MainOperateProfit'] - fin_basic_data3['MainOperateProfit']
-        ttm_fin_basic_data['OperateProfit'] = fin_basic_data1['OperateProfit'] + fin_basic_data2['OperateProfit'] - fin_basic_data3['OperateProfit']
-        ttm_fin_basic_data['InvestIncome'] = fin_basic_data1['InvestIncome'] + fin_basic_data2['InvestIncome'] - fin_basic_data3['InvestIncome']
-        ttm_fin_basic_data['NonOperateNetIncome'] = fin_basic_data1['NonOperateNetIncome'] + fin_basic_data2['NonOperateNetIncome'] - fin_basic_data3['NonOperateNetIncome']
-        ttm_fin_basic_data['TotalProfit'] = fin_basic_data1['TotalProfit'] + fin_basic_data2['TotalProfit'] - fin_basic_data3['TotalProfit']
-        ttm_fin_basic_data['NetProfit'] = fin_basic_data1['NetProfit'] + fin_basic_data2['NetProfit'] - fin_basic_data3['NetProfit']
-        ttm_fin_basic_data['DeductedNetProfit'] = fin_basic_data1['DeductedNetProfit'] + fin_basic_data2['DeductedNetProfit'] - fin_basic_data3['DeductedNetProfit']
-        ttm_fin_basic_data['NetOperateCashFlow'] = fin_basic_data1['NetOperateCashFlow'] + fin_basic_data2['NetOperateCashFlow'] - fin_basic_data3['NetOperateCashFlow']
-        return ttm_fin_basic_data
+        return date1, date2, date3
+
+    @classmethod
+    def get_fin_basic_data_panel(cls, codes, report_date, fields=None):
+        """
+        读取一组个股指定报告期的财务数据，财务数据只在进程内读取一次
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表，如600000或SH600000
+        :param report_date: datetime-like or str
+            报告期，格式：YYYY-MM-DD or YYYYMMDD
+        :param fields: list of str, 默认None
+            字段列表，为None时读取ct.FIN_BASIC_DATA_HEADER中除ReportDate外的全部字段
+        :return: pd.DataFrame
+            index为个股代码(如SH600000)，columns为fields，没有该报告期数据的个股不包含在内
+        """
+        symbols = [cls.code_to_symbol(code) for code in codes]
+        date = cls.to_date(report_date)
+        if not cls.is_fin_report_date(date):
+            return DataFrame(columns=fields or ct.FIN_BASIC_DATA_HEADER[1:], dtype=np.float64)
+        return FinDataStore.get_store(load_csv=True).get_report_panel(symbols, date, fields)
+
+    @classmethod
+    def get_ttm_fin_basic_data_panel(cls, codes, date):
+        """
+        计算一组个股最新的TTM财务数据，计算规则与get_ttm_fin_basic_data一致
+        Parameters:
+        --------
+        :param codes: list of str
+            个股代码列表，如600000或SH600000
+        :param date: datetime-like or str
+            日期，格式YYYY-MM-DD or YYYYMMDD
+        :return: pd.DataFrame
+            index为个股代码(如SH600000)，columns为ct.FIN_BASIC_TTM_HEADER，无法计算TTM值的个股不包含在内
+        """
+        symbols = [cls.code_to_symbol(code) for code in codes]
+        report_dates = cls.get_ttm_report_dates(date)
+        return FinDataStore.get_store(load_csv=True).get_ttm_panel(symbols, report_dates, ct.FIN_BASIC_TTM_HEADER)
 
     @classmethod
     def is_fin_report_date(cls, date):
@@ -693,10 +1175,8 @@ class Utils(object):
         """
         symbol = cls.code_to_symbol(code)
         str_date = cls.datetimelike_to_str(cls.to_date(trading_day), dash=True)
-        file_path = '%s.csv' % os.path.join(ct.DB_PATH, ct.MKT_DAILY_NOFQ, symbol)
-        df_daily_mkt = pd.read_csv(file_path, names=ct.MKT_DAILY_NOFQ_HEADER, header=0)
-        df_daily_mkt = df_daily_mkt[df_daily_mkt.date <= str_date].iloc[-2:]
-        if len(df_daily_mkt) > 0:
+        df_daily_mkt = cls.get_secu_daily_mkt(symbol, end=str_date, ndays=2, fq=False)
+        if df_daily_mkt is not None and len(df_daily_mkt) > 0:
             if df_daily_mkt.iloc[-1].date != str_date:
                 return SecuTradingStatus.Suspend
             else:
@@ -933,6 +1413,23 @@ class Utils(object):
                 return '%s.SZ' % code if code[:3] == '399' else '%s.SH' % code
 
 
+def _concat_arrays(arrays):
+    """拼接float64数组列表, 列表为空时返回空数组"""
+    if len(arrays) == 0:
+        return np.array([], dtype=np.float64)
+    return np.concatenate(arrays)
+
+
+def _to_datetime64(date_like):
+    """
+    把日期转换为np.datetime64[D]
+    :param date_like: datetime-like or str
+        日期, 格式YYYY-MM-DD or YYYYMMDD
+    :return: np.datetime64
+    """
+    return np.datetime64(Utils.to_date(date_like).strftime('%Y-%m-%d'), 'D')
+
+
 def _code_to_symbol(code):
     """
     生成本系统的证券代码symbol